@@ -56,6 +56,8 @@ import fwstats
 import fwutils
 from fwlog import Fwlog
 import loadsimulator
+from fwexporter import FwExporter
+from fwthreadpool import FwThreadPool
 
 # Global signal handler for clean exit
 def global_signal_handler(signum, frame):
@@ -78,7 +80,10 @@ class Fwagent:
     message, called request, invokes global message handler that routes
     the request to the appropriate request handler, takes response
     returned by the message handler and sends it back to the manager.
-    Only one request can be processed at any time.
+    Requests that modify device are processed one by one in order of receiving.
+    Read-only requests, like 'get-device-stats', are processed concurrently,
+    so they are not delayed by long configuration requests.
+    The replies are sent as soon as they are ready, tagged by the request 'seq'.
     The global message handler sits in the Fwglobals module.
 
     :param handle_sigterm: A flag to handle termination signal
@@ -90,9 +95,14 @@ class Fwagent:
         self.token                = None
         self.version              = fwutils.get_agent_version(fwglobals.g.VERSIONS_FILE)
         self.ws                   = None
-        self.thread_statistics    = None
+        self.task_keepalive       = None
+        self.task_statistics      = None
         self.should_reconnect     = False
         self.pending_msg_replies  = []
+        self.connected_ws         = None                         # Connection to send replies on, None if closed
+        self.send_lock            = threading.Lock()             # Serializes replies sent by request threads
+        self.readonly_pool        = FwThreadPool(4, 'ro-request')
+        self.request_pool         = FwThreadPool(1, 'request')   # Keeps modifying requests in order
 
         if handle_sigterm:
             signal.signal(signal.SIGTERM, self._sigterm_handler)
@@ -140,9 +150,11 @@ class Fwagent:
         # Close connection
         if self.ws:
             self.ws.close()
-        # Stop threads
-        if self.thread_statistics:
-            self.thread_statistics.join()
+        # Stop periodic tasks
+        self._stop_tasks()
+        # Wait for requests in progress
+        self.readonly_pool.finalize()
+        self.request_pool.finalize()
 
     def _mark_connection_failure(self, err):
         try:
@@ -392,9 +404,67 @@ class Fwagent:
         :returns: None.
         """
         fwglobals.log.info("connection to orchestrator is closed")
-        if self.thread_statistics:
-            self.isConnRunning = False
-            self.thread_statistics.join()
+        with self.send_lock:
+            self.connected_ws = None    # Replies to requests in progress will be sent on reconnect
+        self._stop_tasks()
+
+    def _keepalive(self, ws):
+        """Connection keep-alive task.
+        Every 30 seconds ensure that connection to management is alive.
+        Management should send 'get-device-stats' request every 10 sec.
+        Note the WebSocket Ping-Pong (see ping_interval=25, ping_timeout=20)
+        does not help in case of Proxy in the middle, as was observed in field
+
+        :param ws:  Websocket handler.
+
+        :returns: None.
+        """
+        if self.requestReceived:
+            self.requestReceived = False
+        else:
+            fwglobals.log.debug("connect: no request was received in 30 seconds, drop connection")
+            ws.close()
+            fwglobals.log.debug("connect: connection was terminated")
+
+    def _update_statistics(self):
+        """Statistics task. Every 30 seconds update statistics.
+
+        :returns: None.
+        """
+        if loadsimulator.g.enabled():
+            if loadsimulator.g.started:
+                loadsimulator.g.update_stats()
+            else:
+                fwglobals.g.scheduler.remove_task(self.task_statistics, wait=False)
+        else:
+            fwstats.update_stats()
+
+    def _start_tasks(self, ws):
+        """Start periodic tasks that serve connection to management.
+        The statistics might take time to collect, so it is run on worker thread.
+
+        :param ws:  Websocket handler.
+
+        :returns: None.
+        """
+        self._stop_tasks()
+        self.requestReceived = True
+        scheduler = fwglobals.g.scheduler
+        self.task_keepalive  = scheduler.add_task('keepalive', lambda: self._keepalive(ws), 30, delay=0, offload=True)
+        self.task_statistics = scheduler.add_task('statistics', self._update_statistics, 30, delay=0, offload=True)
+
+    def _stop_tasks(self):
+        """Stop periodic tasks that serve connection to management.
+
+        :returns: None.
+        """
+        scheduler = fwglobals.g.scheduler
+        if self.task_keepalive:
+            scheduler.remove_task(self.task_keepalive)
+            self.task_keepalive = None
+        if self.task_statistics:
+            scheduler.remove_task(self.task_statistics)
+            self.task_statistics = None
 
     def _on_open(self, ws):
         """Websocket connection open handler
@@ -411,46 +481,18 @@ class Fwagent:
         # Send pending message replies to the MGMT upon connection reopen.
         # These are replies to messages that might have cause the connection
         # to the MGMT to disconnect, and thus have to be sent on the new connection.
-        if len(self.pending_msg_replies) > 0:
-            fwglobals.log.info("_on_open: sending %d pending replies to orchestrator" % len(self.pending_msg_replies))
-            for reply in self.pending_msg_replies:
-                fwglobals.log.debug("_on_open: sending reply: " + json.dumps(reply))
-                ws.send(json.dumps(reply))
-
-            del self.pending_msg_replies[:]
-
-        def run(*args):
-            slept = 0
-            while self.isConnRunning:
-                # Every 30 seconds ensure that connection to management is alive.
-                # Management should send 'get-device-stats' request every 10 sec.
-                # Note the WebSocket Ping-Pong (see ping_interval=25, ping_timeout=20)
-                # does not help in case of Proxy in the middle, as was observed in field
-                if (slept % 30) == 0:
-                    if self.requestReceived:
-                        self.requestReceived = False
-                    else:
-                        fwglobals.log.debug("connect: no request was received in 30 seconds, drop connection")
-                        ws.close()
-                        fwglobals.log.debug("connect: connection was terminated")
-                        break
-                # Every 30 seconds update statistics
-                if (slept % 30) == 0:
-                    if loadsimulator.g.enabled():
-                        if loadsimulator.g.started:
-                            loadsimulator.g.update_stats()
-                        else:
-                            break
-                    else:
-                        fwstats.update_stats()
-                # Sleep 1 second and make another iteration
-                time.sleep(1)
-                slept += 1
+        with self.send_lock:
+            if len(self.pending_msg_replies) > 0:
+                fwglobals.log.info("_on_open: sending %d pending replies to orchestrator" % len(self.pending_msg_replies))
+                for reply in self.pending_msg_replies:
+                    data = json.dumps(reply)
+                    fwglobals.log.debug("_on_open: sending reply: %s", data)
+                    ws.send(data)
 
-        self.isConnRunning = True
-        self.requestReceived = True
-        self.thread_statistics = threading.Thread(target=run, name='Statistics Thread')
-        self.thread_statistics.start()
+                del self.pending_msg_replies[:]
+            self.connected_ws = ws
+
+        self._start_tasks(ws)
 
         if not fwutils.vpp_does_run():
             fwglobals.log.info("connect: router is not running, start it in orchestrator")
@@ -458,24 +500,43 @@ class Fwagent:
 
     def _on_message(self, ws, message):
         """Websocket received message handler.
-        This callbacks invokes global handler of the received request defined
+        This callbacks dispatches the received request to the worker thread,
+        so the websocket thread is free to receive the next request.
+        The read-only requests are handled concurrently. The rest of requests
+        are handled one by one in order of receiving.
+
+        :param ws:       Websocket handler.
+        :param message:  Message instance.
+
+        :returns: None.
+        """
+        pmsg = json.loads(message)
+        self.requestReceived = True     # Keep connection alive while long request is handled
+        if pmsg['msg']['message'] in fwglobals.readonly_requests:
+            self.readonly_pool.submit(self._handle_message, (ws, pmsg, message))
+        else:
+            self.request_pool.submit(self._handle_message, (ws, pmsg, message))
+
+    def _handle_message(self, ws, pmsg, message):
+        """Handle received message.
+        This function invokes global handler of the received request defined
         in the fwglobals.py module, gets back the response from the global
         handler and sends it back to the server. The global handler dispatches
         requests to appropriate request handlers. It is implemented
         in the fwglobals.py module.
 
         :param ws:       Websocket handler.
+        :param pmsg:     Parsed message.
         :param message:  Message instance.
 
         :returns: None.
         """
-        pmsg = json.loads(message)
         msg = pmsg['msg']
 
         reply = self.handle_received_request(msg)
 
-        fwglobals.log.debug(str(pmsg['seq']) + " request=" + message)
-        fwglobals.log.debug(str(pmsg['seq']) + " reply=" + json.dumps(reply))
+        fwglobals.log.debug("%s request=%s", pmsg['seq'], message)
+        fwglobals.log.debug(lambda: "%s reply=%s" % (pmsg['seq'], json.dumps(reply)))
 
         # Messages that change the interfaces might cause the existing connection to break
         # (for example, if the IP/mask has changed). Since sending the reply on a broken
@@ -483,15 +544,25 @@ class Fwagent:
         # when the new connection is opened, we send the reply to the MGMT right away.
         # We close the connection even if the request failed, as the change might have
         # taken place regardless of the request status, hence socket might not be operational.
-        self.should_reconnect = False if 'params' not in msg else msg['params'].get('reconnect', False)
-        if self.should_reconnect == True:
-            fwglobals.log.info("_on_message: device changed, closing connection to orchestrator")
-            self.pending_msg_replies.append({'seq':pmsg['seq'], 'msg':reply})
-            self.connection_error_code = fwglobals.g.WS_STATUS_DEVICE_CHANGE
-            self.connection_error_msg = 'device change'
-            ws.close()
-        else:
-            ws.send(json.dumps({'seq':pmsg['seq'], 'msg':reply}))
+        with self.send_lock:
+            self.should_reconnect = False if 'params' not in msg else msg['params'].get('reconnect', False)
+            if self.should_reconnect == True:
+                fwglobals.log.info("_handle_message: device changed, closing connection to orchestrator")
+                self.pending_msg_replies.append({'seq':pmsg['seq'], 'msg':reply})
+                self.connection_error_code = fwglobals.g.WS_STATUS_DEVICE_CHANGE
+                self.connection_error_msg = 'device change'
+                ws.close()
+            elif not self.connected_ws:
+                # The connection was closed while request was handled,
+                # so send the reply when the new connection is opened.
+                fwglobals.log.info("_handle_message: no connection, postpone reply %s" % str(pmsg['seq']))
+                self.pending_msg_replies.append({'seq':pmsg['seq'], 'msg':reply})
+            else:
+                try:
+                    self.connected_ws.send(json.dumps({'seq':pmsg['seq'], 'msg':reply}))
+                except Exception as e:
+                    fwglobals.log.error("_handle_message: failed to send reply %s, postpone it: %s" % (str(pmsg['seq']), str(e)))
+                    self.pending_msg_replies.append({'seq':pmsg['seq'], 'msg':reply})
 
     def disconnect(self):
         """Shutdowns the WebSocket connection.
@@ -512,7 +583,7 @@ class Fwagent:
 
         :returns: None.
         """
-        print_message = fwglobals.g.cfg.DEBUG
+        print_message = fwglobals.g.cfg.DEBUG and fwglobals.log.is_enabled(Fwlog.FWLOG_LEVEL_DEBUG)
         print_message = False if msg['message'] == 'get-device-stats' else print_message
         if print_message:
             fwglobals.log.debug("handle_received_request:request\n" + json.dumps(msg, sort_keys=True, indent=4))
@@ -650,7 +721,7 @@ def start(start_router):
     daemon_rpc('start', start_vpp=start_router) # if daemon runs, start connection loop and router if required
     fwglobals.log.info("done")
 
-def show(agent_info, router_info):
+def show(agent_info, router_info, metrics=False):
     """Handles 'fwagent show' command.
     This commands prints various information about device and it's components,
     like router configuration, software version, etc.
@@ -658,6 +729,7 @@ def show(agent_info, router_info):
 
     :param agent_info:   Agent information.
     :param router_info:  Router information.
+    :param metrics:      Print latency metrics of the running agent.
 
     :returns: None.
     """
@@ -671,6 +743,30 @@ def show(agent_info, router_info):
             fwutils.print_router_config()
         elif router_info == 'request_db':
             fwutils.print_router_config(full=True)
+    if metrics:
+        show_metrics()
+
+def show_metrics():
+    """Print latency metrics collected by the agent daemon.
+
+    :returns: None.
+    """
+    metrics = daemon_rpc('get_metrics')
+    if metrics is None:
+        fwglobals.log.error("failed to get metrics, ensure the agent daemon runs")
+        return
+    print("metrics since %s, spawned processes: %d" %
+          (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(metrics['since'])), metrics['spawns']))
+    for category in ['requests', 'commands', 'substitutions']:
+        entries = metrics.get(category, {})
+        if not entries:
+            continue
+        print("\n%-40s %8s %10s %10s %10s %10s %8s" % (category, 'count', 'avg_ms', 'p90_ms', 'p99_ms', 'max_ms',
+                                                       'spawns' if category == 'requests' else ''))
+        for name in sorted(entries, key=lambda n: -entries[n]['count'] * entries[n]['avg_ms']):
+            e = entries[name]
+            print("%-40s %8d %10.2f %10.2f %10.2f %10.2f %8s" % (name, e['count'], e['avg_ms'], e['p90_ms'],
+                                                                 e['p99_ms'], e['max_ms'], str(e.get('spawns', ''))))
 
 @Pyro4.expose
 class FwagentDaemon(object):
@@ -754,6 +850,8 @@ class FwagentDaemon(object):
 
         # Reload configuration.
         fwglobals.g.load_configuration_from_file()
+        # Reload request DB, as it might be modified by 'fwagent reset --soft'.
+        fwglobals.g.router_api.db_requests.reload()
 
         # Ensure system compatibility with our soft
         if check_system and fwglobals.g.router_api.router_started:
@@ -804,6 +902,13 @@ class FwagentDaemon(object):
             self.thread_main = None
         fwglobals.log.debug("FwagentDaemon: stopped")
 
+    def get_metrics(self):
+        """Get latency metrics of agent. Used by 'fwagent show --metrics'.
+
+        :returns: Dictionary with metrics.
+        """
+        return fwglobals.g.handle_request('get-agent-metrics')['message']
+
     def reset(self):
         """Restart the main daemon loop.
 
@@ -901,15 +1006,29 @@ def daemon():
         # and we need to get to Pyro4.Daemon.serveSimple() call to run rpc loop.
         agent_daemon.start()
 
+        # Start Prometheus exporter if it was configured
+        exporter = None
+        if fwglobals.g.cfg.EXPORTER_PORT:
+            try:
+                exporter = FwExporter(fwglobals.g.cfg.EXPORTER_HOST, fwglobals.g.cfg.EXPORTER_PORT)
+                exporter.start()
+            except Exception as e:
+                fwglobals.log.excep("failed to start exporter: %s" % str(e))
+                exporter = None
+
         # Register FwagentDaemon object with Pyro framework and start Pyro request loop:
         # listen for rpc that invoke FwagentDaemon methods
         fwglobals.log.debug("FwagentDaemon is going to listen on " + fwglobals.g.FWAGENT_DAEMON_URI)
-        Pyro4.Daemon.serveSimple(
-            {agent_daemon: fwglobals.g.FWAGENT_DAEMON_NAME},
-            host=fwglobals.g.FWAGENT_DAEMON_HOST,
-            port=fwglobals.g.FWAGENT_DAEMON_PORT,
-            ns=False,
-            verbose=True)
+        try:
+            Pyro4.Daemon.serveSimple(
+                {agent_daemon: fwglobals.g.FWAGENT_DAEMON_NAME},
+                host=fwglobals.g.FWAGENT_DAEMON_HOST,
+                port=fwglobals.g.FWAGENT_DAEMON_PORT,
+                ns=False,
+                verbose=True)
+        finally:
+            if exporter:
+                exporter.stop()
 
 def daemon_rpc(func, **kwargs):
     """Wrapper for methods of the FwagentDaemon object that runs on background
@@ -925,7 +1044,7 @@ def daemon_rpc(func, **kwargs):
     try:
         agent_daemon = Pyro4.Proxy(fwglobals.g.FWAGENT_DAEMON_URI)
         remote_func = getattr(agent_daemon, func)
-        fwglobals.log.debug("invoke remote FwagentDaemon::%s(%s)" % (func, json.dumps(kwargs)))
+        fwglobals.log.debug(lambda: "invoke remote FwagentDaemon::%s(%s)" % (func, json.dumps(kwargs)))
         return remote_func(**kwargs)
     except Pyro4.errors.CommunicationError:
         return None
@@ -1000,7 +1119,8 @@ if __name__ == '__main__':
                     'simulate': lambda args: loadsimulator.g.simulate(count=args.count),
                     'show': lambda args: show(
                         agent_info=args.agent,
-                        router_info=args.router),
+                        router_info=args.router,
+                        metrics=args.metrics),
                     'cli': lambda args: cli(
                         script_fname=args.script_fname,
                         clean_request_db=args.clean,
@@ -1037,6 +1157,8 @@ if __name__ == '__main__':
                         help="show various router parameters")
     parser_show.add_argument('--agent', choices=['version'],
                         help="show various agent parameters")
+    parser_show.add_argument('--metrics', action='store_true',
+                        help="show latency of requests, commands and substitutions")
     parser_cli = subparsers.add_parser('cli', help='runs agent in CLI mode: read orchestrator requests from command line')
     parser_cli.add_argument('-f', '--script_file', dest='script_fname',
                         help="File with requests to be executed")
@@ -26,12 +26,14 @@ import sys
 import os
 from shutil import copyfile
 import fwglobals
+import fwmetrics
 import fwstats
 import fwutils
 
 fwagent_api = {
     'get-device-info':      '_get_device_info',
     'get-device-stats':     '_get_device_stats',
+    'get-agent-metrics':    '_get_agent_metrics',
     'get-device-logs':      '_get_device_logs',
     'get-device-os-routes': '_get_device_os_routes',
     'handle-request':       '_handle_request',
@@ -98,9 +100,23 @@ class FWAGENT_API:
 
         :returns: Dictionary with statistics.
         """
-        reply = fwstats.get_stats()
+        reply = fwstats.get_stats(params)
         return reply
 
+    def _get_agent_metrics(self, params):
+        """Get latency metrics of requests, commands and substitutions,
+        and number of spawned processes.
+
+        :param params: Parameters from flexiManage:
+                       'reset' - if True, reset metrics after they were fetched.
+
+        :returns: Dictionary with metrics and status code.
+        """
+        metrics = fwmetrics.get_metrics()
+        if params and params.get('reset'):
+            fwmetrics.reset()
+        return {'message': metrics, 'ok': 1}
+
     def _upgrade_device_sw(self, params):
         """Upgrade device SW.
 
@@ -129,12 +145,20 @@ class FWAGENT_API:
     def _get_device_logs(self, params):
         """Get device logs.
 
-        :param params: Parameters from flexiManage.
+        :param params: Parameters from flexiManage:
+                       'lines'  - number of lines to return,
+                       'level'  - optional minimal severity level: 'excep', 'error', 'warning', 'info' or 'debug',
+                       'since'  - optional start of time range in epoch seconds,
+                       'until'  - optional end of time range in epoch seconds,
+                       'filter' - optional substring that lines should include.
 
         :returns: Dictionary with logs and status code.
         """
         try:
-            logs = fwutils.get_device_logs(fwglobals.g.ROUTER_LOG_FILE, params['lines'])
+            logs = fwutils.get_device_logs(fwglobals.g.ROUTER_LOG_FILE, params['lines'],
+                                           level=params.get('level'), since=params.get('since'),
+                                           until=params.get('until'), substring=params.get('filter'),
+                                           records=fwglobals.log.get_records())
             return {'message': logs, 'ok': 1}
         except:
             raise Exception("_get_device_logs: failed to get device logs: %s" % format(sys.exc_info()[1]))
@@ -20,24 +20,70 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 ################################################################################
 
-import os
-import re
-import yaml
+import contextlib
+import copy
+import sqlite3
+import threading
 
-from sqlitedict import SqliteDict
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 import fwglobals
 
 class FwDbRequests:
     """This is requests DB class representation.
+    The requests are stored in SQLite table, where every row keeps one request.
+    Besides the request name, parameters and translated commands the row keeps
+    few fields of parameters in indexed columns, so requests can be fetched
+    by type, e.g. all 'add-tunnel'-s, and by these fields, e.g. tunnels by
+    source IP, without deserialization of all entries in DB:
+        pci - PCI address of interface ('pci' or 'interface' parameter)
+        src - source IP address of tunnel
+        via - next hop of route
+    Every write is committed immediately, unless it is done within transaction,
+    see transaction() for details.
+    If cache is requested, the whole table is loaded into memory on creation
+    and all reads are served out of memory. Writes go into both the memory
+    and the table. The fetched objects are copies, so callers can modify them.
+    The memory-resident mirror keeps indexes of the pci, src and via fields
+    as well, so filtered fetches don't scan the whole mirror.
 
     :param db_file: SQLite DB file name.
+    :param cache:   If True, keep memory-resident mirror of DB.
     """
-    def __init__(self, db_file):
+    def __init__(self, db_file, cache=False):
         """Constructor method
         """
         self.db_filename = db_file
-        self.db = SqliteDict(db_file, autocommit=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS requests (
+                               key      TEXT PRIMARY KEY,
+                               request  TEXT NOT NULL,
+                               pci      TEXT,
+                               src      TEXT,
+                               via      TEXT,
+                               params   BLOB,
+                               cmd_list BLOB,
+                               executed INTEGER)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS requests_request ON requests (request)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS requests_pci ON requests (request, pci)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS requests_src ON requests (request, src)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS requests_via ON requests (request, via)")
+        self.cache = None
+        self.cache_index = None             # {'pci'|'src'|'via' : {value : set of keys}}
+        self.cache_seq   = 0                # Order of the last entry stored in cache
+        self.transaction_depth  = 0
+        self.transaction_failed = False
+        self.transaction_owner  = None      # Thread that runs transaction
+        self.transaction_done   = threading.Condition(self.lock)
+        self._migrate_sqlitedict()
+        if cache:
+            self._load_cache()
 
     def __enter__(self):
         return self
@@ -52,15 +98,148 @@ class FwDbRequests:
     def finalize(self):
         """Destructor method
         """
-        self.db.close()
+        with self.lock:
+            self.db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group DB writes into one transaction. The transaction is committed
+        once on exit of the outermost 'with' block. If exception is raised out
+        of any of the nested blocks, all writes done since the outermost block
+        was entered are rolled back, including the memory-resident mirror.
+        The transaction belongs to the thread that opened it: writes of other
+        threads and their transactions wait until it is finished, so they are
+        neither committed nor rolled back together with it.
+        Usage:
+            with db_requests.transaction():
+                db_requests.add(...)
+                db_requests.remove(...)
+        """
+        with self.lock:
+            self._wait_for_transaction()
+            if self.transaction_depth == 0:
+                self.transaction_owner = threading.current_thread()
+                self.db.execute("BEGIN")
+                self.transaction_failed = False
+                # Entries are replaced and not modified in place, so shallow copy is enough
+                self.cache_snapshot = OrderedDict(self.cache) if self.cache is not None else None
+            self.transaction_depth += 1
+        try:
+            yield
+        except:
+            self.transaction_failed = True
+            raise
+        finally:
+            with self.lock:
+                self.transaction_depth -= 1
+                if self.transaction_depth == 0:
+                    if self.transaction_failed:
+                        fwglobals.log.debug("FwDbRequests: rollback transaction")
+                        self.db.execute("ROLLBACK")
+                        if self.cache is not None:
+                            self.cache = self.cache_snapshot
+                            self._build_cache_index()
+                    else:
+                        self.db.execute("COMMIT")
+                    self.cache_snapshot = None
+                    self.transaction_owner = None
+                    self.transaction_done.notify_all()
+
+    def _wait_for_transaction(self):
+        """Wait until transaction opened by other thread is finished.
+        Should be called with the lock held.
+        """
+        me = threading.current_thread()
+        while self.transaction_owner and self.transaction_owner != me:
+            self.transaction_done.wait()
+
+    def _migrate_sqlitedict(self):
+        """Move requests stored by previous versions of agent into table
+        of this class. Previous versions used SqliteDict that keeps pickled
+        dictionaries in the 'unnamed' table.
+        """
+        with self.lock:
+            found = self.db.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='unnamed'").fetchone()
+            if not found:
+                return
+            fwglobals.log.info("FwDbRequests: migrate %s to indexed table" % self.db_filename)
+            self.db.execute("BEGIN")
+            try:
+                for (key, value) in self.db.execute("SELECT key, value FROM unnamed ORDER BY rowid").fetchall():
+                    entry = pickle.loads(bytes(value))
+                    self._store(key, entry['request'], entry['params'], entry['cmd_list'], entry['executed'])
+                self.db.execute("DROP TABLE unnamed")
+                self.db.execute("COMMIT")
+            except Exception as e:
+                self.db.execute("ROLLBACK")
+                fwglobals.log.excep("FwDbRequests: failed to migrate %s: %s" % (self.db_filename, str(e)))
+                raise e
+
+    def _load_cache(self):
+        """Load all entries of table into memory and index them.
+        The entries are kept in order they were stored.
+        """
+        cache = OrderedDict()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT key, request, pci, src, via, params, cmd_list, executed FROM requests ORDER BY rowid").fetchall()
+        for (key, req, pci, src, via, params, cmd_list, executed) in rows:
+            self.cache_seq += 1
+            cache[key] = { 'request' : req, 'pci' : pci, 'src' : src, 'via' : via,
+                           'params'  : pickle.loads(bytes(params)),
+                           'cmd_list': pickle.loads(bytes(cmd_list)),
+                           'executed': bool(executed),
+                           'seq'     : self.cache_seq }
+        self.cache = cache
+        self._build_cache_index()
+
+    def _build_cache_index(self):
+        """Build indexes of the pci, src and via fields of cached entries.
+        """
+        self.cache_index = { 'pci' : {}, 'src' : {}, 'via' : {} }
+        for (key, entry) in self.cache.items():
+            self._index_cache_entry(key, entry)
+
+    def _index_cache_entry(self, key, entry):
+        """Add cached entry to indexes of the pci, src and via fields.
+        """
+        for (column, index) in self.cache_index.items():
+            if entry[column] is not None:
+                index.setdefault(entry[column], set()).add(key)
+
+    def _unindex_cache_entry(self, key, entry):
+        """Remove cached entry from indexes of the pci, src and via fields.
+        """
+        for (column, index) in self.cache_index.items():
+            keys = index.get(entry[column])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[entry[column]]
+
+    def reload(self):
+        """Reload memory-resident mirror of DB out of the table.
+        It is needed if the DB file was modified by other process, e.g. by 'fwagent reset --soft'.
+
+        :returns: None.
+        """
+        with self.lock:
+            self._wait_for_transaction()
+            if self.cache is not None:
+                self._load_cache()
 
     def clean(self):
         """Clean DB
 
         :returns: None.
         """
-        for key in self.db:
-            self.remove(key)
+        with self.lock:
+            self._wait_for_transaction()
+            self.db.execute("DELETE FROM requests")
+            if self.cache is not None:
+                self.cache.clear()
+                self._build_cache_index()
 
     def add(self, key, req, params, cmd_list, executed):
         """Add key-value into DB.
@@ -82,7 +261,13 @@ class FwDbRequests:
 
         :returns: None.
         """
-        del self.db[key]
+        with self.lock:
+            self._wait_for_transaction()
+            cursor = self.db.execute("DELETE FROM requests WHERE key=?", (key,))
+            if cursor.rowcount == 0:
+                raise KeyError(key)
+            if self.cache is not None:
+                self._unindex_cache_entry(key, self.cache.pop(key))
 
     def update(self, key, req, params, cmd_list, executed):
         """Update entry in DB.
@@ -95,7 +280,38 @@ class FwDbRequests:
 
         :returns: None.
         """
-        self.db[key] = { 'request' : req , 'params' : params , 'cmd_list' : cmd_list , 'executed' : executed } 
+        with self.lock:
+            self._wait_for_transaction()
+            self._store(key, req, params, cmd_list, executed)
+
+    def _store(self, key, req, params, cmd_list, executed):
+        """Write entry into table. The indexed columns are filled out of parameters.
+        """
+        pci = src = via = None
+        if isinstance(params, dict):
+            pci = params.get('pci', params.get('interface'))
+            src = params.get('src')
+            via = params.get('via')
+        params_blob   = pickle.dumps(params, pickle.HIGHEST_PROTOCOL)
+        cmd_list_blob = pickle.dumps(cmd_list, pickle.HIGHEST_PROTOCOL)
+        self.db.execute(
+            "INSERT OR REPLACE INTO requests (key, request, pci, src, via, params, cmd_list, executed) " \
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, req, pci, src, via,
+             sqlite3.Binary(params_blob), sqlite3.Binary(cmd_list_blob), 1 if executed else 0))
+        if self.cache is not None:
+            # Re-insert to keep order of rows. Store unpickled copies,
+            # so further changes of the caller objects don't affect cache.
+            old_entry = self.cache.pop(key, None)
+            if old_entry:
+                self._unindex_cache_entry(key, old_entry)
+            self.cache_seq += 1
+            self.cache[key] = { 'request' : req, 'pci' : pci, 'src' : src, 'via' : via,
+                                'params'  : pickle.loads(params_blob),
+                                'cmd_list': pickle.loads(cmd_list_blob),
+                                'executed': bool(executed),
+                                'seq'     : self.cache_seq }
+            self._index_cache_entry(key, self.cache[key])
 
     def fetch_request(self, key):
         """Fetch request from DB.
@@ -104,11 +320,16 @@ class FwDbRequests:
 
         :returns: Request and its parameters.
         """
-        if not key in self.db:
-            return (None, None) 
-        request = self.db[key].get('request')
-        params  = self.db[key].get('params')
-        return (request, params)
+        with self.lock:
+            if self.cache is not None:
+                entry = self.cache.get(key)
+                if not entry:
+                    return (None, None)
+                return (entry['request'], copy.deepcopy(entry['params']))
+            row = self.db.execute("SELECT request, params FROM requests WHERE key=?", (key,)).fetchone()
+        if not row:
+            return (None, None)
+        return (row[0], pickle.loads(bytes(row[1])))
 
     def fetch_cmd_list(self, key):
         """Fetch commands from DB.
@@ -117,9 +338,14 @@ class FwDbRequests:
 
         :returns: Commands and executed flag.
         """
-        cmd_list = self.db[key].get('cmd_list')
-        executed = self.db[key]['executed']
-        return (cmd_list , executed) 
+        with self.lock:
+            if self.cache is not None:
+                entry = self.cache[key]
+                return (copy.deepcopy(entry['cmd_list']), entry['executed'])
+            row = self.db.execute("SELECT cmd_list, executed FROM requests WHERE key=?", (key,)).fetchone()
+        if not row:
+            raise KeyError(key)
+        return (pickle.loads(bytes(row[0])), bool(row[1]))
 
     def exists(self, key):
         """Check if entry exists in DB.
@@ -128,5 +354,56 @@ class FwDbRequests:
 
         :returns: 'True' if entry exists and 'False' otherwise.
         """
-        res = True if key in self.db else False  
-        return res
+        with self.lock:
+            if self.cache is not None:
+                return key in self.cache
+            row = self.db.execute("SELECT 1 FROM requests WHERE key=?", (key,)).fetchone()
+        return True if row else False
+
+    def fetch_keys(self, req=None):
+        """Fetch keys of requests in order they were stored.
+
+        :param req:           Request type, e.g. 'add-tunnel'. If not provided, keys of all requests are returned.
+
+        :returns: List of keys.
+        """
+        with self.lock:
+            if self.cache is not None:
+                return [key for (key, entry) in self.cache.items() if not req or entry['request'] == req]
+            if req:
+                rows = self.db.execute("SELECT key FROM requests WHERE request=? ORDER BY rowid", (req,)).fetchall()
+            else:
+                rows = self.db.execute("SELECT key FROM requests ORDER BY rowid").fetchall()
+        return [row[0] for row in rows]
+
+    def fetch_requests(self, req, pci=None, src=None, via=None):
+        """Fetch requests of provided type in order they were stored.
+        The requests can be filtered by indexed fields of parameters.
+
+        :param req:           Request type, e.g. 'add-tunnel'.
+        :param pci:           PCI address of interface.
+        :param src:           Source IP of tunnel.
+        :param via:           Next hop of route.
+
+        :returns: List of (key, params) tuples.
+        """
+        filters = [(column, value) for (column, value) in [('pci', pci), ('src', src), ('via', via)] if value is not None]
+        with self.lock:
+            if self.cache is not None:
+                if not filters:
+                    return [(key, copy.deepcopy(entry['params'])) for (key, entry) in self.cache.items()
+                            if entry['request'] == req]
+                keys = None
+                for (column, value) in filters:
+                    found = self.cache_index[column].get(value, set())
+                    keys  = found if keys is None else keys & found
+                entries = sorted([(self.cache[key]['seq'], key) for key in keys if self.cache[key]['request'] == req])
+                return [(key, copy.deepcopy(self.cache[key]['params'])) for (_, key) in entries]
+            query = "SELECT key, params FROM requests WHERE request=?"
+            args  = [req]
+            for (column, value) in filters:
+                query += " AND %s=?" % column
+                args.append(value)
+            query += " ORDER BY rowid"
+            rows = self.db.execute(query, args).fetchall()
+        return [(row[0], pickle.loads(bytes(row[1]))) for row in rows]
@@ -0,0 +1,195 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import threading
+
+# Try with PY3 else, use PY2
+try:
+    from http import server as hsvr
+except ImportError:
+    import BaseHTTPServer as hsvr
+
+import fwglobals
+import fwmetrics
+import fwstats
+import fwtunnel_stats
+
+class FwExporter:
+    """This is Prometheus exporter class representation.
+    It serves agent metrics over HTTP in Prometheus text exposition format:
+    interface counters and rates, tunnel RTT, drop rate and status,
+    watchdog counters and latency histograms of requests, commands and
+    substitutions. The page is rendered periodically by scheduler task,
+    so scrapes are served out of the precomputed snapshot and never wait
+    for agent locks or block request handling.
+
+    :param host:     Address to listen on.
+    :param port:     Port to listen on.
+    :param period:   Period of snapshot rendering in seconds.
+    """
+    def __init__(self, host, port, period=10):
+        """Constructor method
+        """
+        self.host     = host
+        self.port     = port
+        self.period   = period
+        self.snapshot = ''
+        self.server   = None
+        self.thread   = None
+        self.task     = None
+
+    def start(self):
+        """Start HTTP server and snapshot rendering.
+
+        :returns: None.
+        """
+        exporter = self
+        class Handler(hsvr.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                data = exporter.snapshot
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def log_message(self, format, *args):
+                pass    # Don't print every scrape to stderr
+
+        self._render()
+        self.server = hsvr.HTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='Exporter Thread')
+        self.thread.daemon = True
+        self.thread.start()
+        self.task = fwglobals.g.scheduler.add_task('exporter', self._render, self.period, offload=True)
+        fwglobals.log.info("FwExporter: serving metrics on http://%s:%d/metrics" % (self.host, self.port))
+
+    def stop(self):
+        """Stop HTTP server and snapshot rendering.
+
+        :returns: None.
+        """
+        if self.task:
+            fwglobals.g.scheduler.remove_task(self.task)
+            self.task = None
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def _render(self):
+        """Render metrics into snapshot.
+        """
+        lines = []
+        self._render_router(lines)
+        self._render_interfaces(lines)
+        self._render_tunnels(lines)
+        self._render_histograms(lines)
+        self.snapshot = '\n'.join(lines) + '\n'    # Replace snapshot atomically
+
+    def _metric(self, lines, name, mtype, help, samples):
+        """Render metric family.
+
+        :param lines:    List to append lines to.
+        :param name:     Name of metric.
+        :param mtype:    Type of metric: 'gauge', 'counter' or 'histogram'.
+        :param help:     Description of metric.
+        :param samples:  List of (suffix, labels, value) tuples.
+        """
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, mtype))
+        for (suffix, labels, value) in samples:
+            if labels:
+                labels_str = ','.join(['%s="%s"' % (k, self._escape(v)) for (k, v) in labels])
+                lines.append('%s%s{%s} %s' % (name, suffix, labels_str, repr(float(value))))
+            else:
+                lines.append('%s%s %s' % (name, suffix, repr(float(value))))
+
+    def _escape(self, value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _render_router(self, lines):
+        stats = fwstats.stats
+        self._metric(lines, 'flexiwan_router_running', 'gauge', 'Router (VPP) runs',
+                     [('', [], 1 if stats.get('running') else 0)])
+        router_api = fwglobals.g.router_api
+        self._metric(lines, 'flexiwan_watchdog_vpp_down_total', 'counter', 'Number of times watchdog found VPP down',
+                     [('', [], router_api.watchdog_stats['vpp_down'])])
+        self._metric(lines, 'flexiwan_watchdog_restores_total', 'counter', 'Number of VPP restores by watchdog',
+                     [('', [], router_api.watchdog_stats['restores'])])
+
+    def _render_interfaces(self, lines):
+        stats = fwstats.stats
+        last  = stats.get('last', {})
+        for field in ['rx_bytes', 'rx_pkts', 'tx_bytes', 'tx_pkts', 'drops', 'rx_errors', 'tx_errors']:
+            samples = [('', [('interface', intf)], counters[field])
+                       for (intf, counters) in last.items() if field in counters]
+            if samples:
+                self._metric(lines, 'flexiwan_interface_%s_total' % field, 'counter',
+                             'Interface %s counter' % field.replace('_', ' '), samples)
+
+        period = stats.get('period')
+        rates  = stats.get('bytes', {})
+        for field in ['rx_bytes', 'rx_pkts', 'tx_bytes', 'tx_pkts']:
+            samples = [('', [('interface', intf)], values[field] / period)
+                       for (intf, values) in rates.items() if period]
+            if samples:
+                self._metric(lines, 'flexiwan_interface_%s_per_second' % field, 'gauge',
+                             'Interface %s rate during the last statistics period' % field.replace('_', ' '), samples)
+
+    def _render_tunnels(self, lines):
+        tunnels = fwtunnel_stats.tunnel_stats_get()
+        if not tunnels:
+            return
+        self._metric(lines, 'flexiwan_tunnel_up', 'gauge', 'Tunnel is up',
+                     [('', [('tunnel', t)], 1 if s['status'] == 'up' else 0) for (t, s) in tunnels.items()])
+        self._metric(lines, 'flexiwan_tunnel_rtt_milliseconds', 'gauge', 'Tunnel round trip time',
+                     [('', [('tunnel', t)], s['rtt']) for (t, s) in tunnels.items()])
+        self._metric(lines, 'flexiwan_tunnel_drop_rate', 'gauge', 'Tunnel drop rate in percents',
+                     [('', [('tunnel', t)], s['drop_rate']) for (t, s) in tunnels.items()])
+
+    def _render_histograms(self, lines):
+        (histograms, spawns) = fwmetrics.get_histograms()
+        labels = {'requests': 'request', 'commands': 'command', 'substitutions': 'function'}
+        for (category, hists) in histograms.items():
+            if not hists:
+                continue
+            samples = []
+            for (name, buckets, total_ms, count) in hists:
+                label = (labels[category], name)
+                cumulative = 0
+                for (bound, n) in zip(fwmetrics.BUCKETS_MS, buckets):
+                    cumulative += n
+                    samples.append(('_bucket', [label, ('le', repr(bound / 1000.0))], cumulative))
+                samples.append(('_bucket', [label, ('le', '+Inf')], count))
+                samples.append(('_sum', [label], total_ms / 1000.0))
+                samples.append(('_count', [label], count))
+            self._metric(lines, 'flexiwan_agent_%s_duration_seconds' % category[:-1], 'histogram',
+                         'Latency of agent %s' % category, samples)
+        self._metric(lines, 'flexiwan_agent_spawned_processes_total', 'counter', 'Number of processes spawned by agent',
+                     [('', [], spawns.get('total', 0))])
+        self._metric(lines, 'flexiwan_agent_request_spawned_processes_total', 'counter',
+                     'Number of processes spawned by agent per request',
+                     [('', [('request', r)], n) for (r, n) in spawns.items() if r != 'total'])
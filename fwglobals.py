@@ -27,10 +27,17 @@ import re
 import traceback
 import yaml
 
+from fwlog import Fwlog
+
+# Log of messages printed before initialize(), e.g. on import of modules
+log = Fwlog()
+
 from fwrouter_api import FWROUTER_API
 from fwagent_api import FWAGENT_API
 from os_api import OS_API
-from fwlog import Fwlog
+import fwmetrics
+from fwscheduler import FwScheduler
+from fwvpp_monitor import FwVppMonitor
 
 modules = {
     'fwagent_api':  __import__('fwagent_api'),
@@ -52,6 +59,7 @@ request_handlers = {
     'handle-request':               '_call_agent_api',
     'get-device-info':              '_call_agent_api',
     'get-device-stats':             '_call_agent_api',
+    'get-agent-metrics':            '_call_agent_api',
     'get-device-logs':              '_call_agent_api',
     'get-device-os-routes':         '_call_agent_api',
     'get-router-config':            '_call_agent_api',
@@ -68,6 +76,7 @@ request_handlers = {
     'add-tunnel':                   '_call_router_api',
     'remove-tunnel':                '_call_router_api',
     'modify-device':                '_call_router_api',
+    'sync-device':                  '_call_router_api',
     'add-dhcp-config':              '_call_router_api',
     'remove-dhcp-config':           '_call_router_api',
 
@@ -126,6 +135,17 @@ request_handlers = {
     'python':                       '_call_python_api'
 }
 
+# Requests that don't change configuration of device.
+# They are handled concurrently with each other and with the rest of requests.
+readonly_requests = [
+    'get-device-info',
+    'get-device-stats',
+    'get-agent-metrics',
+    'get-device-logs',
+    'get-device-os-routes',
+    'get-router-config',
+]
+
 global g_initialized
 g_initialized = False
 
@@ -149,6 +169,9 @@ class Fwglobals:
             DEFAULT_MANAGEMENT_URL = 'https://app.flexiwan.com:443'
             DEFAULT_TOKEN_FILE     = data_path + 'token.txt'
             DEFAULT_UUID           = None
+            DEFAULT_STATS_HISTORY_SIZE = 120    # 1 hour of 30 seconds updates
+            DEFAULT_EXPORTER_PORT  = None       # Prometheus exporter is disabled by default
+            DEFAULT_EXPORTER_HOST  = '127.0.0.1'
             try:
                 with open(filename, 'r') as conf_file:
                     conf = yaml.load(conf_file, Loader=yaml.SafeLoader)
@@ -158,6 +181,10 @@ class Fwglobals:
                 self.MANAGEMENT_URL = agent_conf.get('server', DEFAULT_MANAGEMENT_URL)
                 self.TOKEN_FILE     = agent_conf.get('token',  DEFAULT_TOKEN_FILE)
                 self.UUID           = agent_conf.get('uuid',   DEFAULT_UUID)
+                self.STATS_HISTORY_SIZE = agent_conf.get('stats_history', DEFAULT_STATS_HISTORY_SIZE)
+                exporter_conf = agent_conf.get('exporter', {})
+                self.EXPORTER_PORT  = exporter_conf.get('port', DEFAULT_EXPORTER_PORT)
+                self.EXPORTER_HOST  = exporter_conf.get('host', DEFAULT_EXPORTER_HOST)
             except Exception as e:
                 log.excep("FwConfiguration: %s, set defaults" % str(e))
                 self.BYPASS_CERT    = DEFAULT_BYPASS_CERT
@@ -165,6 +192,9 @@ class Fwglobals:
                 self.MANAGEMENT_URL = DEFAULT_MANAGEMENT_URL
                 self.TOKEN_FILE     = DEFAULT_TOKEN_FILE
                 self.UUID           = DEFAULT_UUID
+                self.STATS_HISTORY_SIZE = DEFAULT_STATS_HISTORY_SIZE
+                self.EXPORTER_PORT  = DEFAULT_EXPORTER_PORT
+                self.EXPORTER_HOST  = DEFAULT_EXPORTER_HOST
             if self.DEBUG:
                 log.set_level(Fwlog.FWLOG_LEVEL_DEBUG)
 
@@ -183,6 +213,7 @@ class Fwglobals:
         self.VERSIONS_FILE       = self.DATA_PATH + '.versions.yaml'
         self.SQLITE_DB_FILE      = self.DATA_PATH + '.requests.sqlite'
         self.ROUTER_STATE_FILE   = self.DATA_PATH + '.router.state'
+        self.STATS_HISTORY_FILE  = self.DATA_PATH + '.stats.history'
         self.CONN_FAILURE_FILE   = self.DATA_PATH + '.upgrade_failed'
         self.ROUTER_LOG_FILE     = '/var/log/flexiwan/agent.log'
         self.VPP_CONFIG_FILE     = '/etc/vpp/startup.conf'
@@ -202,6 +233,9 @@ class Fwglobals:
         # Load configuration from file
         self.cfg = self.FwConfiguration(self.FWAGENT_CONF_FILE, self.DATA_PATH)
 
+        # Tracks VPP process without spawning 'pidof'
+        self.vpp_monitor = FwVppMonitor()
+
         # Load websocket status codes on which agent should reconnect into a list
         self.ws_reconnect_status_codes = []
         for a in dir(self):
@@ -235,6 +269,10 @@ class Fwglobals:
 
         :returns: None.
         """
+        fwmetrics.install_spawn_hooks()
+        if not getattr(self, 'scheduler', None):   # Runs periodic tasks, should be created before router is restored
+            self.scheduler = FwScheduler('scheduler')
+            self.scheduler.start()
         self.agent_api  = FWAGENT_API()
         self.router_api = FWROUTER_API(self.SQLITE_DB_FILE)
         self.os_api     = OS_API()
@@ -244,6 +282,11 @@ class Fwglobals:
         """Destructor method
         """
         self.router_api.finalize()
+        if getattr(self, 'scheduler', None):
+            self.scheduler.finalize()
+            self.scheduler = None
+        self.vpp_monitor.finalize()
+        log.flush()
 
     def __str__(self):
         """Get string represantation of configuration.
@@ -256,6 +299,9 @@ class Fwglobals:
             'BYPASS_CERT':          self.cfg.BYPASS_CERT,
             'DEBUG':                self.cfg.DEBUG,
             'UUID':                 self.cfg.UUID,
+            'STATS_HISTORY_SIZE':   self.cfg.STATS_HISTORY_SIZE,
+            'EXPORTER_PORT':        self.cfg.EXPORTER_PORT,
+            'EXPORTER_HOST':        self.cfg.EXPORTER_HOST,
             'FWAGENT_CONF_FILE':    self.FWAGENT_CONF_FILE,
             'NUM_RETRIES_ALLOWED':  self.NUM_RETRIES_ALLOWED,
             'RETRY_INTERVAL_MIN':   self.RETRY_INTERVAL_MIN,
@@ -309,10 +355,17 @@ class Fwglobals:
             handler_func = getattr(self, handler)
             assert handler_func, 'fwglobals: handler=%s not found for req=%s' % (handler, req)
 
-            if result is None:
-                reply = handler_func(req, params)
+            # Measure latency of management requests and of internal commands
+            if handler in ['_call_agent_api', '_call_router_api']:
+                measure = fwmetrics.request(req)
             else:
-                reply = handler_func(req, params, result)
+                name = req if req != 'python' else 'python:%s' % params.get('func')
+                measure = fwmetrics.timer('commands', name)
+            with measure:
+                if result is None:
+                    reply = handler_func(req, params)
+                else:
+                    reply = handler_func(req, params, result)
             if reply['ok'] == 0:
                 if 'usage' in params and params['usage'] != 'precondition':  # Don't generate error if precondition fails
                     myCmd = 'sudo vppctl api trace save error.api'
@@ -0,0 +1,224 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import re
+import threading
+
+import fwglobals
+import fwutils
+
+class FwIfCache:
+    """This is interface name cache class representation.
+    It resolves PCI address, VPP interface name, VPP sw_if_index and name
+    of the Linux tap interface created by 'vppctl enable tap-inject' one into
+    another. The cache is built by one dump of VPP interfaces and tap-inject
+    mappings. It is updated on creation and deletion of loopback and vmxnet3
+    interfaces, it is wiped on disconnection from VPP and on VPP pid change.
+    On miss the correspondent dump is taken again, as some interfaces might be
+    created by VPP implicitly, e.g. taps are created by tap-inject plugin.
+    """
+    def __init__(self, vpp_api):
+        """Constructor method
+
+        :param vpp_api: VPP_API object to dump interfaces with.
+        """
+        self.vpp_api = vpp_api
+        self.lock    = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """Wipe out the cache.
+
+        :returns: None.
+        """
+        with self.lock:
+            self.vpp_pid         = None
+            self.pci_to_name     = {}   # pci bytes as in fwutils.pci_str_to_bytes() -> VPP name
+            self.pci_to_index    = {}   # pci bytes -> sw_if_index
+            self.name_to_index   = {}   # VPP name -> sw_if_index
+            self.index_to_name   = {}   # sw_if_index -> VPP name
+            self.name_to_tap     = {}   # VPP name -> Linux tap name
+
+    def pci_to_vpp_if_name(self, pci):
+        """Convert PCI address into VPP interface name.
+
+        :param pci:      PCI address.
+
+        :returns: VPP interface name or None if not found.
+        """
+        pci_key = fwutils.pci_str_to_bytes(pci)
+        with self.lock:
+            self._validate()
+            if not pci_key in self.pci_to_name:
+                self._load_ifs()
+            return self.pci_to_name.get(pci_key)
+
+    def pci_to_vpp_sw_if_index(self, pci):
+        """Convert PCI address into VPP sw_if_index.
+
+        :param pci:      PCI address.
+
+        :returns: sw_if_index or None if not found.
+        """
+        pci_key = fwutils.pci_str_to_bytes(pci)
+        with self.lock:
+            self._validate()
+            if not pci_key in self.pci_to_index:
+                self._load_ifs()
+            return self.pci_to_index.get(pci_key)
+
+    def vpp_sw_if_index_to_name(self, sw_if_index):
+        """Convert VPP sw_if_index into VPP interface name.
+
+        :param sw_if_index:      VPP sw_if_index.
+
+        :returns: VPP interface name or None if not found.
+        """
+        with self.lock:
+            self._validate()
+            if not sw_if_index in self.index_to_name:
+                self._load_ifs()
+            return self.index_to_name.get(sw_if_index)
+
+    def vpp_if_name_to_tap(self, vpp_if_name):
+        """Convert VPP interface name into Linux TAP interface name.
+
+        :param vpp_if_name:      VPP interface name.
+
+        :returns: Linux TAP interface name or None if not found.
+        """
+        with self.lock:
+            self._validate()
+            if not vpp_if_name in self.name_to_tap:
+                self._load_taps()
+            return self.name_to_tap.get(vpp_if_name)
+
+    def update(self, api, params, rv):
+        """Update cache on successful execution of VPP API that creates
+        or deletes interface.
+
+        :param api:       VPP API name.
+        :param params:    Parameters of the API.
+        :param rv:        Object returned by the API.
+
+        :returns: None.
+        """
+        with self.lock:
+            if api == 'create_loopback_instance':
+                if params and params.get('is_specified'):
+                    self._add_if('loop%d' % params['user_instance'], rv.sw_if_index)
+            elif api == 'vmxnet3_create':
+                # Name of vmxnet3 interface is not returned, it will be fetched
+                # on first lookup by name.
+                self.pci_to_index[params['pci_addr']] = rv.sw_if_index
+            elif api in ['delete_loopback', 'vmxnet3_delete']:
+                self._remove_if(params['sw_if_index'])
+
+    def _add_if(self, name, sw_if_index):
+        self.name_to_index[name]        = sw_if_index
+        self.index_to_name[sw_if_index] = name
+
+    def _remove_if(self, sw_if_index):
+        name = self.index_to_name.pop(sw_if_index, None)
+        if name:
+            self.name_to_index.pop(name, None)
+            self.name_to_tap.pop(name, None)
+        for pci_key, index in list(self.pci_to_index.items()):
+            if index == sw_if_index:
+                del self.pci_to_index[pci_key]
+                self.pci_to_name.pop(pci_key, None)
+
+    def _validate(self):
+        """Wipe out the cache if VPP was restarted since the cache was built.
+        The check is done by existence of the process and does not spawn 'pidof'.
+        """
+        if self.vpp_pid and not os.path.exists('/proc/%s' % self.vpp_pid):
+            fwglobals.log.debug("FwIfCache: vpp pid %s is gone, wipe out cache" % self.vpp_pid)
+            self.clear()
+
+    def _update_vpp_pid(self):
+        if not self.vpp_pid:
+            pid = fwutils.vpp_pid()
+            self.vpp_pid = pid.split()[0] if pid else None
+
+    def _load_ifs(self):
+        """Build PCI, name and sw_if_index maps out of 'show hardware-interfaces',
+        vmxnet3_dump and sw_interface_dump.
+        """
+        self._update_vpp_pid()
+        # 'show hardware-interfaces' brings following table:
+        #              Name                Idx    Link  Hardware
+        # GigabitEthernet0/8/0               1    down  GigabitEthernet0/8/0
+        #   Link speed: unknown
+        #   ...
+        #   pci: device 8086:100e subsystem 8086:001e address 0000:00:08.00 numa 0
+        #
+        hw = fwutils._vppctl_read('show hardware-interfaces')
+        if hw is None:
+            raise Exception("FwIfCache: failed to fetch hardware info from VPP")
+        pci_to_name = {}
+        for hw_if in fwutils._get_group_delimiter(hw.splitlines(), r"^\w.*?\d"):
+            (pci, name) = fwutils._parse_vppname_map('\n'.join(hw_if),
+                valregex=r"^(\w[^\s]+)\s+\d+\s+(\w+)",
+                keyregex=r"pci:.*\saddress\s(\S+)")
+            if pci and name:
+                pci_to_name[fwutils.pci_str_to_bytes(pci)] = name
+
+        vpp = self.vpp_api.vpp.api
+        with self.vpp_api.lock:
+            vmxnet3_ifs = vpp.vmxnet3_dump()
+            sw_ifs      = vpp.sw_interface_dump()
+        for hw_if in vmxnet3_ifs:
+            pci_to_name[hw_if.pci_addr] = hw_if.if_name.rstrip(' \t\r\n\0')
+
+        name_to_index = {}
+        index_to_name = {}
+        for sw_if in sw_ifs:
+            name = sw_if.interface_name.rstrip(' \t\r\n\0')
+            name_to_index[name]              = sw_if.sw_if_index
+            index_to_name[sw_if.sw_if_index] = name
+
+        pci_to_index = {}
+        for pci_key, name in pci_to_name.items():
+            if name in name_to_index:
+                pci_to_index[pci_key] = name_to_index[name]
+
+        self.pci_to_name   = pci_to_name
+        self.pci_to_index  = pci_to_index
+        self.name_to_index = name_to_index
+        self.index_to_name = index_to_name
+
+    def _load_taps(self):
+        """Build name to tap map out of 'show tap-inject':
+            GigabitEthernet0/8/0 -> vpp0
+            GigabitEthernet0/9/0 -> vpp1
+            loop0 -> vpp2
+        """
+        self._update_vpp_pid()
+        taps = fwutils._vppctl_read("show tap-inject")
+        if taps is None:
+            raise Exception("FwIfCache: failed to fetch tap info from VPP")
+        name_to_tap = {}
+        for match in re.finditer(r'([^\s]+) -> ([a-zA-Z0-9]+)', taps):
+            name_to_tap[match.group(1)] = match.group(2)
+        self.name_to_tap = name_to_tap
@@ -20,18 +20,51 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 ################################################################################
 
+import atexit
+import collections
 import os
+import socket
+import Queue
 import syslog
 import sys
+import threading
+import time
 
 class Fwlog:
     """This is logging class representation.
+    To avoid building of messages that are not going to be logged,
+    the message formatting is deferred until the level check passes:
+    the message might be format string with arguments, or a callable,
+    that returns the message, e.g.
+
+        log.debug("%s(%s)", name, params)
+        log.debug(lambda: "reply=" + json.dumps(reply))
+
+    For messages that take few statements to build use is_enabled().
+
+    The syslog messages are written by background thread, that is fed
+    by bounded queue, so the logging thread never blocks on syslog.
+    If the queue is full, the message is dropped and the number of dropped
+    messages is logged later. Consecutive identical messages are written
+    once, followed by 'last message repeated N times'. In addition the number
+    of identical messages is limited per second, so a failure storm does not
+    flood the log, while messages built out of the same format string with
+    different arguments, e.g. trace of executed commands, are not limited. The number of suppressed messages is logged once
+    the limit period passes.
+    The recent syslog messages are kept in memory as well, so the latest
+    logs can be fetched without reading the log file.
 
     :param level: Start logging from this severity level.
     """
     FWLOG_LEVEL_INFO  = 0x1
     FWLOG_LEVEL_DEBUG = 0xFF
 
+    QUEUE_SIZE        = 10000   # Maximal number of messages waiting to be written to syslog
+    RATE_LIMIT        = 20      # Maximal number of identical messages per RATE_LIMIT_PERIOD
+    RATE_LIMIT_PERIOD = 1       # Seconds
+    RATE_LIMIT_KEYS   = 1000    # Maximal number of tracked messages
+    RECORDS_SIZE      = 5000    # Number of recent messages kept in memory
+
     def __init__(self, level=FWLOG_LEVEL_INFO):
         """Constructor method
         """
@@ -39,76 +72,234 @@ class Fwlog:
         self.to_syslog_enabled   = True
         self.to_terminal_enabled = True
         syslog.openlog(ident="fwagent")
+        self.queue   = Queue.Queue(self.QUEUE_SIZE)
+        self.dropped = 0            # Number of messages dropped due to full queue
+        self.rates   = {}           # Message -> [start of period, number of messages, number of suppressed]
+        self.lock    = threading.Lock()
+        self.thread  = None
+        self.thread_lock = threading.Lock()
+        self.flush_mark  = object()  # Queued by flush() to write the pending repetitions
+        self.records = collections.deque(maxlen=self.RECORDS_SIZE)  # Recent (time, level, message) records
+        self.host    = socket.gethostname()
+
+    def is_enabled(self, level):
+        """Check if messages of the provided severity level are logged.
+
+        :param level:             Severity level.
+
+        :returns: 'True' if messages are logged, 'False' otherwise.
+        """
+        return self.level >= level
+
+    def _format(self, log_message, args):
+        """Build message out of format string and arguments or out of callable.
+
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
 
-    def _log(self, log_message, to_terminal=True, to_syslog=True):
+        :returns: Message string.
+        """
+        if callable(log_message):
+            log_message = log_message()
+        if args:
+            log_message = log_message % args
+        return log_message
+
+    def _log(self, log_message, to_terminal=True, to_syslog=True, level='info'):
         """Print log message.
 
         :param log_message:       Message contents.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
+        :param level:             Severity of message: 'excep', 'error', 'warning', 'info' or 'debug'.
 
         :returns: None.
         """
+        (allowed, suppressed) = self._check_rate(log_message)
+        if suppressed and self.to_syslog_enabled:
+            self._enqueue(suppressed)
+        if not allowed:
+            return
         if to_terminal and self.to_terminal_enabled:
             print(log_message)
         if to_syslog and self.to_syslog_enabled:
-            syslog.syslog(log_message)
+            self._enqueue(log_message)
+            with self.lock:
+                self.records.append((time.time(), level, log_message))
 
-    def excep(self, log_message, to_terminal=True, to_syslog=True):
-        """Print exception message.
+    def _check_rate(self, log_message):
+        """Check if the message does not exceed the rate limit.
+
+        :param log_message:       Message contents.
+
+        :returns: Tuple of 'True' if message should be logged and 'False' otherwise,
+                  and message about messages suppressed during the previous period or None.
+        """
+        now = time.time()
+        suppressed = None
+        with self.lock:
+            rate = self.rates.get(log_message)
+            if rate and now - rate[0] < self.RATE_LIMIT_PERIOD:
+                rate[1] += 1
+                if rate[1] <= self.RATE_LIMIT:
+                    return (True, None)
+                rate[2] += 1
+                return (False, None)
+            if rate and rate[2]:
+                suppressed = "*** warning: %d messages were suppressed, like: %s ***" % (rate[2], log_message)
+            if len(self.rates) >= self.RATE_LIMIT_KEYS:   # Forget messages with expired period
+                self.rates = dict([(k, r) for (k, r) in self.rates.items()
+                                   if now - r[0] < self.RATE_LIMIT_PERIOD or r[2]])
+                if len(self.rates) >= self.RATE_LIMIT_KEYS:
+                    self.rates = {}
+            self.rates[log_message] = [now, 1, 0]
+            return (True, suppressed)
+
+    def _enqueue(self, log_message):
+        """Put message into queue of syslog writer.
+        Start the writer thread on the first message.
 
         :param log_message:       Message contents.
+
+        :returns: None.
+        """
+        if not self.thread:
+            with self.thread_lock:
+                if not self.thread:
+                    self.thread = threading.Thread(target=self._writer, name='Log Writer Thread')
+                    self.thread.daemon = True
+                    self.thread.start()
+                    atexit.register(self.flush)
+        try:
+            self.queue.put_nowait(log_message)
+        except Queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        """Syslog writer thread.
+        Writes queued messages to syslog, while coalescing consecutive
+        identical messages.
+        """
+        last     = None
+        repeated = 0
+        while True:
+            try:
+                # Wait for the repeated message not too long to report repetitions in time
+                item = self.queue.get(timeout=(1 if repeated else None))
+            except Queue.Empty:
+                item = None
+            log_message = item if item is not self.flush_mark else None
+
+            if log_message == last and log_message is not None:
+                repeated += 1
+            else:
+                if repeated:
+                    syslog.syslog("last message repeated %d times" % repeated)
+                    repeated = 0
+                if self.dropped:
+                    (dropped, self.dropped) = (self.dropped, 0)
+                    syslog.syslog("*** warning: %d messages were dropped ***" % dropped)
+                if log_message is not None:
+                    syslog.syslog(log_message)
+                last = log_message
+            if item is not None:
+                self.queue.task_done()
+
+    def get_records(self):
+        """Get recent messages sent to syslog, the newest first.
+        The records are formatted as lines of the syslog file on demand,
+        so the caller that needs few latest records does not pay for all.
+
+        :returns: Generator of (time, level, line) tuples.
+        """
+        with self.lock:
+            records = list(self.records)
+        for (t, level, log_message) in reversed(records):
+            yield (t, level, self._format_record(t, log_message))
+
+    def _format_record(self, t, log_message):
+        """Format message as syslog does, e.g.
+        'Oct  7 12:01:02 host fwagent: message'.
+        """
+        tm = time.localtime(t)
+        return "%s %2d %s %s fwagent: %s" % \
+               (time.strftime('%b', tm), tm.tm_mday, time.strftime('%H:%M:%S', tm), self.host, log_message)
+
+    def flush(self):
+        """Wait until all queued messages and the pending number
+        of repetitions are written to syslog.
+
+        :returns: None.
+        """
+        if self.thread:
+            self.queue.put(self.flush_mark)
+            self.queue.join()
+
+    def excep(self, log_message, *args, **kwargs):
+        """Print exception message.
+
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
 
         :returns: None.
         """
-        self._log("excep: " + log_message, to_terminal, to_syslog)
+        log_message = self._format(log_message, args)
+        self._log("excep: " + log_message, kwargs.get('to_terminal', True), kwargs.get('to_syslog', True), level='excep')
 
-    def error(self, log_message, to_terminal=True, to_syslog=True):
+    def error(self, log_message, *args, **kwargs):
         """Print error message.
 
-        :param log_message:       Message contents.
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
 
         :returns: None.
         """
-        self._log("error: " + log_message, to_terminal, to_syslog)
+        log_message = self._format(log_message, args)
+        self._log("error: " + log_message, kwargs.get('to_terminal', True), kwargs.get('to_syslog', True), level='error')
 
-    def warning(self, log_message, to_terminal=True, to_syslog=True):
+    def warning(self, log_message, *args, **kwargs):
         """Print warning message.
 
-        :param log_message:       Message contents.
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
 
         :returns: None.
         """
-        self._log("*** warning: " + log_message + " ***", to_terminal, to_syslog)
+        log_message = self._format(log_message, args)
+        self._log("*** warning: " + log_message + " ***", kwargs.get('to_terminal', True), kwargs.get('to_syslog', True), level='warning')
 
-    def info(self, log_message, to_terminal=True, to_syslog=True):
+    def info(self, log_message, *args, **kwargs):
         """Print info message.
 
-        :param log_message:       Message contents.
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
 
         :returns: None.
         """
-        self._log(log_message, to_terminal, to_syslog)
+        log_message = self._format(log_message, args)
+        self._log(log_message, kwargs.get('to_terminal', True), kwargs.get('to_syslog', True))
 
-    def debug(self, log_message, to_terminal=True, to_syslog=True):
+    def debug(self, log_message, *args, **kwargs):
         """Print debug message.
 
-        :param log_message:       Message contents.
+        :param log_message:       Message contents, format string or callable.
+        :param args:              Format arguments.
         :param to_terminal:       Print to terminal.
         :param to_syslog:         Print to syslog.
 
         :returns: None.
         """
         if self.level == self.FWLOG_LEVEL_DEBUG:
-            self._log(log_message, to_terminal, to_syslog)
+            log_message = self._format(log_message, args)
+            self._log(log_message, kwargs.get('to_terminal', True), kwargs.get('to_syslog', True), level='debug')
 
     def set_level(self, level):
         """Set severity level to show messages that are above this level.
@@ -0,0 +1,256 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+# Agent latency metrics.
+# The module keeps latency histograms of requests received from management,
+# of internal commands the requests are translated into (e.g. 'exec',
+# 'sw_interface_add_del_address', 'python:modify_dhcpd') and of substitution
+# functions. It counts also processes spawned by agent per request.
+# The histograms have fixed buckets, so recording of sample is O(1)
+# and doesn't allocate memory.
+
+import bisect
+import contextlib
+import os
+import subprocess
+import threading
+import time
+
+# Upper bounds of histogram buckets in milliseconds, the last bucket is unbounded
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+CATEGORIES = ['requests', 'commands', 'substitutions']
+
+lock     = threading.Lock()
+context  = threading.local()     # Request that is handled by the current thread
+started  = time.time()
+metrics  = dict([(c, {}) for c in CATEGORIES])
+spawns   = {'total': 0}          # Number of spawned processes per request
+hooked   = False
+
+class FwHistogram:
+    """This is latency histogram class representation.
+    """
+    def __init__(self):
+        """Constructor method
+        """
+        self.count   = 0
+        self.sum     = 0.0
+        self.max     = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        """Record latency sample.
+
+        :param ms: Latency in milliseconds.
+
+        :returns: None.
+        """
+        self.count += 1
+        self.sum   += ms
+        if ms > self.max:
+            self.max = ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p):
+        """Estimate percentile by upper bound of bucket where it falls.
+
+        :param p: Percentile in range 0-100.
+
+        :returns: Latency in milliseconds.
+        """
+        rank = p * self.count / 100.0
+        total = 0
+        for (i, n) in enumerate(self.buckets):
+            total += n
+            if total >= rank and n:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def dump(self):
+        """Get summary of histogram.
+
+        :returns: Dictionary with count, average, maximum and percentiles.
+        """
+        return {
+            'count':   self.count,
+            'avg_ms':  round(self.sum / self.count, 3) if self.count else 0,
+            'max_ms':  round(self.max, 3),
+            'p50_ms':  round(self.percentile(50), 3),
+            'p90_ms':  round(self.percentile(90), 3),
+            'p99_ms':  round(self.percentile(99), 3),
+            'buckets': dict([('le_%d' % b, n) for (b, n) in zip(BUCKETS_MS, self.buckets) if n] +
+                            ([('inf', self.buckets[-1])] if self.buckets[-1] else []))
+        }
+
+def record(category, name, seconds):
+    """Record latency sample.
+
+    :param category:  One of CATEGORIES.
+    :param name:      Name of request/command/function.
+    :param seconds:   Latency in seconds.
+
+    :returns: None.
+    """
+    with lock:
+        hist = metrics[category].get(name)
+        if not hist:
+            hist = FwHistogram()
+            metrics[category][name] = hist
+        hist.add(seconds * 1000.0)
+
+@contextlib.contextmanager
+def timer(category, name):
+    """Measure latency of code block and record it.
+    Usage:
+        with fwmetrics.timer('substitutions', func_name):
+            ...
+
+    :param category:  One of CATEGORIES.
+    :param name:      Name of request/command/function.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(category, name, time.time() - start)
+
+@contextlib.contextmanager
+def request(name):
+    """Measure latency of request and attribute processes spawned by
+    the current thread meanwhile to the request. The nested requests,
+    e.g. 'add-interface' simulated by 'start-router', are measured,
+    but spawns are attributed to the outermost request only.
+
+    :param name:  Name of request.
+    """
+    outer = get_request()
+    if not outer:
+        context.request = name
+    try:
+        with timer('requests', name):
+            yield
+    finally:
+        if not outer:
+            context.request = None
+
+def get_request():
+    """Get request handled by the current thread.
+
+    :returns: Name of request or None.
+    """
+    return getattr(context, 'request', None)
+
+def set_request(name):
+    """Set request handled by the current thread. It is used by worker
+    threads that execute parts of the request on behalf of other thread.
+
+    :param name:  Name of request or None.
+
+    :returns: None.
+    """
+    context.request = name
+
+def count_spawn():
+    """Count spawned process.
+
+    :returns: None.
+    """
+    req = get_request()
+    with lock:
+        spawns['total'] += 1
+        if req:
+            spawns[req] = spawns.get(req, 0) + 1
+
+def install_spawn_hooks():
+    """Hook functions that spawn processes, so spawns are counted without
+    modification of every place that runs shell command. The hooks are
+    subprocess.Popen, that is used by subprocess.check_output() and others,
+    os.system() and os.popen().
+
+    :returns: None.
+    """
+    global hooked
+    if hooked:
+        return
+    hooked = True
+
+    popen_init = subprocess.Popen.__init__
+    def _popen_init(self, *args, **kwargs):
+        count_spawn()
+        popen_init(self, *args, **kwargs)
+    subprocess.Popen.__init__ = _popen_init
+
+    for name in ['system', 'popen']:
+        def _hook(func):
+            def _spawn(*args, **kwargs):
+                count_spawn()
+                return func(*args, **kwargs)
+            return _spawn
+        setattr(os, name, _hook(getattr(os, name)))
+
+def get_metrics():
+    """Get summary of all metrics.
+
+    :returns: Dictionary of metrics, like:
+              {
+                'since':         <utc of start of metrics collection>,
+                'requests':      {'add-tunnel': {'count':.., 'avg_ms':.., 'max_ms':.., 'p50_ms':.., 'p90_ms':..,
+                                                 'p99_ms':.., 'buckets':{'le_10':.., ..}, 'spawns':..}},
+                'commands':      {'exec': {..}, 'python:modify_dhcpd': {..}},
+                'substitutions': {'pci_to_vpp_if_name': {..}},
+                'spawns':        <total number of spawned processes>
+              }
+    """
+    with lock:
+        res = {'since': started, 'spawns': spawns['total']}
+        for (category, hists) in metrics.items():
+            res[category] = dict([(name, hist.dump()) for (name, hist) in hists.items()])
+        for (name, dump) in res['requests'].items():
+            dump['spawns'] = spawns.get(name, 0)
+        return res
+
+def get_histograms():
+    """Get copy of raw histograms, e.g. to be exported in Prometheus format.
+
+    :returns: Dictionary of lists of (name, bucket counts, sum in ms, count)
+              by category, and dictionary of spawn counters. The bucket bounds
+              are listed in BUCKETS_MS.
+    """
+    with lock:
+        res = {}
+        for (category, hists) in metrics.items():
+            res[category] = [(name, list(h.buckets), h.sum, h.count) for (name, h) in hists.items()]
+        return (res, dict(spawns))
+
+def reset():
+    """Reset all metrics.
+
+    :returns: None.
+    """
+    global started
+    with lock:
+        started = time.time()
+        for hists in metrics.values():
+            hists.clear()
+        spawns.clear()
+        spawns['total'] = 0
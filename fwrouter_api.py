@@ -22,18 +22,22 @@
 
 import copy
 import os
+import Queue
 import re
-import time
-import threading
 import traceback
 import yaml
 import json
 
 import fwglobals
+import fwmetrics
 import fwutils
 
 from fwdb_requests import FwDbRequests
+from fwlog import Fwlog
+from fwthreadpool import FwThreadPool
 from vpp_api import VPP_API
+from vpp_cli import VPP_CLI
+from vpp_stats_api import VPP_STATS_API
 
 import fwtunnel_stats
 
@@ -54,12 +58,15 @@ fwrouter_translators = {
     'stop-router':         {'module':'fwtranslate_revert',          'api':'revert',            'src':'start-router'},
     'add-interface':       {'module':'fwtranslate_add_interface',   'api':'add_interface',     'key_func':'get_request_key'},
     'remove-interface':    {'module':'fwtranslate_revert',          'api':'revert',            'src':'add-interface'},
+    'modify-interface':    {'module':'fwtranslate_add_interface',   'api':'modify_interface',  'src':'add-interface'},
     'add-route':           {'module':'fwtranslate_add_route',       'api':'add_route',         'key_func':'get_request_key'},
     'remove-route':        {'module':'fwtranslate_revert',          'api':'revert',            'src':'add-route'},
+    'modify-route':        {'module':'fwtranslate_add_route',       'api':'modify_route',      'src':'add-route'},
     'add-tunnel':          {'module':'fwtranslate_add_tunnel',      'api':'add_tunnel',        'key_func':'get_request_key'},
     'remove-tunnel':       {'module':'fwtranslate_revert',          'api':'revert',            'src':'add-tunnel'},
     'add-dhcp-config':     {'module':'fwtranslate_add_dhcp_config', 'api':'add_dhcp_config',   'key_func':'get_request_key'},
-    'remove-dhcp-config':  {'module':'fwtranslate_revert',          'api':'revert',            'src': 'add-dhcp-config'}
+    'remove-dhcp-config':  {'module':'fwtranslate_revert',          'api':'revert',            'src': 'add-dhcp-config'},
+    'modify-dhcp-config':  {'module':'fwtranslate_add_dhcp_config', 'api':'modify_dhcp_config','src': 'add-dhcp-config'}
 }
 
 class FWROUTER_API:
@@ -78,54 +85,66 @@ class FWROUTER_API:
         """Constructor method
         """
         self.vpp_api         = VPP_API()
-        self.db_requests     = FwDbRequests(request_db_file)    # Database of executed requests
+        self.vpp_cli         = VPP_CLI()
+        self.vpp_stats_api   = VPP_STATS_API()
+        self.db_requests     = FwDbRequests(request_db_file, cache=True)    # Database of executed requests
+        self.cmd_pool        = FwThreadPool(8, 'cmd')   # Runs independent commands of request concurrently
         self.router_started  = False
         self.router_failure  = False
-        self.thread_watchdog = None
-        self.thread_tunnel_stats = None
+        self.task_watchdog   = None
+        self.watchdog_stats  = {'vpp_down': 0, 'restores': 0}   # Counters of watchdog events, see watchdog()
+        self.task_tunnel_stats = None
 
     def finalize(self):
         """Destructor method
         """
         self.vpp_api.finalize()
+        self.vpp_cli.finalize()
+        self.vpp_stats_api.finalize()
         self.db_requests.finalize()
+        self.cmd_pool.finalize()
         self.router_started = False
         self._stop_threads()
 
     def watchdog(self):
-        """Watchdog thread.
+        """Watchdog task.
+        It is run by scheduler every second and immediately on VPP exit.
         Its function is to monitor if VPP process is alive.
         Otherwise it will start VPP and restore configuration from DB.
         """
-        while self.router_started:
-            time.sleep(1)  # 1 sec
-            try:           # Ensure watchdog thread doesn't exit on exception
-                if not fwutils.vpp_does_run():      # This 'if' prevents debug print by restore_vpp_if_needed() every second
-                    fwglobals.log.debug("watchdog: initiate restore")
-
-                    self.vpp_api.disconnect()       # Reset connection to vpp to force connection renewal
-                    restored = self.restore_vpp_if_needed()  # Rerun VPP and apply configuration
-
-                    if not restored:                # If some magic happened and vpp is alive without restore, connect back to VPP
-                        if fwutils.vpp_does_run():
-                            fwglobals.log.debug("watchdog: vpp is alive with no restore!!! (pid=%s)" % str(fwutils.vpp_pid))
-                            self.vpp_api.connect()
-                        fwglobals.log.debug("watchdog: no need to restore")
-                    else:
-                        fwglobals.log.debug("watchdog: restore finished")
-            except Exception as e:
-                fwglobals.log.error("watchdog: exception: %s" % str(e))
-                pass
+        if not self.router_started:
+            return
+        try:           # Ensure watchdog task doesn't stop on exception
+            if not fwutils.vpp_does_run():      # This 'if' prevents debug print by restore_vpp_if_needed() every second
+                fwglobals.log.debug("watchdog: initiate restore")
+                self.watchdog_stats['vpp_down'] += 1
+
+                self.vpp_api.disconnect()       # Reset connection to vpp to force connection renewal
+                self.vpp_cli.disconnect()
+                self.vpp_stats_api.disconnect()
+                restored = self.restore_vpp_if_needed()  # Rerun VPP and apply configuration
+
+                if not restored:                # If some magic happened and vpp is alive without restore, connect back to VPP
+                    if fwutils.vpp_does_run():
+                        fwglobals.log.debug("watchdog: vpp is alive with no restore!!! (pid=%s)" % str(fwutils.vpp_pid()))
+                        self.vpp_api.connect()
+                    fwglobals.log.debug("watchdog: no need to restore")
+                else:
+                    self.watchdog_stats['restores'] += 1
+                    fwglobals.log.debug("watchdog: restore finished")
+        except Exception as e:
+            fwglobals.log.error("watchdog: exception: %s" % str(e))
+            pass
 
-    def tunnel_stats_thread(self):
-        """Tunnel statistics thread.
+    def tunnel_stats(self):
+        """Tunnel statistics task.
+        It is run by scheduler every second.
         Its function is to monitor tunnel state and RTT.
         It is implemented by pinging the other end of the tunnel.
         """
-        self._fill_tunnel_stats_dict()
-        while self.router_started:
-            time.sleep(1)  # 1 sec
-            fwtunnel_stats.tunnel_stats_test()
+        if not self.router_started:
+            return
+        fwtunnel_stats.tunnel_stats_test()
 
     def restore_vpp_if_needed(self):
         """Restore VPP.
@@ -188,16 +207,24 @@ class FWROUTER_API:
 
         :returns: Status codes dictionary.
         """
-        # modify-device requests are split into their corresponding remove/add requests.
-        # This code should be replaced with a true modify operation that performs
-        # the change in-place, without removing and adding the interface.
+        # modify-device requests are split into their corresponding modify-X,
+        # remove-X and add-X requests.
         if req == 'modify-device':
             return self._handle_modify_device_request(params)
 
+        # sync-device request brings the full desired configuration.
+        # It is reconciled with configuration stored in the request database
+        # and only the difference is applied.
+        if req == 'sync-device':
+            return self._handle_sync_device_request(params)
+
         # Router configuration requests might unite multiple requests of same type
         # arranged into list, e.g. 'add-interface' : [ {iface1}, {iface2}, ...].
         # To handle that we split that kinds of requests into multiple simple requests,
         # as they would be received over network, and execute them one by one.
+        # The bulk of tunnels is handled in optimized way, see _call_add_tunnels().
+        if req == 'add-tunnel' and type(params) is list and len(params) > 1:
+            return self._call_add_tunnels(params)
         if re.match('add-|remove-', req) and type(params) is list:
             requests = [{req: param} for param in params]
             return self._call_aggregated(requests)
@@ -208,6 +235,7 @@ class FWROUTER_API:
         """Execute multiple requests.
         It do that as an atomic operation,
         i.e. if one of requests fails, all the previous are reverted.
+        The changes in request database are committed once, when all requests succeed.
 
         :param requests:         Request list.
 
@@ -232,29 +260,81 @@ class FWROUTER_API:
                 raise e
 
 
-        for (idx, req) in enumerate(requests):
+        # Stage all DB changes and commit them once at the end.
+        # If any request fails, the DB is rolled back together with the revert.
+        with self.db_requests.transaction():
+            for (idx, req) in enumerate(requests):
+                try:
+                    (op, params), = req.items()
+                    fwglobals.log.debug(lambda: "_call_aggregated: executing request %s with params %s" % (op, json.dumps(req)))
+                    self._call_simple(op, params)
+                except Exception as e:
+                    # Revert previously succeeded simple requests
+                    fwglobals.log.error("_call_aggregated: failed to execute %s. reverting previous requests..." % json.dumps(req))
+                    for rev_req in reversed(requests[0:idx]):
+                        try:
+                            (orig_op, orig_params), = rev_req.items()
+                            if re.match('modify-', orig_op):
+                                (rev_op, rev_params) = (orig_op, {'old': orig_params['new'], 'new': orig_params['old']})
+                            else:
+                                rev_op = orig_op.replace('add-','remove-') if re.match('add-', orig_op) else orig_op.replace('remove-','add-')
+                                rev_params = orig_params
+                            self._call_simple(rev_op, rev_params)
+                        except Exception as er:
+                            # on failure to revert move router into failed state
+                            fwglobals.log.excep(
+                                "failed to revert request %s while running rollback on aggregated request(%s): %s" % \
+                                (orig_op, format(orig_params), format(er)))
+                            self._set_router_failure("failed to revert request %s while running rollback on aggregated request" % orig_op)
+                            pass
+                    raise
+
+        fwglobals.log.debug("FWROUTER_API: === end handling aggregated request ===")
+        return {'ok':1}
+
+    def _call_add_tunnels(self, params_list):
+        """Execute list of add-tunnel requests.
+        It is equivalent to the aggregated request, but it is optimized for
+        large number of tunnels: the FRR is restarted once after all tunnels
+        were added and not per tunnel, the lookups are shared by translations
+        of tunnels, the request database is committed once and the tunnel
+        statistics are updated for the added tunnels only.
+        If one of tunnels fails, the previously added tunnels are reverted.
+
+        :param params_list:  List of add-tunnel parameters.
+
+        :returns: Status codes dictionary.
+        """
+        fwglobals.log.debug("FWROUTER_API: === start handling bulk of %d tunnels ===", len(params_list))
+        router_was_started = fwutils.vpp_does_run()
+        executed = []       # Command lists of added tunnels
+        lookups  = {}
+
+        with self.db_requests.transaction():
             try:
-                (op, params), = req.items()
-                fwglobals.log.debug("_call_aggregated: executing request %s with params %s" % (op, json.dumps(req)))
-                self._call_simple(op, params)
+                for params in params_list:
+                    cmd_list = fwtranslate_add_tunnel.add_tunnel(params, restart_frr=False, lookups=lookups)
+                    req_key  = fwtranslate_add_tunnel.get_request_key(params)
+                    if router_was_started:
+                        self._execute('add-tunnel', req_key, cmd_list)
+                    self._update_db_requests(False, req_key, 'add-tunnel', params, cmd_list, router_was_started)
+                    if router_was_started:
+                        executed.append(cmd_list)
+
+                if router_was_started:
+                    cmd_list = fwtranslate_add_tunnel.get_restart_frr_cmd_list(params_list)
+                    self._execute('add-tunnel', 'restart-frr', cmd_list)
             except Exception as e:
-                # Revert previously succeeded simple requests
-                fwglobals.log.error("_call_aggregated: failed to execute %s. reverting previous requests..." % json.dumps(req))
-                for rev_req in reversed(requests[0:idx]):
-                    try:
-                        (orig_op, orig_params), = rev_req.items()
-                        rev_op = orig_op.replace('add-','remove-') if re.match('add-', orig_op) else orig_op.replace('remove-','add-')
-                        self._call_simple(rev_op, orig_params)
-                    except Exception as er:
-                        # on failure to revert move router into failed state
-                        fwglobals.log.excep(
-                            "failed to revert request %s while running rollback on aggregated request(%s): %s" % \
-                            (orig_op, format(orig_params), format(er)))
-                        self._set_router_failure("failed to revert request %s while running rollback on aggregated request" % orig_op)
-                        pass
+                fwglobals.log.error("_call_add_tunnels: failed to add tunnels: %s. reverting %d added tunnels..." % \
+                                    (str(e), len(executed)))
+                for cmd_list in reversed(executed):
+                    self._revert(cmd_list, len(cmd_list))
                 raise
 
-        fwglobals.log.debug("FWROUTER_API: === end handling aggregated request ===")
+        for params in params_list:
+            fwtunnel_stats.tunnel_stats_add(params['tunnel-id'], params['loopback-iface']['addr'])
+
+        fwglobals.log.debug("FWROUTER_API: === end handling bulk of %d tunnels ===", len(params_list))
         return {'ok':1}
 
     def _extract_request_key(self, req, params):
@@ -275,15 +355,13 @@ class FWROUTER_API:
 
     def _fill_tunnel_stats_dict(self):
         """Get tunnels their corresponding loopbacks ip addresses
-        to be used by tunnel statistics thread.
+        to be used by tunnel statistics task.
+        The statistics of tunnels that were registered already are preserved.
         """
-        fwtunnel_stats.tunnel_stats_clear()
-        for key, request in self.db_requests.db.items():
-            if not re.search('add-tunnel', key):
-                continue
-            id = request['params']['tunnel-id']
-            addr = request['params']['loopback-iface']['addr']
-            fwtunnel_stats.tunnel_stats_add(id, addr)
+        tunnels = {}
+        for (_, params) in self.db_requests.fetch_requests('add-tunnel'):
+            tunnels[params['tunnel-id']] = params['loopback-iface']['addr']
+        fwtunnel_stats.tunnel_stats_sync(tunnels)
 
     def _call_simple(self, req, params):
         """Execute request.
@@ -294,7 +372,7 @@ class FWROUTER_API:
         :returns: Status codes dictionary.
         """
         # 'start-router', 'stop-router' and 'reset-router' have special handling,
-        # as they deal with watchdog thread, applying configuration on start, etc.
+        # as they deal with watchdog task, applying configuration on start, etc.
         # All the rest of requests are handled in common way.
         if re.search('-router',  req):
             if req == 'start-router':
@@ -312,6 +390,9 @@ class FWROUTER_API:
         if self._test_router_failure() and not re.match('add-|remove-',  req):
             raise Exception("device failed, can't fulfill requests")
 
+        if re.match('modify-',  req):
+            return self._call_modify(req, params)
+
         # Translate request to list of commands to be executed
         (cmd_list , req_key , complement) = self._translate(req, params)
 
@@ -332,8 +413,55 @@ class FWROUTER_API:
         # has been executed.
         self._update_db_requests(complement, req_key, req, params, cmd_list, executed)
 
-        if re.match('(add|remove)-tunnel',  req):
-            self._fill_tunnel_stats_dict()
+        if req == 'add-tunnel':
+            fwtunnel_stats.tunnel_stats_add(params['tunnel-id'], params['loopback-iface']['addr'])
+        elif req == 'remove-tunnel':
+            fwtunnel_stats.tunnel_stats_remove(params['tunnel-id'])
+
+        return {'ok':1}
+
+
+    def _call_modify(self, req, params):
+        """Execute modify-X request, e.g. 'modify-interface'.
+        The request parameters include the 'old' parameters of the object
+        stored in database and the 'new' parameters. If the change can be
+        applied in place, the commands generated by the modify-X translator are
+        executed. Otherwise the object is replaced by remove-X and add-X requests.
+        The database keeps the new object as it was added by the add-X request,
+        so the following remove-X request reverts it properly.
+
+        :param req:         Request name.
+        :param params:      Request parameters: {'old': {...}, 'new': {...}}.
+
+        :returns: Status codes dictionary.
+        """
+        add_req    = req.replace('modify-', 'add-')
+        remove_req = req.replace('modify-', 'remove-')
+        old_key    = self._extract_request_key(remove_req, params['old'])
+
+        (cmd_list , req_key , _) = self._translate(req, params)
+
+        # In-place modification is possible for running router only,
+        # as otherwise the old object might be not configured.
+        if cmd_list is None or not fwutils.vpp_does_run() or \
+           not self.db_requests.fetch_cmd_list(old_key)[1]:
+            fwglobals.log.debug("_call_modify: replace %s" % old_key)
+            self._call_simple(remove_req, params['old'])
+            self._call_simple(add_req, params['new'])
+            return {'ok':1}
+
+        self._execute(req, req_key, cmd_list)
+
+        (add_cmd_list , _ , _) = self._translate(add_req, params['new'])
+        try:
+            with self.db_requests.transaction():
+                self.db_requests.remove(old_key)
+                self.db_requests.add(req_key, add_req, params['new'], add_cmd_list, True)
+        except Exception as e:
+            fwglobals.log.error("_call_modify(%s) failed to update database: %s, %s" % \
+                        (req_key, str(e), traceback.format_exc()))
+            self._revert(cmd_list, len(cmd_list))
+            raise Exception('failed to update request database')
 
         return {'ok':1}
 
@@ -364,6 +492,11 @@ class FWROUTER_API:
             except KeyError as e:
                 pass
 
+        # Modify requests keep the key of the source request, e.g. 'add-interface'
+        if re.match('modify-', req):
+            cmd_list = func(params)
+            return (cmd_list, self._extract_request_key(req, params['new']), False)
+
         # Handle all the rest but revert requests
         request_key_func = getattr(module, fwrouter_translators[req]['key_func'])
         if params:
@@ -377,6 +510,12 @@ class FWROUTER_API:
 
     def _execute(self, req, req_key, cmd_list, filter=None):
         """Execute request.
+        If none of commands declares dependencies by the 'depends_on' field,
+        the commands are executed one by one in order of list.
+        Otherwise the independent commands are executed concurrently,
+        see _get_cmd_dependencies() for details.
+        In both cases the successive VPP API commands are sent to VPP in batches,
+        see _get_batch_size() for details.
 
         :param req:         Request name.
         :param req_key:     Request key.
@@ -387,69 +526,322 @@ class FWROUTER_API:
         """
         cmd_cache = {}
 
-        fwglobals.log.debug("FWROUTER_API: === start execution of %s (key=%s) ===" % (req, req_key))
+        fwglobals.log.debug("FWROUTER_API: === start execution of %s (key=%s) ===", req, req_key)
 
-        for idx, t in enumerate(cmd_list):      # 't' stands for command Tuple, though it is Python Dictionary :)
-            cmd = t['cmd']
+        deps = self._get_cmd_dependencies(cmd_list)
+        if deps:
+            self._execute_parallel(req, req_key, cmd_list, deps, cmd_cache, filter)
+            fwglobals.log.debug("FWROUTER_API: === end execution of %s (key=%s) ===", req, req_key)
+            return
 
-            # If precondition exists, ensure that it is OK
-            if 'precondition' in t:
-                precondition = t['precondition']
-                reply = fwglobals.g.handle_request(precondition['name'], precondition.get('params'), result)
-                if reply['ok'] == 0:
-                    fwglobals.log.debug("FWROUTER_API:_execute: %s: escape as precondition is not met: %s" % (cmd['descr'], precondition['descr']))
-                    continue
+        idx = 0
+        while idx < len(cmd_list):
+            t = cmd_list[idx]                   # 't' stands for command Tuple, though it is Python Dictionary :)
+            batch_size = self._get_batch_size(cmd_list, idx, filter)
+            try:
+                if batch_size > 1:
+                    self._execute_batch(cmd_list[idx:idx+batch_size], cmd_cache)
+                else:
+                    self._execute_cmd(t, cmd_cache, filter)
+                idx += batch_size
+            except Exception as e:
+                fwglobals.log.debug("FWROUTER_API: === failed execution of %s (key=%s) ===", req, req_key)
+                # On failure go back to the begining of list and revert executed commands.
+                self._revert(cmd_list, idx)
+                fwglobals.log.debug("FWROUTER_API: === finished revert of %s (key=%s) ===", req, req_key)
+                raise e
 
-            # If filter was provided, execute only commands that have the provided filter
-            if filter:
-                if not 'filter' in cmd or cmd['filter'] != filter:
-                    fwglobals.log.debug("FWROUTER_API:_execute: filter out command by filter=%s (req=%s, req_key=%s, cmd=%s, cmd['filter']=%s, params=%s)" %
-                                        (filter, req, req_key, cmd['name'], str(cmd.get('filter')), str(cmd.get('params'))))
-                    continue
+        fwglobals.log.debug("FWROUTER_API: === end execution of %s (key=%s) ===", req, req_key)
 
-            try:
-                # Firstly perform substitutions if needed.
-                # The params might include 'substs' key with list of substitutions.
-                self._substitute(cmd_cache, cmd.get('params'))
+    def _execute_cmd(self, t, cmd_cache, filter=None):
+        """Execute command tuple.
+
+        :param t:           Command tuple.
+        :param cmd_cache:   Cache of values returned by commands of request.
+        :param filter:      Filter.
 
+        :returns: 'True' if command was executed, 'False' if it was skipped
+                  due to filter or unmet precondition.
+        """
+        cmd = t['cmd']
+
+        # If precondition exists, ensure that it is OK
+        if 'precondition' in t:
+            precondition = t['precondition']
+            reply = fwglobals.g.handle_request(precondition['name'], precondition.get('params'))
+            if reply['ok'] == 0:
+                fwglobals.log.debug("FWROUTER_API:_execute: %s: escape as precondition is not met: %s", cmd['descr'], precondition['descr'])
+                return False
+
+        # If filter was provided, execute only commands that have the provided filter
+        if filter:
+            if not 'filter' in cmd or cmd['filter'] != filter:
+                fwglobals.log.debug("FWROUTER_API:_execute: filter out command by filter=%s (cmd=%s, cmd['filter']=%s, params=%s)",
+                                    filter, cmd['name'], cmd.get('filter'), cmd.get('params'))
+                return False
+
+        try:
+            # Firstly perform substitutions if needed.
+            # The params might include 'substs' key with list of substitutions.
+            self._substitute(cmd_cache, cmd.get('params'))
+
+            if fwglobals.log.is_enabled(Fwlog.FWLOG_LEVEL_DEBUG):   # Don't dump params if they are not logged
                 if 'params' in cmd and type(cmd['params'])==dict:
                     params = fwutils.yaml_dump(cmd['params'])
                 elif 'params' in cmd:
                     params = format(cmd['params'])
                 else:
                     params = ''
-                fwglobals.log.debug("FWROUTER_API:_execute: %s(%s)" % (cmd['name'], params))
+                fwglobals.log.debug("FWROUTER_API:_execute: %s(%s)", cmd['name'], params)
 
-                # Now execute command
-                result = None if not 'cache_ret_val' in cmd else \
-                    { 'result_attr' : cmd['cache_ret_val'][0] , 'cache' : cmd_cache , 'key' :  cmd['cache_ret_val'][1] }
-                reply = fwglobals.g.handle_request(cmd['name'], cmd.get('params'), result)
-                if reply['ok'] == 0:        # On failure go back revert already executed commands
-                    fwglobals.log.debug("FWROUTER_API: %s failed ('ok' is 0)" % cmd['name'])
-                    raise Exception("API failed: %s" % reply['message'])
+            # Now execute command
+            result = None if not 'cache_ret_val' in cmd else \
+                { 'result_attr' : cmd['cache_ret_val'][0] , 'cache' : cmd_cache , 'key' :  cmd['cache_ret_val'][1] }
+            reply = fwglobals.g.handle_request(cmd['name'], cmd.get('params'), result)
+            if reply['ok'] == 0:        # On failure go back revert already executed commands
+                fwglobals.log.debug("FWROUTER_API: %s failed ('ok' is 0)" % cmd['name'])
+                raise Exception("API failed: %s" % reply['message'])
 
+        except Exception as e:
+            err_str = "_execute: %s(%s) failed: %s, %s" % (cmd['name'], format(cmd.get('params')), str(e), traceback.format_exc())
+            fwglobals.log.error(err_str)
+            raise Exception('failed to ' + cmd['descr'])
+
+        # At this point the execution succeeded.
+        # Now substitute the revert command, as it will be needed for complement request, e.g. for remove-tunnel.
+        if 'revert' in t and 'params' in t['revert']:
+            try:
+                self._substitute(cmd_cache, t['revert'].get('params'))
             except Exception as e:
-                err_str = "_execute: %s(%s) failed: %s, %s" % (cmd['name'], format(cmd.get('params')), str(e), traceback.format_exc())
-                fwglobals.log.error(err_str)
-                fwglobals.log.debug("FWROUTER_API: === failed execution of %s (key=%s) ===" % (req, req_key))
-                # On failure go back to the begining of list and revert executed commands.
-                self._revert(cmd_list, idx)
-                fwglobals.log.debug("FWROUTER_API: === finished revert of %s (key=%s) ===" % (req, req_key))
-                raise Exception('failed to ' + cmd['descr'])
+                fwglobals.log.excep("_execute: failed to substitute revert command: %s, %s" % \
+                            (str(e), traceback.format_exc()))
+                raise e
+        return True
+
+    def _get_batch_size(self, cmd_list, idx, filter=None, deps=None, pending=None, finished=None):
+        """Get number of successive commands starting at the index, that can be
+        sent to VPP in one batch, see VPP_API.call_batch(). These are VPP API
+        commands without preconditions, which substitutions do not use values
+        returned by preceding commands of the batch, as substitutions are made
+        before the batch is sent. The substitution function is called with
+        value stored by command out of the batch, so it does not depend
+        on results of commands of the batch.
+        On concurrent execution the command joins the batch only if it was
+        not started yet and all commands it depends on were finished or
+        precede it in the batch.
 
-            # At this point the execution succeeded.
-            # Now substitute the revert command, as it will be needed for complement request, e.g. for remove-tunnel.
+        :param cmd_list:    Commands list.
+        :param idx:         Index of the first command of batch.
+        :param filter:      Filter. The filtered execution is not batched.
+        :param deps:        Dependencies, see _get_cmd_dependencies(), if commands
+                            are executed concurrently.
+        :param pending:     Indexes of commands that were not started yet.
+        :param finished:    Set of indexes of finished commands.
+
+        :returns: Number of commands in batch, 1 stands for no batch.
+        """
+        if filter:
+            return 1
+        produced = set()    # cache keys of values returned by commands of batch
+        size     = 0
+        for (i, t) in enumerate(cmd_list[idx:], idx):
+            cmd    = t['cmd']
+            params = cmd.get('params')
+            if fwglobals.request_handlers.get(cmd['name']) != '_call_vpp_api' or \
+               'precondition' in t or (params is not None and type(params) != dict):
+                break
+            if deps and i > idx and \
+               (not i in pending or [d for d in deps[i] if not d in finished and d < idx]):
+                break
+            substs = params.get('substs', []) if params else []
+            if [s for s in substs if s.get('val_by_key', s.get('arg_by_key')) in produced]:
+                break
+            if 'cache_ret_val' in cmd:
+                produced.add(cmd['cache_ret_val'][1])
+            size += 1
+        return max(size, 1)
+
+    def _execute_batch(self, cmd_list, cmd_cache):
+        """Execute VPP API commands in one batch.
+        As all commands of batch are sent to VPP before their replies are
+        received, on failure the succeeded commands of batch are reverted,
+        including those that follow the failed command.
+
+        :param cmd_list:    Commands list, see _get_batch_size().
+        :param cmd_cache:   Cache of values returned by commands of request.
+
+        :returns: None.
+        """
+        calls = []
+        for t in cmd_list:
+            cmd = t['cmd']
+            self._substitute(cmd_cache, cmd.get('params'))
+            fwglobals.log.debug("FWROUTER_API:_execute: %s(%s) (batch)", cmd['name'], cmd.get('params'))
+            result = None if not 'cache_ret_val' in cmd else \
+                { 'result_attr' : cmd['cache_ret_val'][0] , 'cache' : cmd_cache , 'key' :  cmd['cache_ret_val'][1] }
+            calls.append((cmd['name'], cmd.get('params'), result))
+
+        with fwmetrics.timer('commands', 'vpp_batch'):
+            replies = self.vpp_api.call_batch(calls)
+
+        # Substitute the revert commands of succeeded commands, as they will be
+        # needed for complement request or for revert of batch on failure
+        executed = [t for (t, reply) in zip(cmd_list, replies) if reply['ok'] == 1]
+        for t in executed:
             if 'revert' in t and 'params' in t['revert']:
-                try:
-                    self._substitute(cmd_cache, t['revert'].get('params'))
-                except Exception as e:
-                    fwglobals.log.excep("_execute: failed to substitute revert command: %s, %s" % \
-                                (str(e), traceback.format_exc()))
-                    fwglobals.log.debug("FWROUTER_API: === failed execution of %s (key=%s) ===" % (req, req_key))
-                    self._revert(cmd_list, idx)
-                    raise e
+                self._substitute(cmd_cache, t['revert'].get('params'))
+
+        failed = [t for (t, reply) in zip(cmd_list, replies) if reply['ok'] == 0]
+        if failed:
+            for t in failed:
+                fwglobals.log.error("_execute: %s(%s) failed in batch" % (t['cmd']['name'], format(t['cmd'].get('params'))))
+            self._revert(executed, len(executed))
+            raise Exception('failed to ' + failed[0]['cmd']['descr'])
+
+    def _get_cmd_dependencies(self, cmd_list):
+        """Build dependencies between commands of list.
+        The command might declare commands it depends on by the 'depends_on'
+        field - list of values of the 'id' field of preceding commands:
 
-        fwglobals.log.debug("FWROUTER_API: === end execution of %s (key=%s) ===" % (req, req_key))
+            cmd['cmd']['id']         = 'vpp_startup_conf'
+            cmd['cmd']['depends_on'] = [ 'vpp_startup_conf' ]
+
+        In addition the command depends on the preceding commands that store
+        values in cache used by substitutions of the command, see 'cache_ret_val'
+        and 'substs', and on the last preceding command without 'depends_on'.
+        The command without 'depends_on' depends on all preceding commands,
+        so translators that do not declare dependencies are executed in order.
+
+        :param cmd_list:    Commands list.
+
+        :returns: List of sets of indexes of commands every command depends on,
+                  or None if no command declares dependencies.
+        """
+        if not [t for t in cmd_list if 'depends_on' in t['cmd']]:
+            return None
+
+        deps      = []
+        ids       = {}      # value of 'id' -> index of command
+        producers = {}      # cache key -> index of command that stores it
+        barrier   = set()   # index of the last command without 'depends_on'
+        for idx, t in enumerate(cmd_list):
+            cmd = t['cmd']
+            if 'depends_on' in cmd:
+                cmd_deps = set(barrier)
+                for dep_id in cmd['depends_on']:
+                    if not dep_id in ids:
+                        raise Exception("_get_cmd_dependencies: '%s' depends on unknown command '%s'" % (cmd['descr'], dep_id))
+                    cmd_deps.add(ids[dep_id])
+                keys = self._get_substs_keys(cmd.get('params'))
+                if 'revert' in t:
+                    keys += self._get_substs_keys(t['revert'].get('params'))
+                for key in keys:
+                    if key in producers:
+                        cmd_deps.add(producers[key])
+            else:
+                cmd_deps = set(range(idx))
+                barrier  = set([idx])
+            deps.append(cmd_deps)
+            if 'id' in cmd:
+                ids[cmd['id']] = idx
+            if 'cache_ret_val' in cmd:
+                producers[cmd['cache_ret_val'][1]] = idx
+        return deps
+
+    def _get_substs_keys(self, params):
+        """Get cache keys used by substitutions found in params.
+
+        :param params:         Parameters.
+
+        :returns: List of cache keys.
+        """
+        substs = []
+        if type(params)==dict:
+            substs = params.get('substs', [])
+        elif type(params)==list:
+            for p in params:
+                if type(p)==dict and 'substs' in p:
+                    substs = p['substs']
+                    break
+        keys = []
+        for s in substs:
+            for k in ['val_by_key', 'arg_by_key']:
+                if k in s:
+                    keys.append(s[k])
+        return keys
+
+    def _execute_parallel(self, req, req_key, cmd_list, deps, cmd_cache, filter=None):
+        """Execute commands concurrently according dependencies between them.
+        The commands that are ready for execution are run on the command pool,
+        except one that is run by the current thread. If the latter is VPP API
+        command, it is sent to VPP in one batch with the successive VPP API
+        commands that depend on it only, see _get_batch_size(). On failure no more
+        commands are started, the running commands are waited for and
+        the executed commands are reverted in the reverse order of their
+        completion, which respects dependencies between them.
+
+        :param req:         Request name.
+        :param req_key:     Request key.
+        :param cmd_list:    Commands list.
+        :param deps:        Dependencies, see _get_cmd_dependencies().
+        :param cmd_cache:   Cache of values returned by commands of request.
+        :param filter:      Filter.
+
+        :returns: None.
+        """
+        done_q    = Queue.Queue()
+        pending   = range(len(cmd_list))
+        finished  = set()
+        executed  = []      # Command tuples in order of completion
+        in_flight = 0
+        error     = None
+
+        while pending or in_flight:
+            if not error:
+                ready = [idx for idx in pending if deps[idx] <= finished]
+                batch = []
+                if ready:
+                    batch_size = self._get_batch_size(cmd_list, ready[0], filter, deps, pending, finished)
+                    batch = range(ready[0], ready[0] + batch_size)
+                pending = [idx for idx in pending if not idx in ready and not idx in batch]
+                for idx in ready:
+                    if idx in batch:
+                        continue
+                    in_flight += 1
+                    self.cmd_pool.submit(self._execute_cmd, (cmd_list[idx], cmd_cache, filter),
+                        lambda ret, exc, idx=idx: done_q.put((idx, ret, exc)))
+                if len(batch) > 1:
+                    in_flight += len(batch)
+                    try:
+                        self._execute_batch([cmd_list[idx] for idx in batch], cmd_cache)
+                        for idx in batch:
+                            done_q.put((idx, True, None))
+                    except Exception as e:
+                        in_flight -= len(batch) - 1     # Failed batch is reported once
+                        done_q.put((batch[0], None, e))
+                elif batch:
+                    in_flight += 1
+                    try:
+                        done_q.put((batch[0], self._execute_cmd(cmd_list[batch[0]], cmd_cache, filter), None))
+                    except Exception as e:
+                        done_q.put((batch[0], None, e))
+            if not in_flight:
+                break
+
+            (idx, ret, exc) = done_q.get()
+            in_flight -= 1
+            if exc:
+                error = error or exc
+                continue
+            finished.add(idx)
+            if ret:
+                executed.append(cmd_list[idx])
+
+        if error:
+            fwglobals.log.debug("FWROUTER_API: === failed execution of %s (key=%s) ===", req, req_key)
+            self._revert(executed, len(executed))
+            fwglobals.log.debug("FWROUTER_API: === finished revert of %s (key=%s) ===", req, req_key)
+            raise error
 
     def _revert(self, cmd_list, idx_failed_cmd=-1):
         """Revert commands.
@@ -502,25 +894,40 @@ class FWROUTER_API:
             raise Exception('failed to update request database')
 
     def _start_threads(self):
-        """Start all threads.
+        """Start all periodic tasks.
+        The watchdog and tunnel probing might block for long time,
+        so they are run on worker threads of scheduler.
         """
-        if self.thread_watchdog is None:
-            self.thread_watchdog = threading.Thread(target=self.watchdog, name='Watchdog Thread')
-            self.thread_watchdog.start()
-        if self.thread_tunnel_stats is None:
-            self.thread_tunnel_stats = threading.Thread(target=self.tunnel_stats_thread, name='Tunnel Stats Thread')
-            self.thread_tunnel_stats.start()
+        scheduler = fwglobals.g.scheduler
+        if self.task_watchdog is None:
+            self.task_watchdog = scheduler.add_task('watchdog', self.watchdog, 1, offload=True)
+            fwglobals.g.vpp_monitor.subscribe(self._on_vpp_state)
+        if self.task_tunnel_stats is None:
+            self._fill_tunnel_stats_dict()
+            self.task_tunnel_stats = scheduler.add_task('tunnel stats', self.tunnel_stats, 1, offload=True)
+
+    def _on_vpp_state(self, vpp_pid):
+        """VPP state change callback.
+        Runs watchdog immediately on VPP exit instead of waiting for its period.
+
+        :param vpp_pid:  Pid of the new VPP process or None if VPP exited.
+        """
+        task_watchdog = self.task_watchdog
+        if vpp_pid is None and task_watchdog:
+            fwglobals.g.scheduler.run_task_now(task_watchdog)
 
     def _stop_threads(self):
-        """Stop all threads.
+        """Stop all periodic tasks.
         """
-        if self.thread_watchdog:
-            self.thread_watchdog.join()
-            self.thread_watchdog = None
+        scheduler = fwglobals.g.scheduler
+        if self.task_watchdog:
+            fwglobals.g.vpp_monitor.unsubscribe(self._on_vpp_state)
+            scheduler.remove_task(self.task_watchdog)
+            self.task_watchdog = None
 
-        if self.thread_tunnel_stats:
-            self.thread_tunnel_stats.join()
-            self.thread_tunnel_stats = None
+        if self.task_tunnel_stats:
+            scheduler.remove_task(self.task_tunnel_stats)
+            self.task_tunnel_stats = None
 
     def _start_router(self, req, params):
         """Start and configure VPP.
@@ -571,7 +978,7 @@ class FWROUTER_API:
             raise e
 
         # On successful start reset the failure mark and
-        # run the watchdog thread, if it doesn't run
+        # run the watchdog task, if it doesn't run
         self.router_started = True
         self._start_threads()
         self._unset_router_failure()
@@ -586,8 +993,8 @@ class FWROUTER_API:
 
         :returns: None.
         """
-        # Firstly stop the watchdog thread to avoid race
-        # on restoring vpp by it, when the current thread stops vpp on purpose 
+        # Firstly stop the watchdog task to avoid race
+        # on restoring vpp by it, when the current thread stops vpp on purpose
         self.router_started = False 
         self._stop_threads()
         fwutils.reset_dhcpd()
@@ -609,8 +1016,11 @@ class FWROUTER_API:
 
     def _create_remove_tunnels_request(self, params):
         """Creates a list of remove-tunnel requests for all tunnels
-           that are connected to interfaces that are either modified
-           or unassigned.
+           that are connected to interfaces that are either unassigned,
+           or which address is modified, or which are replaced by
+           remove-interface and add-interface, as the modification can't
+           be done in place, see _call_modify(). Tunnels of interfaces that
+           are modified in place and keep their address are not touched.
 
         :param params:          modify-device request parameters.
 
@@ -620,6 +1030,8 @@ class FWROUTER_API:
         # Get the pci address of all changed interfaces
         interfaces = [] if 'modify_router' not in params else params['modify_router'].get('unassign', [])
         interfaces += [] if 'modify_interfaces' not in params else params['modify_interfaces'].get('interfaces', [])
+        new_ifcs = {} if 'modify_interfaces' not in params else \
+            {ifc['pci']: ifc for ifc in params['modify_interfaces'].get('interfaces', [])}
         pci_set = set(map(lambda interface: interface['pci'], interfaces))
         ip_set = set()
 
@@ -628,22 +1040,23 @@ class FWROUTER_API:
             try:
                 key = fwtranslate_add_interface.get_request_key({'pci': pci})
                 (req, entry) = self.db_requests.fetch_request(key)
-                if entry != None:
+                if entry == None:
+                    continue
+                new_ifc = new_ifcs.get(pci)
+                if new_ifc is None or entry['addr'] != new_ifc.get('addr') or \
+                   fwtranslate_add_interface.modify_interface({'old': entry, 'new': new_ifc}) is None:
                     ip_set.add(entry['addr'].split('/')[0])
 
             except Exception as e:
                 fwglobals.log.excep("failed to create remove-tunnel requests list %s" % str(e))
                 raise e
 
-        # Go over all tunnels in the database and add every tunnel
-        # which src field exists in the IP addresses set
+        # Fetch tunnels which src field exists in the IP addresses set
         tunnels_requests = []
-        for key in self.db_requests.db:
+        for ip in ip_set:
             try:
-                if re.match('add-tunnel', key):
-                    (req, entry) = self.db_requests.fetch_request(key)
-                    if entry['src'] in ip_set:
-                        tunnels_requests.append({'remove-tunnel': {'tunnel-id': entry['tunnel-id']}})
+                for (_, entry) in self.db_requests.fetch_requests('add-tunnel', src=ip):
+                    tunnels_requests.append({'remove-tunnel': {'tunnel-id': entry['tunnel-id']}})
             except Exception as e:
                 fwglobals.log.excep("failed to create remove-tunnel requests list %s" % str(e))
                 raise e
@@ -680,43 +1093,57 @@ class FWROUTER_API:
         if 'modify_dhcp_config' in params:
             requests += self._create_modify_dhcp_config_request(params['modify_dhcp_config'])
 
+        # The router is stopped and started out of transaction, as its state
+        # can't be rolled back together with the DB. If modification fails,
+        # the stopped router is started again to match the restored DB.
+        if should_restart_router == True:
+            self._stop_router("stop-router", {})
         try:
+            with self.db_requests.transaction():
+                self._call_aggregated(requests)
+        except Exception as e:
+            fwglobals.log.excep("_modify_device: %s" % str(e))
             if should_restart_router == True:
-                self._stop_router("stop-router", {})
+                try:
+                    self._start_router("start-router", {})
+                except Exception as e2:
+                    fwglobals.log.excep("_modify_device: failed to start router back: %s" % str(e2))
+            raise e
 
-            self._call_aggregated(requests)
+        if should_restart_router == True:
+            self._start_router("start-router", {})
 
-            if should_restart_router == True:
-                self._start_router("start-router", {})
-        except Exception as e:
-                fwglobals.log.excep("_modify_device: %s" % str(e))
-                raise e
+        self._restore_routes(map(lambda interface: interface['addr'], interfaces))
+        return {'ok':1}
 
-        # Modifying interfaces might result in removal of static routes,
-        # which can affect the agent's ability to reconnect to the MGMT
-        # (if default route or any other route the agent uses to connect to
-        # the MGMT was removed). In order to overcome this, we try to restore
-        # the lost routes. Since this is a best effort solution, we don't return
-        # error if we fail to restore a route.
-        changed_ips = map(lambda interface: interface['addr'], interfaces)
+    def _restore_routes(self, changed_ips):
+        """Re-apply static routes that go via modified interfaces.
+        Modifying interfaces might result in removal of static routes,
+        which can affect the agent's ability to reconnect to the MGMT
+        (if default route or any other route the agent uses to connect to
+        the MGMT was removed). In order to overcome this, we try to restore
+        the lost routes. Since this is a best effort solution, we don't return
+        error if we fail to restore a route.
+
+        :param changed_ips:     List of addresses of modified interfaces.
+
+        :returns: None.
+        """
         if len(changed_ips) > 0:
-            for key in self.db_requests.db:
+            for (key, route) in self.db_requests.fetch_requests('add-route'):
                 try:
-                    if re.match('add-route', key):
-                        next_hop_ip = self.db_requests.db[key]['params']['via']
-                        if(any([fwutils.is_ip_in_subnet(next_hop_ip, subnet) for subnet in changed_ips])):
-                            fwglobals.log.info('restoring static route: ' + str(key))
-                            self._apply_db_request(key)
+                    next_hop_ip = route['via']
+                    if(any([fwutils.is_ip_in_subnet(next_hop_ip, subnet) for subnet in changed_ips])):
+                        fwglobals.log.info('restoring static route: ' + str(key))
+                        self._apply_db_request(key)
                 except Exception as e:
-                    fwglobals.log.excep("_modify_device: failed to restore static routes %s" % str(e))
+                    fwglobals.log.excep("_restore_routes: failed to restore static routes %s" % str(e))
                     pass
 
-        return {'ok':1}
-
     def _create_modify_interfaces_request(self, params):
         """'modify-interface' pre-processing:
-        This command is a wrapper around the 'add-interface' and 'remove-interface' commands.
-        To modify the interface we simply remove the interface and add the it with the new configuration.
+        Existing interfaces are modified by 'modify-interface' requests,
+        not existing interfaces are added by 'add-interface' requests.
 
         :param params:          Request parameters.
 
@@ -726,17 +1153,19 @@ class FWROUTER_API:
 
         if params:
             for interface in params['interfaces']:
-                # Remove interface only if it exists in the database
-                if self._get_request_params_from_db('remove-interface', interface):
-                    modify_interface_requests.append({'remove-interface': interface})
-                modify_interface_requests.append({'add-interface': interface})
+                old_interface = self._get_request_params_from_db('remove-interface', interface)
+                if old_interface:
+                    modify_interface_requests.append({'modify-interface': {'old': old_interface, 'new': interface}})
+                else:
+                    modify_interface_requests.append({'add-interface': interface})
 
         return modify_interface_requests
 
     def _create_modify_routes_request(self, params):
         """'modify-route' pre-processing:
-        This command is a wrapper around the 'add-route' and 'remove-route' commands.
-        To modify the route we simply remove the old route and add the new one.
+        This command is a wrapper around the 'add-route', 'remove-route'
+        and 'modify-route' commands. If both old and new routes are provided,
+        the existing route is modified, otherwise the route is removed or added.
 
         :param params:          Request parameters.
 
@@ -751,16 +1180,21 @@ class FWROUTER_API:
                 # Modified routes will have both the 'old_route' and 'new_route'
                 # fields, whereas added/removed routes will only have the 'new_route'
                 # or 'old_route' fields.
+                old_route = None
                 if route['old_route'] != '':
                     remove_route_params = {k:v for k,v in route.items() if k not in ['new_route']}
                     remove_route_params['via'] = remove_route_params.pop('old_route')
-                    # Remove route only if it exists in the database
-                    if self._get_request_params_from_db('remove-route', remove_route_params):
-                        modify_route_requests.append({'remove-route': remove_route_params})
+                    old_route = self._get_request_params_from_db('remove-route', remove_route_params)
 
                 if route['new_route'] != '':
                     add_route_params = {k:v for k,v in route.items() if k not in ['old_route']}
                     add_route_params['via'] = add_route_params.pop('new_route')
+
+                if old_route and route['new_route'] != '':
+                    modify_route_requests.append({'modify-route': {'old': old_route, 'new': add_route_params}})
+                elif old_route:     # Remove route only if it exists in the database
+                    modify_route_requests.append({'remove-route': remove_route_params})
+                elif route['new_route'] != '':
                     modify_route_requests.append({'add-route': add_route_params})
                 
         return modify_route_requests
@@ -801,14 +1235,124 @@ class FWROUTER_API:
 
         if params:
             for config in params['dhcp_configs']:
-                # Remove dhcp config only if it exists in the database
-                if self._get_request_params_from_db('remove-dhcp-config', config):
-                    modify_requests.append({'remove-dhcp-config': config})
-                modify_requests.append({'add-dhcp-config': config})
+                old_config = self._get_request_params_from_db('remove-dhcp-config', config)
+                if old_config:
+                    modify_requests.append({'modify-dhcp-config': {'old': old_config, 'new': config}})
+                else:
+                    modify_requests.append({'add-dhcp-config': config})
 
         return modify_requests
 
 
+    def _handle_sync_device_request(self, params):
+        """Handle sync-device request.
+        The request brings the complete desired configuration of device
+        in format of 'get-router-config' reply:
+
+            { 'requests': [
+                { 'message': 'add-interface', 'params': {...} },
+                { 'message': 'add-tunnel',    'params': {...} },
+                ...
+            ] }
+
+        The desired configuration is compared with configuration stored in
+        the request database by request keys. The objects that are absent
+        in the desired configuration are removed, the new objects are added
+        and the changed objects are modified. Unchanged objects are not touched.
+        All changes are applied as one aggregated request.
+
+        :param params:          Request parameters.
+
+        :returns: Status code.
+        """
+        (requests, changed_ips) = self._create_sync_device_requests(params)
+        if not requests:
+            fwglobals.log.debug("_sync_device: configuration is in sync, nothing to do")
+            return {'ok':1}
+
+        try:
+            self._call_aggregated(requests)
+        except Exception as e:
+            fwglobals.log.excep("_sync_device: %s" % str(e))
+            raise e
+
+        self._restore_routes(changed_ips)
+        return {'ok':1}
+
+    def _create_sync_device_requests(self, params):
+        """Build list of add-X, modify-X and remove-X requests that bring
+        configuration stored in the request database into the desired configuration.
+        The remove-X requests go first in order reverse to dependencies between
+        objects, e.g. tunnels are removed before interfaces. The modify-X and
+        add-X requests follow in order of dependencies. Tunnels can't be modified,
+        so changed tunnels are replaced. As change of interface address affects
+        tunnels that use it, such tunnels are replaced too.
+
+        :param params:          sync-device request parameters.
+
+        :returns: Tuple of list of requests and list of addresses
+                  of added and modified interfaces.
+        """
+        sync_requests = ['add-interface', 'add-tunnel', 'add-route', 'add-dhcp-config']
+        ignore_params = {                  # Parameters added to DB by translators
+            'add-interface':   ['driver'],
+            'add-dhcp-config': ['is_add']
+        }
+
+        desired = {}
+        for r in params.get('requests', []):
+            req = r['message']
+            if not req in sync_requests:
+                raise Exception("_sync_device: not supported request '%s'" % req)
+            key = self._extract_request_key(req.replace('add-', 'remove-'), r['params'])
+            desired[key] = (req, r['params'])
+
+        to_remove = {req: [] for req in sync_requests}
+        to_modify = {req: [] for req in sync_requests}
+        to_add    = {req: [] for req in sync_requests}
+        for req in sync_requests:
+            for (key, db_params) in self.db_requests.fetch_requests(req):
+                if not key in desired:
+                    to_remove[req].append(db_params)
+                    continue
+                new_params = desired[key][1]
+                old_params = {k:v for k,v in db_params.items() \
+                              if not (k in ignore_params.get(req, []) and not k in new_params)}
+                if old_params != new_params:
+                    if req == 'add-tunnel':
+                        to_remove[req].append(db_params)
+                        to_add[req].append(new_params)
+                    else:
+                        to_modify[req].append({'old': db_params, 'new': new_params})
+                del desired[key]
+        for (req, new_params) in desired.values():
+            to_add[req].append(new_params)
+
+        # Replace tunnels that use removed interfaces or interfaces with modified address
+        old_ips = set([ifc['addr'].split('/')[0] for ifc in to_remove['add-interface']])
+        changed_ips = [ifc['addr'] for ifc in to_add['add-interface']]
+        for m in to_modify['add-interface']:
+            if m['old']['addr'] != m['new']['addr']:
+                old_ips.add(m['old']['addr'].split('/')[0])
+                changed_ips.append(m['new']['addr'])
+        for (key, tunnel) in self.db_requests.fetch_requests('add-tunnel'):
+            if tunnel['src'] in old_ips and not tunnel in to_remove['add-tunnel']:
+                to_remove['add-tunnel'].append(tunnel)
+                to_add['add-tunnel'].append(tunnel)
+
+        requests = []
+        for req in reversed(sync_requests):
+            requests += [{req.replace('add-', 'remove-'): p} for p in to_remove[req]]
+        for req in sync_requests:
+            requests += [{req.replace('add-', 'modify-'): p} for p in to_modify[req]]
+            requests += [{req: p} for p in to_add[req]]
+
+        fwglobals.log.info("_sync_device: %d requests to remove, %d requests to modify, %d requests to add" %
+            (sum([len(l) for l in to_remove.values()]), sum([len(l) for l in to_modify.values()]),
+             sum([len(l) for l in to_add.values()])))
+        return (requests, changed_ips)
+
+
     def _set_router_failure(self, err_str):
         """Set router failure state.
 
@@ -859,41 +1403,38 @@ class FWROUTER_API:
         """
         try:
             # Firstly configure interfaces
-            for key in self.db_requests.db:
-                if re.match('add-interface', key):
-                    self._apply_db_request(key)
+            for key in self.db_requests.fetch_keys('add-interface'):
+                self._apply_db_request(key)
 
             # Configure tunnels
-            for key in self.db_requests.db:
-                if re.match('add-tunnel', key):
-                    self._apply_db_request(key)
-                    self._fill_tunnel_stats_dict()
+            self._apply_db_tunnels(self.db_requests.fetch_keys('add-tunnel'))
+            self._fill_tunnel_stats_dict()
 
             # Configure routes
             # Do that after routes, as routes might use tunnels!
-            for key in self.db_requests.db:
-                if re.match('add-route', key):
-                    self._apply_db_request(key)
+            for key in self.db_requests.fetch_keys('add-route'):
+                self._apply_db_request(key)
 
             # Configure dhcp server
-            for key in self.db_requests.db:
-                if re.match('add-dhcp-config', key):
-                    self._apply_db_request(key)
+            for key in self.db_requests.fetch_keys('add-dhcp-config'):
+                self._apply_db_request(key)
 
         except Exception as e:
             err_str = "_apply_router_config failed: %s" % str(e)
             fwglobals.log.excep(err_str)
             raise e
 
-    def _apply_db_request(self, key):
+    def _apply_db_request(self, key, cmd_list=None):
         """Apply DB request.
 
         :param key:          Request key.
+        :param cmd_list:     Commands of request. If not provided, the request is translated.
 
-        :returns: None.
+        :returns: Request parameters.
         """
         (req, params) = self.db_requests.fetch_request(key)
-        (cmd_list,_,_) = self._translate(req, params)
+        if cmd_list is None:
+            (cmd_list,_,_) = self._translate(req, params)
         self._execute(req, key, cmd_list)
         try:
             self.db_requests.update(key, req, params, cmd_list, executed=True)
@@ -901,6 +1442,26 @@ class FWROUTER_API:
             fwglobals.log.error("_apply_router_config: failed to update DB: %s" % str(e))
             self._revert(cmd_list)
             raise e
+        return params
+
+    def _apply_db_tunnels(self, keys):
+        """Apply DB add-tunnel requests the way _call_add_tunnels() does:
+        the lookups are shared by translations of tunnels and the FRR is
+        restarted once after all tunnels were configured.
+
+        :param keys:         Keys of add-tunnel requests.
+
+        :returns: None.
+        """
+        lookups     = {}
+        params_list = []
+        for key in keys:
+            (_, params) = self.db_requests.fetch_request(key)
+            cmd_list = fwtranslate_add_tunnel.add_tunnel(params, restart_frr=False, lookups=lookups)
+            params_list.append(self._apply_db_request(key, cmd_list))
+        cmd_list = fwtranslate_add_tunnel.get_restart_frr_cmd_list(params_list)
+        if cmd_list:
+            self._execute('add-tunnel', 'restart-frr', cmd_list)
 
     # 'substitute' takes parameters in form of list or dictionary and
     # performs substitutions found in params.
@@ -987,7 +1548,8 @@ class FWROUTER_API:
                 func_name = s['val_by_func']
                 func = getattr(fwutils, func_name)
                 old  = s['arg'] if 'arg' in s else cache[s['arg_by_key']]
-                new  = func(old)
+                with fwmetrics.timer('substitutions', func_name):
+                    new  = func(old)
                 if new is None:
                     raise Exception("fwutils.py:substitute: %s failed to map %s in '%s'" % (func, old, format(params)))
             elif 'val_by_key' in s:
@@ -0,0 +1,216 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import heapq
+import itertools
+import os
+import select
+import threading
+import time
+import traceback
+
+import fwglobals
+
+from fwthreadpool import FwThreadPool
+
+class FwScheduler:
+    """This is periodic task scheduler class representation.
+    It runs periodic tasks of agent, like VPP watchdog, tunnel probing,
+    statistics sampling and keep-alive check, out of one thread, instead of
+    thread per task sleeping in loop. The scheduler thread sleeps until
+    the nearest task deadline. Short tasks are run by the scheduler thread
+    itself, blocking tasks are offloaded to the worker pool, so they don't
+    delay other tasks. The same task is never run concurrently: if it is still
+    running when its next deadline comes, the run is skipped.
+
+    :param name:        Name of scheduler to be used in names of threads and in logs.
+    :param num_workers: Number of threads to run blocking tasks on.
+    """
+    def __init__(self, name='scheduler', num_workers=4):
+        """Constructor method
+        """
+        self.name      = name
+        self.tasks     = {}         # Task id -> task
+        self.deadlines = []         # Heap of (deadline, task id)
+        self.ids       = itertools.count(1)
+        self.lock      = threading.Lock()
+        self.done      = threading.Condition(self.lock)
+        self.pool      = FwThreadPool(num_workers, name + '-pool')
+        self.thread    = None
+        self.active    = False
+        (self.wakeup_r, self.wakeup_w) = os.pipe()  # Wakes up scheduler thread on changes
+
+    def finalize(self):
+        """Destructor method
+        """
+        self.stop()
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+
+    def start(self):
+        """Start scheduler thread.
+
+        :returns: None.
+        """
+        with self.lock:
+            if self.thread:
+                return
+            self.active = True
+            self.thread = threading.Thread(target=self._loop, name='Scheduler Thread')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop scheduler thread. Waits for the running tasks to finish.
+
+        :returns: None.
+        """
+        with self.lock:
+            thread = self.thread
+            self.active = False
+            self.thread = None
+        if not thread:
+            return
+        self._wakeup()
+        thread.join()
+        self.pool.finalize()
+
+    def add_task(self, name, func, period, delay=None, offload=False):
+        """Add periodic task.
+
+        :param name:     Name of task to be used in logs.
+        :param func:     Function to run. It gets no arguments.
+        :param period:   Period in seconds.
+        :param delay:    Delay of the first run in seconds. Defaults to the period.
+        :param offload:  If True, the task is run on worker thread, as it might block.
+
+        :returns: Task id to be used for remove_task().
+        """
+        with self.lock:
+            task_id = next(self.ids)
+            self.tasks[task_id] = {
+                'name':    name,
+                'func':    func,
+                'period':  period,
+                'offload': offload,
+                'running': None,    # Thread that runs task right now
+                'deadline': time.time() + (period if delay is None else delay)
+            }
+            heapq.heappush(self.deadlines, (self.tasks[task_id]['deadline'], task_id))
+        self._wakeup()
+        fwglobals.log.debug("FwScheduler: added task %s (id=%d, period=%s)" % (name, task_id, str(period)))
+        return task_id
+
+    def remove_task(self, task_id, wait=True):
+        """Remove periodic task.
+
+        :param task_id:  Task id returned by add_task().
+        :param wait:     If True and the task runs right now, wait for it to finish.
+                         The task that removes itself is not waited for.
+
+        :returns: None.
+        """
+        with self.lock:
+            task = self.tasks.pop(task_id, None)
+            if not task:
+                return
+            me = threading.current_thread()
+            while wait and task['running'] and task['running'] != me:
+                self.done.wait()
+        fwglobals.log.debug("FwScheduler: removed task %s (id=%d)" % (task['name'], task_id))
+
+    def run_task_now(self, task_id):
+        """Run periodic task as soon as possible, e.g. on event that the task
+        should handle. The next runs are scheduled by period from now.
+
+        :param task_id:  Task id returned by add_task().
+
+        :returns: None.
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return
+            task['deadline'] = time.time()
+            heapq.heappush(self.deadlines, (task['deadline'], task_id))
+        self._wakeup()
+
+    def _wakeup(self):
+        os.write(self.wakeup_w, b'x')
+
+    def _loop(self):
+        """Scheduler thread loop: sleep until the nearest deadline, run the
+        tasks which deadline has come, reschedule them and sleep again.
+        The sleep is interrupted by add_task() and stop().
+        """
+        while True:
+            with self.lock:
+                if not self.active:
+                    break
+                now = time.time()
+                ready = []
+                while self.deadlines and self.deadlines[0][0] <= now:
+                    (deadline, task_id) = heapq.heappop(self.deadlines)
+                    task = self.tasks.get(task_id)
+                    if not task or task['deadline'] != deadline:
+                        continue        # Task was removed or rescheduled by run_task_now()
+                    # Keep the period fixed, but don't try to catch up missed runs
+                    next_deadline = deadline + task['period']
+                    if next_deadline <= now:
+                        next_deadline = now + task['period']
+                    task['deadline'] = next_deadline
+                    heapq.heappush(self.deadlines, (next_deadline, task_id))
+                    if task['running']:
+                        fwglobals.log.debug("FwScheduler: %s is still running, skip it" % task['name'])
+                        continue
+                    if task['offload']:
+                        task['running'] = True  # Mark it before it is picked by worker
+                    ready.append(task)
+                timeout = (self.deadlines[0][0] - now) if self.deadlines else None
+
+            for task in ready:
+                if task['offload']:
+                    self.pool.submit(self._run_task, (task,))
+                else:
+                    self._run_task(task)
+
+            (r, _, _) = select.select([self.wakeup_r], [], [], timeout)
+            if r:
+                os.read(self.wakeup_r, 4096)
+
+        # Wait for the offloaded tasks to finish
+        with self.lock:
+            while [t for t in self.tasks.values() if t['running']]:
+                self.done.wait()
+
+    def _run_task(self, task):
+        """Run task and log exception if raised.
+        """
+        with self.lock:
+            task['running'] = threading.current_thread()
+        try:
+            task['func']()
+        except Exception as e:
+            fwglobals.log.error("FwScheduler: %s failed: %s, %s" % (task['name'], str(e), traceback.format_exc()))
+        with self.lock:
+            task['running'] = None
+            self.done.notify_all()
@@ -21,18 +21,36 @@
 ################################################################################
 
 # Handle device statistics
+import fwglobals
 import fwutils
+import threading
 import time
 import loadsimulator
 
+from fwstats_history import FwStatsHistory, IF_FIELDS, TUNNEL_FIELDS
 from fwtunnel_stats import tunnel_stats_get
 
 # Globals
-# Keep updates up to 1 hour ago
+# Keep updates up to 1 hour ago by default,
+# the 'stats_history' configuration parameter overrides it.
 UPDATE_LIST_MAX_SIZE = 120
 
-# Keeps the list of last updates
-updates_list = []
+# Keeps the last updates, it is created on first use, see _get_history().
+# The history is persisted in file, so it survives restart of agent.
+history      = None
+updates_lock = threading.Lock()     # Updates are added by scheduler and fetched by request threads
+fetched_seq  = 0                    # Sequence number of the last update returned without 'since' cursor
+
+# Fields of interface and tunnel statistics in compact encoding, see get_stats()
+COMPACT_IF_FIELDS     = IF_FIELDS
+COMPACT_TUNNEL_FIELDS = TUNNEL_FIELDS
+
+# Interned names of interfaces and tunnels for compact encoding.
+# Names are only appended, so the table is identified by generation and length.
+# The generation is changed on agent start, so the server never uses stale table.
+names_gen   = int(time.time())
+names_list  = []
+names_index = {}
 
 # Keeps the VPP pids
 vpp_pid = ''
@@ -48,6 +66,8 @@ def update_stats():
     global stats
     global vpp_pid
 
+    _get_history()  # Restores state persisted by previous run of agent, including vpp_pid
+
     # If vpp is not running or has crashed (at least one of its process
     # IDs has changed), reset the statistics and update the vpp pids list
     current_vpp_pid = fwutils.vpp_pid()
@@ -56,6 +76,18 @@ def update_stats():
         vpp_pid = current_vpp_pid
 
     new_stats = fwutils.get_vpp_if_count()
+    add_stats(new_stats)
+
+def add_stats(new_stats, tunnel_stats=None, running=None):
+    """Calculate interface counters for the period passed since the previous
+    call and add them to history of updates.
+
+    :param new_stats:     Interface counters as returned by fwutils.get_vpp_if_count().
+    :param tunnel_stats:  Tunnel statistics. If None, the current tunnel statistics are used.
+    :param running:       Router running status. If None, VPP is checked.
+
+    :returns: None.
+    """
     if new_stats['ok'] == 1:
         prev_stats = dict(stats)  # copy of prev stats
         stats['time'] = time.time()
@@ -72,40 +104,125 @@ def update_stats():
                     tx_bytes = 1.0 * (counts['tx_bytes'] - prev_stats_if['tx_bytes'])
                     tx_pkts  = 1.0 * (counts['tx_pkts'] - prev_stats_if['tx_pkts'])
                     if_bytes[intf] = {
-                            'rx_bytes': rx_bytes, 
+                            'rx_bytes': rx_bytes,
                             'rx_pkts': rx_pkts,
-                            'tx_bytes': tx_bytes, 
+                            'tx_bytes': tx_bytes,
                             'tx_pkts': tx_pkts
                         }
 
             stats['bytes'] = if_bytes
-            stats['tunnel_stats'] = tunnel_stats_get()
+            stats['tunnel_stats'] = tunnel_stats if tunnel_stats is not None else tunnel_stats_get()
             stats['period'] = stats['time'] - prev_stats['time']
-            stats['running'] = True if fwutils.vpp_does_run() else False
+            if running is None:
+                running = True if fwutils.vpp_does_run() else False
+            stats['running'] = running
     else:
         stats['ok'] = 0
 
-    # Add the update to the list of updates. If the list is full,
-    # remove the oldest update before pushing the new one
-    if len(updates_list) is UPDATE_LIST_MAX_SIZE:
-        updates_list.pop(0)
-    
-    updates_list.append({
-            'ok': stats['ok'], 
-            'running': stats['running'], 
-            'stats': stats['bytes'], 
+    add_update({
+            'ok': stats['ok'],
+            'running': stats['running'],
+            'stats': stats['bytes'],
             'period': stats['period'],
             'tunnel_stats': stats['tunnel_stats'],
             'utc': time.time()
         })
+    _save_state()
+
+def _get_history():
+    """Get history of updates. Create it on first call, so the configured
+    size is used. On creation the history and the statistics state are
+    loaded out of the history file, so updates collected before restart
+    of agent are served immediately.
+
+    :returns: FwStatsHistory object.
+    """
+    global history
+
+    if not history:
+        with updates_lock:
+            if not history:
+                size     = UPDATE_LIST_MAX_SIZE
+                filename = None
+                if hasattr(fwglobals, 'g'):
+                    size     = fwglobals.g.cfg.STATS_HISTORY_SIZE
+                    filename = fwglobals.g.STATS_HISTORY_FILE
+                new_history = FwStatsHistory(size, filename)
+                _restore_state(new_history.load_state())
+                history = new_history
+    return history
+
+def _restore_state(state):
+    """Restore statistics state saved by _save_state().
+    The last interface counters are restored only if VPP was not restarted
+    since they were saved, as VPP resets counters on restart. In this case
+    the first update after restart of agent has valid statistics already.
 
-def get_stats():
+    :param state: The saved state or None.
+
+    :returns: None.
+    """
+    global fetched_seq
+    global vpp_pid
+
+    if not state:
+        return
+    fetched_seq = state.get('fetched_seq', 0)
+    if state.get('vpp_pid') and state['vpp_pid'] == fwutils.vpp_pid():
+        vpp_pid = state['vpp_pid']
+        stats.update(state['stats'])
+
+def _save_state():
+    """Save statistics state into the history file.
+
+    :returns: None.
+    """
+    _get_history().save_state({
+        'vpp_pid':     vpp_pid,
+        'fetched_seq': fetched_seq,
+        'stats':       {'ok': stats['ok'], 'running': stats['running'],
+                        'time': stats.get('time', 0), 'last': stats['last']}
+    })
+
+def add_update(update):
+    """Add the update to history of updates. If history is full,
+    the oldest update is evicted.
+
+    :param update:   Update dictionary.
+
+    :returns: None.
+    """
+    _get_history().append(update)
+
+def get_stats(params=None):
     """Return a new statistics dictionary.
+    By default the updates that were not returned yet are returned.
+    If 'since' cursor is provided, only updates with sequence number greater
+    than the cursor are returned, so the server can fetch unseen updates only,
+    and fetch again updates that it missed.
+    If compact encoding is requested, the updates are encoded by
+    _encode_compact(), see it for details.
+
+    :param params: Parameters from flexiManage, might be None:
+                   'since'       - sequence number of the last seen update.
+                   'encoding'    - 'compact' for compact encoding.
+                   'names_gen'   - generation of name table known to server.
+                   'names_count' - number of names in table known to server.
 
     :returns: Statistics dictionary.
     """
-    res_update_list = list(updates_list)
-    del updates_list[:]
+    global fetched_seq
+
+    params = params if params else {}
+    since  = params.get('since')
+    with updates_lock:
+        if since is None:
+            since = fetched_seq
+            fetched_seq = _get_history().last_seq()
+    if params.get('since') is None:
+        _save_state()
+    snapshot = _get_history().snapshot(since)
+    last_seq = snapshot.last
 
     # If the list of updates is empty, append a dummy update to 
     # set the most up-to-date status of the router. If not, update
@@ -117,6 +234,12 @@ def get_stats():
     else:
         status = True if fwutils.vpp_does_run() else False
         (state, reason) = fwutils.get_router_state()
+    if params.get('encoding') == 'compact':
+        with updates_lock:  # Protects table of interned names
+            message = _encode_compact(snapshot, last_seq, status, state, reason, params)
+        return {'message': message, 'ok': 1}
+
+    res_update_list = list(snapshot)
     if not res_update_list:
         res_update_list.append({
             'ok': stats['ok'],
@@ -134,7 +257,96 @@ def get_stats():
         res_update_list[-1]['stateReason'] = reason
 
     return {'message': res_update_list, 'ok': 1}
-    
+
+def _intern_name(name):
+    """Get index of name in the table of interned names.
+    """
+    index = names_index.get(name)
+    if index is None:
+        index = len(names_list)
+        names_list.append(name)
+        names_index[name] = index
+    return index
+
+def _compact_number(val):
+    """Convert number into the shortest JSON representation:
+    counters are integers, RTT and drop rate are rounded.
+    """
+    return int(val) if float(val).is_integer() else round(val, 3)
+
+def _encode_compact(updates, last_seq, running, state, reason, params):
+    """Encode updates in compact form.
+    Names of interfaces and tunnels are replaced with indexes in table of
+    interned names. The table is sent only if server does not have it:
+    the server provides generation and length of table that it has,
+    and only names that were added since are sent.
+    Every update is encoded as list of numbers per interface and per tunnel:
+    [<name index>, <field 1>, <field 2>, ...], where fields are listed in
+    COMPACT_IF_FIELDS and COMPACT_TUNNEL_FIELDS. The tunnel status is 1 for
+    'up' and 0 for 'down'. The field values and the 'utc' are deltas from
+    values of the same interface/tunnel in the previous update of the reply.
+    The first appearance of interface/tunnel in reply has absolute values.
+    The reply looks like:
+        {
+            'encoding': 'compact',
+            'names':    {'gen': 1590000000, 'offset': 2, 'list': ['GigabitEthernet0/9/0', '3']},
+            'fields':   {'stats': [..], 'tunnel_stats': [..]},
+            'updates':  [{'seq': 11, 'ok': 1, 'running': True, 'period': 30.0, 'utc': 1590000030.0,
+                          'stats': [[0, 1500, 10, 3000, 20], [2, ..]],
+                          'tunnel_stats': [[3, 1, 12.5, 0]]},
+                         {'seq': 12, .., 'utc': 30.0, 'stats': [[0, 0, 0, -20, 0]], ..}],
+            'seq':      12,
+            'running':  True,
+            'state':    'running',
+            'stateReason': ''
+        }
+
+    :param updates:   List of updates to encode.
+    :param last_seq:  Sequence number of the last update.
+    :param running:   Current running status of router.
+    :param state:     Current state of router.
+    :param reason:    Reason of router state.
+    :param params:    Request parameters.
+
+    :returns: Dictionary with encoded updates.
+    """
+    prev     = {}       # Previous values by name index
+    prev_utc = None
+    encoded  = []
+    for update in updates:
+        enc = {'seq': update['seq'], 'ok': update['ok'], 'running': update['running'],
+               'period': update['period'], 'stats': [], 'tunnel_stats': []}
+        enc['utc'] = round(update['utc'] - (prev_utc if prev_utc else 0), 3)
+        prev_utc = update['utc']
+
+        for (section, fields) in [('stats', COMPACT_IF_FIELDS), ('tunnel_stats', COMPACT_TUNNEL_FIELDS)]:
+            for (name, counters) in update[section].items():
+                index  = _intern_name(str(name))
+                values = []
+                for f in fields:
+                    val = counters.get(f, 0)
+                    if f == 'status':
+                        val = 1 if val == 'up' else 0
+                    values.append(_compact_number(val))
+                prev_values = prev.get(index)
+                prev[index] = values
+                if prev_values:
+                    values = [_compact_number(v - p) for (v, p) in zip(values, prev_values)]
+                enc[section].append([index] + values)
+        encoded.append(enc)
+
+    offset = params.get('names_count', 0) if params.get('names_gen') == names_gen else 0
+    return {
+        'encoding':    'compact',
+        'names':       {'gen': names_gen, 'offset': offset, 'list': names_list[offset:]},
+        'fields':      {'stats': COMPACT_IF_FIELDS, 'tunnel_stats': COMPACT_TUNNEL_FIELDS},
+        'updates':     encoded,
+        'seq':         last_seq,
+        'running':     running,
+        'state':       state,
+        'stateReason': reason
+    }
+
 def update_state(new_state):
     """Update router state field.
 
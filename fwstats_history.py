@@ -0,0 +1,486 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import json
+import mmap
+import os
+import struct
+import threading
+
+from array import array
+
+import fwglobals
+
+# Fields of interface and tunnel samples.
+# The tunnel 'status' is stored as 1 for 'up' and 0 for 'down'.
+IF_FIELDS     = ['rx_bytes', 'rx_pkts', 'tx_bytes', 'tx_pkts']
+TUNNEL_FIELDS = ['status', 'rtt', 'drop_rate']
+
+NAN = float('nan')
+
+# Layout of history file:
+#   header  - see HISTORY_HEADER
+#   state   - 'state size' bytes for JSON of the state of user of history, see save_state()
+#   names   - table of 'max names' names of interfaces and tunnels,
+#             every entry is <section byte><type byte><name>, zero padded,
+#             the entry of free slot is empty
+#   updates - arrays of update fields: 'utc', 'period', 'ok', 'running'
+#   samples - 'max names' slots of interface/tunnel arrays
+# The version should be incremented on any change in layout.
+HISTORY_MAGIC      = 'FWSH'
+HISTORY_VERSION    = 2
+HISTORY_HEADER     = struct.Struct('<4sIIIIQQI')  # magic, version, capacity, max names, state size, seq, count, state length
+HISTORY_STATE_OFF  = 4096
+HISTORY_STATE_SIZE = 64 * 1024
+HISTORY_NAME_SIZE  = 64
+HISTORY_SLOT_WIDTH = max(len(IF_FIELDS), len(TUNNEL_FIELDS))
+HISTORY_SECTIONS   = ['stats', 'tunnel_stats']    # Index of section is stored in name entry
+
+class FwStatsHistory:
+    """This is statistics history class representation.
+    It keeps the last 'capacity' updates of statistics in ring buffer.
+    The ring is stored in preallocated arrays of numbers: one array per update
+    field, e.g. 'utc', and one array per interface and per tunnel, where every
+    row keeps values of all fields of the interface/tunnel for one update.
+    The rows of interfaces and tunnels that are absent in update keep NaN.
+    The array of interface/tunnel is released, once it was absent
+    in all updates in ring, e.g. the tunnel was removed.
+    The append overwrites the oldest row, so both append and eviction are O(1)
+    in history length and no memory is allocated once all interfaces and
+    tunnels are known.
+    Updates are identified by sequence number, that is incremented on every
+    append, so the row of update is found by its sequence number directly.
+    If file name is provided, every append is written through into the memory
+    mapped file, so the history survives restart of agent. On creation
+    the history is loaded from the file, if the file matches the version
+    of layout and the capacity. Otherwise the file is recreated.
+    The file is recreated with doubled size of the names table or of the state
+    area, when they are too small for the interfaces and tunnels or for the state.
+    The slot of released interface/tunnel array is reused.
+
+    :param capacity:   Maximal number of updates to keep.
+    :param filename:   Name of file to persist history in, might be None.
+    :param max_names:  Initial number of interfaces and tunnels that can be persisted.
+    :param state_size: Initial size of area for state in file.
+    """
+    def __init__(self, capacity, filename=None, max_names=256, state_size=HISTORY_STATE_SIZE):
+        """Constructor method
+        """
+        self.capacity = capacity
+        self.lock     = threading.Lock()
+        self.seq      = 0               # Sequence number of the last appended update
+        self.count    = 0               # Number of updates in ring
+        self.utc      = array('d', [0.0]) * capacity
+        self.period   = array('d', [0.0]) * capacity
+        self.ok       = array('B', [0]) * capacity
+        self.running  = array('B', [0]) * capacity
+        self.sections = {               # Arrays of values by name per section of update
+            'stats':        {},
+            'tunnel_stats': {}
+        }
+        self.fields   = {
+            'stats':        IF_FIELDS,
+            'tunnel_stats': TUNNEL_FIELDS
+        }
+        self.filename   = filename
+        self.max_names  = max_names
+        self.state_size = state_size
+        self.mm         = None
+        self.slots      = {}            # Slot of persisted name in file by (section, name)
+        self.free_slots = []            # Stack of free slots, the lowest slot is on top in new file
+        self.last_seen = {}             # Sequence number of last update with sample by (section, name)
+        self.state     = None
+        if filename:
+            try:
+                self._attach()
+            except Exception as e:
+                fwglobals.log.error("FwStatsHistory: failed to attach %s, history will not be persisted: %s" % (filename, str(e)))
+                self.mm = None
+
+    def finalize(self):
+        """Destructor method
+        """
+        with self.lock:
+            if self.mm:
+                self.mm.flush()
+                self.mm.close()
+                self.mm = None
+
+    def append(self, update):
+        """Append update to history. If history is full, the oldest update
+        is evicted.
+
+        :param update: Update dictionary, like:
+                        {'ok':1, 'running':True, 'period':30.0, 'utc':1590000000.0,
+                         'stats':        {<interface>: {'rx_bytes':.., 'rx_pkts':.., 'tx_bytes':.., 'tx_pkts':..}},
+                         'tunnel_stats': {<tunnel id>: {'status':'up', 'rtt':.., 'drop_rate':..}}}
+
+        :returns: Sequence number of the appended update.
+        """
+        with self.lock:
+            seq = self.seq + 1
+            row = self.seq % self.capacity
+            self.utc[row]     = update['utc']
+            self.period[row]  = update['period']
+            self.ok[row]      = 1 if update['ok'] else 0
+            self.running[row] = 1 if update['running'] else 0
+
+            for (section, columns) in self.sections.items():
+                fields  = self.fields[section]
+                width   = len(fields)
+                samples = update.get(section, {})
+                for name in columns.keys():
+                    # Release arrays, the last sample of which is overwritten by this update,
+                    # before new names are added, so their slots in file can be reused.
+                    if not name in samples and self.last_seen[(section, name)] <= seq - self.capacity:
+                        self._evict_name(section, name)
+                for name in samples:
+                    if not name in columns:
+                        columns[name] = array('d', [NAN]) * (self.capacity * width)
+                        self._persist_name(section, name)
+                    self.last_seen[(section, name)] = seq
+                for (name, column) in columns.items():
+                    sample = samples.get(name)
+                    base   = row * width
+                    for (i, f) in enumerate(fields):
+                        column[base + i] = self._to_number(f, sample[f]) if sample else NAN
+                    self._persist_row(section, name, column, row)
+
+            self.seq  += 1
+            self.count = min(self.count + 1, self.capacity)
+            self._persist_update(row)
+            return self.seq
+
+    def save_state(self, state):
+        """Save state of user of history, e.g. the last fetched update,
+        along with the history, so it can be restored on restart.
+
+        :param state: JSON serializable object.
+
+        :returns: None.
+        """
+        with self.lock:
+            self.state = state
+            if not self.mm:
+                return
+            data = json.dumps(state)
+            if len(data) > self.state_size:
+                self._recreate()        # Grows state area
+                return
+            self.mm[HISTORY_STATE_OFF:HISTORY_STATE_OFF + len(data)] = data
+            self._write_header(len(data))
+
+    def load_state(self):
+        """Get state saved by save_state(), including the one loaded from file.
+
+        :returns: The saved object or None.
+        """
+        return self.state
+
+    def snapshot(self, since=0):
+        """Get updates with sequence number greater than 'since'.
+        No data is copied: the returned snapshot refers rows of the ring
+        and builds update dictionaries only when it is iterated.
+
+        :param since: Sequence number of the last seen update.
+                      If it is ahead of history, e.g. the history file was
+                      recreated, the whole history is returned.
+
+        :returns: FwStatsSnapshot object.
+        """
+        with self.lock:
+            if since > self.seq:
+                since = 0
+            first = max(since, self.seq - self.count) + 1
+            return FwStatsSnapshot(self, first, self.seq)
+
+    def last_seq(self):
+        """Get sequence number of the last appended update.
+
+        :returns: Sequence number.
+        """
+        return self.seq
+
+    def get(self, seq):
+        """Build update dictionary out of the ring row.
+
+        :param seq: Sequence number of update.
+
+        :returns: Update dictionary as was appended, with 'seq' field,
+                  or None if it was evicted already.
+        """
+        with self.lock:
+            if seq <= self.seq - self.count or seq > self.seq:
+                return None
+            row = (seq - 1) % self.capacity
+            update = {
+                'seq':     seq,
+                'ok':      self.ok[row],
+                'running': bool(self.running[row]),
+                'period':  self.period[row],
+                'utc':     self.utc[row]
+            }
+            for (section, columns) in self.sections.items():
+                fields = self.fields[section]
+                width  = len(fields)
+                base   = row * width
+                update[section] = {}
+                for (name, column) in columns.items():
+                    if column[base] != column[base]:   # NaN - no sample for this update
+                        continue
+                    update[section][name] = dict([(f, self._from_number(f, column[base + i]))
+                                                  for (i, f) in enumerate(fields)])
+            return update
+
+    def _layout(self, max_names=None, state_size=None):
+        """Get offsets of regions in file and size of file.
+        """
+        max_names   = max_names or self.max_names
+        state_size  = state_size or self.state_size
+        names_off   = HISTORY_STATE_OFF + state_size
+        updates_off = names_off + max_names * HISTORY_NAME_SIZE
+        samples_off = updates_off + self.capacity * (8 + 8 + 1 + 1)
+        samples_off = (samples_off + 7) & ~7
+        size        = samples_off + max_names * self.capacity * HISTORY_SLOT_WIDTH * 8
+        return (names_off, updates_off, samples_off, size)
+
+    def _attach(self):
+        """Map the history file. Load history out of it, if it is valid,
+        or recreate it otherwise.
+        """
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            valid = False
+            size  = os.fstat(fd).st_size
+            if size >= HISTORY_HEADER.size:
+                header = HISTORY_HEADER.unpack(os.read(fd, HISTORY_HEADER.size))
+                (max_names, state_size) = header[3:5]
+                valid = header[0:3] == (HISTORY_MAGIC, HISTORY_VERSION, self.capacity) and \
+                        max_names > 0 and state_size > 0 and \
+                        size == self._layout(max_names, state_size)[3]
+            if valid:
+                self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        if not valid:
+            fwglobals.log.debug("FwStatsHistory: create %s" % self.filename)
+            self._create()
+            return
+
+        (_, _, _, max_names, state_size, self.seq, self.count, state_len) = HISTORY_HEADER.unpack_from(self.mm, 0)
+        (names_off, updates_off, samples_off, _) = self._layout(max_names, state_size)
+        if state_len:
+            self.state = json.loads(self.mm[HISTORY_STATE_OFF:HISTORY_STATE_OFF + state_len])
+
+        cap = self.capacity
+        self.utc     = array('d', self.mm[updates_off : updates_off + cap * 8])
+        self.period  = array('d', self.mm[updates_off + cap * 8 : updates_off + cap * 16])
+        self.ok      = array('B', self.mm[updates_off + cap * 16 : updates_off + cap * 17])
+        self.running = array('B', self.mm[updates_off + cap * 17 : updates_off + cap * 18])
+
+        for slot in range(max_names - 1, -1, -1):
+            off   = names_off + slot * HISTORY_NAME_SIZE
+            entry = self.mm[off : off + HISTORY_NAME_SIZE].rstrip('\0')
+            if not entry:
+                self.free_slots.append(slot)
+                continue
+            section = HISTORY_SECTIONS[ord(entry[0])]
+            name    = int(entry[2:]) if entry[1] == 'i' else entry[2:]
+            width   = len(self.fields[section])
+            off     = samples_off + slot * cap * HISTORY_SLOT_WIDTH * 8
+            self.sections[section][name] = array('d', self.mm[off : off + cap * width * 8])
+            self.slots[(section, name)]  = slot
+            self.last_seen[(section, name)] = self._find_last_seen(section, name)
+        fwglobals.log.debug("FwStatsHistory: loaded %d updates out of %s" % (self.count, self.filename))
+
+        if max_names < self.max_names or state_size < self.state_size:
+            self._create()      # The configured sizes were increased
+        else:
+            (self.max_names, self.state_size) = (max_names, state_size)
+
+    def _create(self):
+        """Create history file that fits the history kept in memory and write
+        the history into it. The names table and the state area are doubled
+        until they fit the interfaces/tunnels and the state. The header is
+        written last, so the file is not valid until it was filled completely.
+        """
+        data = json.dumps(self.state) if self.state is not None else ''
+        while len(data) > self.state_size:
+            self.state_size *= 2
+        names = [(section, name) for (section, columns) in self.sections.items() for name in columns]
+        while len(names) > self.max_names:
+            self.max_names *= 2
+        (_, updates_off, _, size) = self._layout()
+
+        if self.mm:
+            self.mm.close()
+            self.mm = None
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self.slots      = {}
+        self.free_slots = range(self.max_names - 1, -1, -1)
+        for (section, name) in names:
+            self._persist_name(section, name)
+
+        cap = self.capacity
+        self.mm[updates_off : updates_off + cap * 8]            = self.utc.tostring()
+        self.mm[updates_off + cap * 8 : updates_off + cap * 16]  = self.period.tostring()
+        self.mm[updates_off + cap * 16 : updates_off + cap * 17] = self.ok.tostring()
+        self.mm[updates_off + cap * 17 : updates_off + cap * 18] = self.running.tostring()
+        self.mm[HISTORY_STATE_OFF : HISTORY_STATE_OFF + len(data)] = data
+        self._write_header(len(data))
+
+    def _recreate(self):
+        """Recreate history file, so it fits the history kept in memory.
+        If it fails, the history is not persisted anymore.
+        """
+        try:
+            self._create()
+            fwglobals.log.debug("FwStatsHistory: recreated %s: names=%d, state size=%d" %
+                                (self.filename, self.max_names, self.state_size))
+        except Exception as e:
+            fwglobals.log.error("FwStatsHistory: failed to recreate %s, history will not be persisted: %s" %
+                                (self.filename, str(e)))
+            if self.mm:
+                self.mm.close()
+                self.mm = None
+
+    def _write_header(self, state_len=None):
+        if state_len is None:
+            state_len = HISTORY_HEADER.unpack_from(self.mm, 0)[7]
+        HISTORY_HEADER.pack_into(self.mm, 0, HISTORY_MAGIC, HISTORY_VERSION, self.capacity,
+                                 self.max_names, self.state_size, self.seq, self.count, state_len)
+
+    def _find_last_seen(self, section, name):
+        """Find sequence number of the last update in ring with sample
+        of the interface/tunnel.
+
+        :returns: Sequence number or 0 if there is no such update.
+        """
+        column = self.sections[section][name]
+        width  = len(self.fields[section])
+        for seq in range(self.seq, self.seq - self.count, -1):
+            val = column[((seq - 1) % self.capacity) * width]
+            if val == val:      # Not NaN
+                return seq
+        return 0
+
+    def _evict_name(self, section, name):
+        """Release array of interface/tunnel that has no samples in ring.
+        """
+        del self.sections[section][name]
+        del self.last_seen[(section, name)]
+        slot = self.slots.pop((section, name), None)
+        if self.mm and slot is not None:
+            (names_off, _, _, _) = self._layout()
+            off = names_off + slot * HISTORY_NAME_SIZE
+            self.mm[off : off + HISTORY_NAME_SIZE] = '\0' * HISTORY_NAME_SIZE
+            self.free_slots.append(slot)
+
+    def _persist_name(self, section, name):
+        """Allocate slot in file for the new interface/tunnel and write
+        its array into the slot, as the slot keeps zeros or rows of
+        the released interface/tunnel.
+        """
+        if not self.mm or (section, name) in self.slots:
+            return
+        if not self.free_slots:
+            self._recreate()        # Grows names table, the new name is persisted as well
+            return
+        slot = self.free_slots.pop()
+        (names_off, _, samples_off, _) = self._layout()
+        column = self.sections[section][name]
+        off    = samples_off + slot * self.capacity * HISTORY_SLOT_WIDTH * 8
+        self.mm[off : off + len(column) * 8] = column.tostring()
+        entry = chr(HISTORY_SECTIONS.index(section)) + ('i' if type(name) in (int, long) else 's') + str(name)
+        entry = entry[:HISTORY_NAME_SIZE]
+        off   = names_off + slot * HISTORY_NAME_SIZE
+        self.mm[off : off + len(entry)] = entry
+        self.slots[(section, name)] = slot
+
+    def _persist_row(self, section, name, column, row):
+        """Write row of interface/tunnel into file.
+        """
+        slot = self.slots.get((section, name))
+        if not self.mm or slot is None:
+            return
+        (_, _, samples_off, _) = self._layout()
+        width = len(self.fields[section])
+        off   = samples_off + (slot * self.capacity * HISTORY_SLOT_WIDTH + row * width) * 8
+        self.mm[off : off + width * 8] = column[row * width : (row + 1) * width].tostring()
+
+    def _persist_update(self, row):
+        """Write fields of update into file and commit it by header update.
+        """
+        if not self.mm:
+            return
+        (_, updates_off, _, _) = self._layout()
+        cap = self.capacity
+        struct.pack_into('<d', self.mm, updates_off + row * 8, self.utc[row])
+        struct.pack_into('<d', self.mm, updates_off + cap * 8 + row * 8, self.period[row])
+        struct.pack_into('<B', self.mm, updates_off + cap * 16 + row, self.ok[row])
+        struct.pack_into('<B', self.mm, updates_off + cap * 17 + row, self.running[row])
+        self._write_header()
+
+    def _to_number(self, field, val):
+        if field == 'status':
+            return 1.0 if val == 'up' else 0.0
+        return val
+
+    def _from_number(self, field, val):
+        if field == 'status':
+            return 'up' if val else 'down'
+        return val
+
+class FwStatsSnapshot:
+    """This is snapshot of statistics history class representation.
+    It refers range of updates in history by sequence numbers.
+    The updates are built out of history on iteration.
+    Updates that were evicted from history since the snapshot was taken
+    are skipped.
+
+    :param history: FwStatsHistory object.
+    :param first:   Sequence number of the first update in snapshot.
+    :param last:    Sequence number of the last update in snapshot.
+    """
+    def __init__(self, history, first, last):
+        """Constructor method
+        """
+        self.history = history
+        self.first   = first
+        self.last    = last
+
+    def __len__(self):
+        return max(0, self.last - self.first + 1)
+
+    def __iter__(self):
+        for seq in range(self.first, self.last + 1):
+            update = self.history.get(seq)
+            if update:
+                yield update
@@ -0,0 +1,111 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import Queue
+import threading
+import traceback
+
+import fwglobals
+import fwmetrics
+
+class FwThreadPool:
+    """This is bounded thread pool class representation.
+    It runs submitted functions on fixed number of worker threads.
+    The worker threads are created on first submission, so pool that is
+    never used does not consume threads.
+
+    :param num_workers: Maximal number of threads to run functions on.
+    :param name:        Name of pool to be used in names of threads and in logs.
+    """
+    def __init__(self, num_workers, name='pool'):
+        """Constructor method
+        """
+        self.num_workers = num_workers
+        self.name        = name
+        self.queue       = Queue.Queue()
+        self.workers     = []
+        self.lock        = threading.Lock()
+
+    def finalize(self):
+        """Destructor method.
+        Waits for the worker threads to finish functions that were submitted
+        before the call.
+        """
+        with self.lock:
+            workers = self.workers
+            self.workers = []
+        for _ in workers:
+            self.queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    def submit(self, func, args=(), on_done=None):
+        """Run function on one of the worker threads.
+
+        :param func:     Function to run.
+        :param args:     Arguments of function.
+        :param on_done:  Callback to be invoked on the worker thread once the
+                         function finishes. It receives the value returned by
+                         the function and the raised exception, which is None on success.
+
+        :returns: None.
+        """
+        with self.lock:
+            if len(self.workers) < self.num_workers and self.queue.qsize() >= self._num_idle():
+                worker = threading.Thread(target=self._worker_loop,
+                                          name='%s-%d' % (self.name, len(self.workers)))
+                worker.daemon = True
+                worker.idle   = False
+                self.workers.append(worker)
+                worker.start()
+            # Propagate request that submits function to account its metrics properly
+            self.queue.put((func, args, on_done, fwmetrics.get_request()))
+
+    def _num_idle(self):
+        return len([w for w in self.workers if w.idle])
+
+    def _worker_loop(self):
+        """Fetch functions out of queue and run them until None is fetched.
+        """
+        me = threading.current_thread()
+        while True:
+            me.idle = True
+            task = self.queue.get()
+            me.idle = False
+            if task is None:
+                return
+            (func, args, on_done, request) = task
+            fwmetrics.set_request(request)
+            (ret, exc) = (None, None)
+            try:
+                ret = func(*args)
+            except Exception as e:
+                exc = e
+                if not on_done:
+                    fwglobals.log.error("FwThreadPool(%s): %s failed: %s, %s" %
+                                        (self.name, func.__name__, str(e), traceback.format_exc()))
+            if on_done:
+                try:
+                    on_done(ret, exc)
+                except Exception as e:
+                    fwglobals.log.error("FwThreadPool(%s): on_done of %s failed: %s" %
+                                        (self.name, func.__name__, str(e)))
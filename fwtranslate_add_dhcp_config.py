@@ -111,6 +111,49 @@ def add_dhcp_config(params):
     return cmd_list
 
 
+def modify_dhcp_config(params):
+    """Generate commands to modify DHCP configuration in place.
+    The old subnet section is replaced with the new one in dhcpd.conf
+    and DHCP server is restarted. The ip broadcast punting is not touched.
+
+    :param params:        'old' and 'new' parameters of DHCP configuration.
+
+    :returns: List of commands or None if the change can't be done in place.
+    """
+    if params['old']['interface'] != params['new']['interface']:
+        return None
+
+    cmd_list = []
+    for (p, is_add, descr, revert_descr) in [
+            (params['old'], 0, "remove old config from dhcpd config file", "restore old config in dhcpd config file"),
+            (params['new'], 1, "add new config to dhcpd config file", "remove new config from dhcpd config file")]:
+        cmd_params = copy.deepcopy(p)
+        cmd_params['is_add'] = is_add
+        revert_params = copy.deepcopy(p)
+        revert_params['is_add'] = 1 - is_add
+        cmd = {}
+        cmd['cmd'] = {}
+        cmd['cmd']['name'] = "python"
+        cmd['cmd']['params'] = {
+            'module': 'fwutils',
+            'func': 'modify_dhcpd',
+            'args': {'params': cmd_params}
+        }
+        cmd['cmd']['descr'] = descr
+        cmd['revert'] = {}
+        cmd['revert']['name'] = 'python'
+        cmd['revert']['params'] = {
+            'module': 'fwutils',
+            'func': 'modify_dhcpd',
+            'args': {'params': revert_params}
+        }
+        cmd['revert']['descr'] = revert_descr
+        cmd_list.append(cmd)
+    _restart_dhcp_server(cmd_list)
+
+    return cmd_list
+
+
 def get_request_key(params):
     """Get add-dhcp-config command.
 
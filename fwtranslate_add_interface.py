@@ -27,6 +27,37 @@ import fwglobals
 import fwtranslate_revert
 import fwutils
 
+def _add_nat_identity_mapping(cmd_list, iface_pci, iface_addr, is_add):
+    """Add command that creates or deletes NAT identity mapping for vxlan port
+    of WAN interface.
+
+    :param cmd_list:            List of commands.
+    :param iface_pci:           PCI address of interface.
+    :param iface_addr:          Address of interface.
+    :param is_add:              1 to create mapping, 0 to delete it.
+
+    :returns: None.
+    """
+    # nat.api.json: nat44_add_del_identity_mapping (..., is_add, ...)
+    vxlan_port = 4789
+    udp_proto = 17
+    iface_addr_bytes, _ = fwutils.ip_str_to_bytes(iface_addr)
+    descr = { 1: "create nat identity mapping %s -> %s" % (iface_addr, vxlan_port),
+              0: "delete nat identity mapping %s -> %s" % (iface_addr, vxlan_port) }
+
+    cmd = {}
+    cmd['cmd'] = {}
+    cmd['cmd']['name']          = "nat44_add_del_identity_mapping"
+    cmd['cmd']['params']        = { 'substs': [ { 'add_param':'sw_if_index', 'val_by_func':'pci_to_vpp_sw_if_index', 'arg':iface_pci } ],
+                                    'ip_address':iface_addr_bytes, 'port':vxlan_port, 'protocol':udp_proto, 'is_add':is_add, 'addr_only':0 }
+    cmd['cmd']['descr']         = descr[is_add]
+    cmd['revert'] = {}
+    cmd['revert']['name']       = 'nat44_add_del_identity_mapping'
+    cmd['revert']['params']     = { 'substs': [ { 'add_param':'sw_if_index', 'val_by_func':'pci_to_vpp_sw_if_index', 'arg':iface_pci } ],
+                                    'ip_address':iface_addr_bytes, 'port':vxlan_port, 'protocol':udp_proto, 'is_add':1-is_add, 'addr_only':0 }
+    cmd['revert']['descr']      = descr[1-is_add]
+    cmd_list.append(cmd)
+
 # add_interface
 # --------------------------------------
 # Translates request:
@@ -208,23 +239,7 @@ def add_interface(params):
                                     'is_add':0, 'is_inside':0 }
         cmd_list.append(cmd)
 
-        # nat.api.json: nat44_add_del_identity_mapping (..., is_add, ...)
-        vxlan_port = 4789
-        udp_proto = 17
-
-        cmd = {}
-        cmd['cmd'] = {}
-        cmd['cmd']['name']          = "nat44_add_del_identity_mapping"
-        cmd['cmd']['params']        = { 'substs': [ { 'add_param':'sw_if_index', 'val_by_func':'pci_to_vpp_sw_if_index', 'arg':iface_pci } ],
-                                        'ip_address':iface_addr_bytes, 'port':vxlan_port, 'protocol':udp_proto, 'is_add':1, 'addr_only':0 }
-        cmd['cmd']['descr']         = "create nat identity mapping %s -> %s" % (params['addr'], vxlan_port)
-        cmd['revert'] = {}
-        cmd['revert']['name']       = 'nat44_add_del_identity_mapping'
-        cmd['revert']['params']     = { 'substs': [ { 'add_param':'sw_if_index', 'val_by_func':'pci_to_vpp_sw_if_index', 'arg':iface_pci } ],
-                                        'ip_address':iface_addr_bytes, 'port':vxlan_port, 'protocol':udp_proto, 'is_add':0, 'addr_only':0 }
-        cmd['revert']['descr']      = "delete nat identity mapping %s -> %s" % (params['addr'], vxlan_port)
-
-        cmd_list.append(cmd)
+        _add_nat_identity_mapping(cmd_list, iface_pci, iface_addr, is_add=1)
 
     # On LAN interfaces run
     #   'set interface nat44 in GigabitEthernet0/8/0 output-feature'
@@ -316,6 +331,114 @@ def add_interface(params):
 
     return cmd_list
 
+# modify_interface
+# --------------------------------------
+# Translates request:
+#
+#    {
+#      "message": "modify-interface",
+#      "params": {
+#           "old": { <parameters of 'add-interface' stored in database> },
+#           "new": { <new parameters of 'add-interface'> }
+#      }
+#    }
+#
+# into list of commands that change the interface in place, without
+# removing it from VPP and without touching tunnels and other objects that use
+# the interface. Only change of address is handled in place:
+#
+#    01. sudo ip addr del 192.168.56.107/24 dev vpp0
+#        sudo ip addr add 192.168.56.108/24 dev vpp0
+#    02. (WAN) update nat identity mapping of the vxlan port
+#    03. (OSPF) update 'network' and 'ospf router-id' in ospfd.conf
+#    04. (OSPF) sudo systemctl restart frr
+#
+# Other changes, e.g. change of type or routing, are reported by returning None,
+# so the caller replaces the interface by 'remove-interface' and 'add-interface'.
+#
+def modify_interface(params):
+    """Generate commands to modify interface in Linux and VPP in place.
+
+     :param params:        'old' and 'new' parameters of interface.
+
+     :returns: List of commands or None if the change can't be done in place.
+     """
+    old = params['old']
+    new = params['new']
+
+    changed = []
+    for p in set(old.keys() + new.keys()) - set(['driver']):
+        (old_val, new_val) = (old.get(p, ''), new.get(p, ''))
+        if fwutils.is_str(old_val) and fwutils.is_str(new_val):
+            (old_val, new_val) = (old_val.lower(), new_val.lower())
+        if old_val != new_val:
+            changed.append(p)
+    if [p for p in changed if not p in ['addr', 'addr6']]:
+        return None
+
+    cmd_list = []
+    if not 'addr' in changed:
+        return cmd_list         # 'addr6' is not configured by agent yet
+
+    iface_pci = new['pci']
+    old_addr  = old['addr']
+    new_addr  = new['addr']
+
+    cmd = {}
+    cmd['cmd'] = {}
+    cmd['cmd']['name']   = "exec"
+    cmd['cmd']['descr']  = "replace %s with %s on interface %s in Linux" % (old_addr, new_addr, iface_pci)
+    cmd['cmd']['params'] = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'pci_to_tap', 'arg':iface_pci } ]},
+                             'sudo ip addr del %s dev DEV-STUB; if [ -z "$(ip addr | grep \'inet %s\')" ]; then sudo ip addr add %s dev DEV-STUB; fi' %
+                             (old_addr, new_addr, new_addr) ]
+    cmd['revert'] = {}
+    cmd['revert']['name']   = "exec"
+    cmd['revert']['descr']  = "replace %s with %s on interface %s in Linux" % (new_addr, old_addr, iface_pci)
+    cmd['revert']['params'] = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'pci_to_tap', 'arg':iface_pci } ]},
+                                'sudo ip addr del %s dev DEV-STUB; if [ -z "$(ip addr | grep \'inet %s\')" ]; then sudo ip addr add %s dev DEV-STUB; fi' %
+                                (new_addr, old_addr, old_addr) ]
+    cmd_list.append(cmd)
+
+    # NAT takes address of WAN interface automatically,
+    # so only the identity mapping of the vxlan port should be updated.
+    if 'type' not in new or new['type'].lower() == 'wan':
+        _add_nat_identity_mapping(cmd_list, iface_pci, old_addr, is_add=0)
+        _add_nat_identity_mapping(cmd_list, iface_pci, new_addr, is_add=1)
+
+    # Update ospfd.conf.
+    if 'routing' in new and new['routing'].lower() == 'ospf':
+        ospfd_file = fwglobals.g.FRR_OSPFD_FILE
+
+        # Escape slash in address with length to prevent sed confusing
+        old_net = old_addr.split('/')[0] + r"\/" + old_addr.split('/')[1]
+        new_net = new_addr.split('/')[0] + r"\/" + new_addr.split('/')[1]
+        old_ip  = old_addr.split('/')[0]
+        new_ip  = new_addr.split('/')[0]
+
+        cmd = {}
+        cmd['cmd'] = {}
+        cmd['cmd']['name']    = "exec"
+        cmd['cmd']['descr']   = "replace %s with %s in %s" % (old_addr, new_addr, ospfd_file)
+        cmd['cmd']['params']  = [
+            'sed -i -E "s/network %s area/network %s area/; s/ospf router-id %s$/ospf router-id %s/" %s' %
+            (old_net, new_net, old_ip, new_ip, ospfd_file) ]
+        cmd['revert'] = {}
+        cmd['revert']['name']    = "exec"
+        cmd['revert']['descr']   = "replace %s with %s in %s" % (new_addr, old_addr, ospfd_file)
+        cmd['revert']['params']  = [
+            'sed -i -E "s/network %s area/network %s area/; s/ospf router-id %s$/ospf router-id %s/" %s; sudo systemctl restart frr' %
+            (new_net, old_net, new_ip, old_ip, ospfd_file) ]
+        cmd_list.append(cmd)
+
+        cmd = {}
+        cmd['cmd'] = {}
+        cmd['cmd']['name']    = 'exec'
+        cmd['cmd']['params']  = [ 'sudo systemctl restart frr; if [ -z "$(pgrep frr)" ]; then exit 1; fi' ]
+        cmd['cmd']['descr']   = "restart frr"
+        cmd_list.append(cmd)
+
+    return cmd_list
+
 def get_request_key(params):
     """Get add interface command key.
 
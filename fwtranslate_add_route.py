@@ -48,6 +48,24 @@ import fwutils
 #   On CentOS/Fedora/RH "systemctl restart network.service" is needed afterwards.
 #
 #
+def _get_route_cmd(op, params):
+    """Build 'ip route' command for not default route.
+
+     :param op:            'ip route' operation: 'add', 'del' or 'replace'.
+     :param params:        Parameters of 'add-route' request.
+
+     :returns: Parameters of 'exec' command.
+     """
+    metric = params.get('metric', None)
+    metric_str = ''
+    if metric:
+        metric_str = ' metric %s' % metric
+
+    if not 'pci' in params:
+        return [ "sudo ip route %s %s via %s%s" % (op, params['addr'], params['via'], metric_str) ]
+    return [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'pci_to_tap', 'arg':params['pci'] } ]},
+             "sudo ip route %s %s via %s dev DEV-STUB%s" % (op, params['addr'], params['via'], metric_str) ]
+
 def add_route(params):
     """Generate commands to configure ip route in Linux and VPP.
 
@@ -57,20 +75,9 @@ def add_route(params):
      """
     cmd_list = []
 
-    metric = params.get('metric', None)
-    metric_str = ''
-    if metric:
-        metric_str = ' metric %s' % metric
-
     if params['addr'] != 'default':
-        if not 'pci' in params:
-            add_cmd = [ "sudo ip route add %s via %s%s" % (params['addr'], params['via'], metric_str) ]
-            del_cmd = [ "sudo ip route del %s via %s%s" % (params['addr'], params['via'], metric_str) ]
-        else:
-            add_cmd = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'pci_to_tap', 'arg':params['pci'] } ]},
-                        "sudo ip route add %s via %s dev DEV-STUB%s" % (params['addr'], params['via'], metric_str) ]
-            del_cmd = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'pci_to_tap', 'arg':params['pci'] } ]},
-                        "sudo ip route del %s via %s dev DEV-STUB%s" % (params['addr'], params['via'], metric_str) ]
+        add_cmd = _get_route_cmd('add', params)
+        del_cmd = _get_route_cmd('del', params)
     else:  # if params['addr'] is 'default', we have to remove current default GW before adding the new one
         (old_ip, old_dev) = fwutils.get_default_route()
         old_via = old_ip if len(old_dev)==0 else '%s dev %s' % (old_ip, old_dev)
@@ -105,6 +112,51 @@ def add_route(params):
     cmd_list.append(cmd)
     return cmd_list
 
+# modify_route
+# --------------------------------------
+# Translates request:
+#
+#    {
+#       "message": "modify-route",
+#       "params": {
+#           "old": { <parameters of 'add-route' stored in database> },
+#           "new": { <new parameters of 'add-route'> }
+#       }
+#    }
+#
+# into command that changes gateway or device of route in place:
+#
+#   ip route replace 192.0.2.0/24 via 10.0.0.2 [dev <interface>]
+#
+# The default route and change of destination or metric are reported by
+# returning None, so the caller replaces the route by 'remove-route' and 'add-route'.
+#
+def modify_route(params):
+    """Generate commands to modify ip route in Linux in place.
+
+     :param params:        'old' and 'new' parameters of route.
+
+     :returns: List of commands or None if the change can't be done in place.
+     """
+    old = params['old']
+    new = params['new']
+    if old['addr'] == 'default' or old['addr'] != new['addr'] or \
+       old.get('metric') != new.get('metric'):
+        return None
+
+    cmd_list = []
+    cmd = {}
+    cmd['cmd'] = {}
+    cmd['cmd']['name']      = "exec"
+    cmd['cmd']['descr']     = "ip route replace %s via %s dev %s" % (new['addr'], new['via'], str(new.get('pci')))
+    cmd['cmd']['params']    = _get_route_cmd('replace', new)
+    cmd['revert'] = {}
+    cmd['revert']['name']   = "exec"
+    cmd['revert']['descr']  = "ip route replace %s via %s dev %s" % (old['addr'], old['via'], str(old.get('pci')))
+    cmd['revert']['params'] = _get_route_cmd('replace', old)
+    cmd_list.append(cmd)
+    return cmd_list
+
 def get_request_key(params):
     """Get add route command key.
 
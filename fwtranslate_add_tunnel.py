@@ -20,7 +20,6 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 ################################################################################
 
-import copy
 import os
 
 import fwutils
@@ -169,6 +168,36 @@ def generate_id(ret):
         ret = 0
     return ret
 
+# Offsets of loop1 address and MAC from these of loop0 and masks that map local
+# loop1 address and MAC to the remote ones, see add_tunnel().
+LOOP1_IP_OFFSET  = IPAddress('0.1.0.0').value
+LOOP1_MAC_OFFSET = EUI('00:00:00:01:00:00').value
+REMOTE_IP_MASK   = IPAddress('0.0.0.1').value
+REMOTE_MAC_MASK  = EUI('00:00:00:00:00:01').value
+
+#vpp/src/vnet/ipsec/ipsec.h
+CRYPTO_ALGS = {
+    "aes-cbc-128":  1,
+    "aes-cbc-192":  2,
+    "aes-cbc-256":  3,
+    "aes-ctr-128":  4,
+    "aes-ctr-192":  5,
+    "aes-ctr-256":  6,
+    "aes-gcm-128":  7,
+    "aes-gcm-192":  8,
+    "aes-gcm-256":  9,
+    "des-cbc":      10,
+    "3des-cbc":     11
+}
+INTEGR_ALGS = {
+    "md5-96":       1,
+    "sha1-96":      2,
+    "sha-256-96":   3,
+    "sha-256-128":  4,
+    "sha-384-192":  5,
+    "sha-512-256":  6
+}
+
 sa_index = 0
 def generate_sa_id():
     """Generate SA identifier.
@@ -177,7 +206,7 @@ def generate_sa_id():
     """
     global sa_index
     sa_index = generate_id(sa_index)
-    return copy.deepcopy(sa_index)
+    return sa_index
 
 def _add_loopback(cmd_list, cache_key, mac, addr, mtu, id, internal=False):
     """Add loopback command into the list.
@@ -261,11 +290,13 @@ def _add_loopback(cmd_list, cache_key, mac, addr, mtu, id, internal=False):
     # sudo ip addr add <loopback ip> dev <tap of loopback iface>
     # sudo ip link set dev <tap of loopback iface> up
     # sudo ip link set dev <tap of loopback iface> mtu <mtu of loopback iface>  // ensure length of Linux packets + overhead of vpp gre & ipsec & vxlan is below 1500
+    # These commands depend on creation of the loopback only, so they are run concurrently.
     if not internal:
         cmd = {}
         cmd['cmd'] = {}
         cmd['cmd']['name']    = "exec"
         cmd['cmd']['descr']   = "UP loopback interface %s in Linux" % addr
+        cmd['cmd']['depends_on'] = []
         cmd['cmd']['params']  = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'vpp_sw_if_index_to_tap', 'arg_by_key':cache_key} ]},
                                 "sudo ip addr add %s dev DEV-STUB" % (addr) ]
         cmd_list.append(cmd)
@@ -273,6 +304,7 @@ def _add_loopback(cmd_list, cache_key, mac, addr, mtu, id, internal=False):
         cmd['cmd'] = {}
         cmd['cmd']['name']    = "exec"
         cmd['cmd']['descr']   = "set %s to loopback interface in Linux" % addr
+        cmd['cmd']['depends_on'] = []
         cmd['cmd']['params']  = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'vpp_sw_if_index_to_tap', 'arg_by_key':cache_key} ]},
                                 "sudo ip link set dev DEV-STUB up" ]
         cmd_list.append(cmd)
@@ -280,6 +312,7 @@ def _add_loopback(cmd_list, cache_key, mac, addr, mtu, id, internal=False):
         cmd['cmd'] = {}
         cmd['cmd']['name']    = "exec"
         cmd['cmd']['descr']   = "set mtu=%s into loopback interface %s in Linux" % (mtu, addr)
+        cmd['cmd']['depends_on'] = []
         cmd['cmd']['params']  = [ {'substs': [ {'replace':'DEV-STUB', 'val_by_func':'vpp_sw_if_index_to_tap', 'arg_by_key':cache_key} ]},
                                 "sudo ip link set dev DEV-STUB mtu %s" % mtu ]
         cmd_list.append(cmd)
@@ -329,7 +362,7 @@ def _add_interface_to_bridge(cmd_list, iface_description, bridge_id, bvi, cache_
                               'bd_id':bridge_id , 'enable':0 }
     cmd_list.append(cmd)
 
-def _add_gre_tunnel(cmd_list, cache_key, src, dst, local_sa_id, remote_sa_id):
+def _add_gre_tunnel(cmd_list, cache_key, src, dst, local_sa_id, remote_sa_id, lookups=None):
     """Add GRE tunnel command into the list.
 
     :param cmd_list:             List of commands.
@@ -338,13 +371,14 @@ def _add_gre_tunnel(cmd_list, cache_key, src, dst, local_sa_id, remote_sa_id):
     :param src:                  Destination ip address.
     :param local_sa_id:          Local SA identifier.
     :param remote_sa_id:         Remote SA identifier.
+    :param lookups:              Lookups shared by bulk of tunnels, see add_tunnel().
 
     :returns: None.
     """
     # ipsec_gre.api.json: ipsec_gre_add_del_tunnel (..., is_add, tunnel <type vl_api_ipsec_gre_tunnel_t>, ...)
     ret_attr = 'sw_if_index'
-    src_addr_bytes = fwutils.ip_str_to_bytes(src)[0]
-    dst_addr_bytes = fwutils.ip_str_to_bytes(dst)[0]
+    src_addr_bytes = _lookup(lookups, fwutils.ip_str_to_bytes, src)[0]
+    dst_addr_bytes = _lookup(lookups, fwutils.ip_str_to_bytes, dst)[0]
     cmd_params = {
             'is_add'       : 1,
             'src_address'  : src_addr_bytes,
@@ -360,7 +394,7 @@ def _add_gre_tunnel(cmd_list, cache_key, src, dst, local_sa_id, remote_sa_id):
     cmd['cmd']['descr']         = "create ipsec tunnel %s -> %s" % (src, dst)
     cmd['revert'] = {}
     cmd['revert']['name']       = 'ipsec_gre_add_del_tunnel'
-    cmd['revert']['params']     = copy.deepcopy(cmd_params)
+    cmd['revert']['params']     = dict(cmd_params)
     cmd['revert']['params']['is_add'] = 0
     cmd['revert']['descr']      = "delete ipsec tunnel %s -> %s" % (src, dst)
     cmd_list.append(cmd)
@@ -374,7 +408,7 @@ def _add_gre_tunnel(cmd_list, cache_key, src, dst, local_sa_id, remote_sa_id):
                               'admin_up_down':1 }
     cmd_list.append(cmd)
 
-def _add_vxlan_tunnel(cmd_list, cache_key, bridge_id, src, dst):
+def _add_vxlan_tunnel(cmd_list, cache_key, bridge_id, src, dst, lookups=None):
     """Add VxLAN tunnel command into the list.
 
     :param cmd_list:             List of commands.
@@ -382,13 +416,14 @@ def _add_vxlan_tunnel(cmd_list, cache_key, bridge_id, src, dst):
     :param bridge_id:            Bridge identifier.
     :param src:                  Source ip address.
     :param src:                  Destination ip address.
+    :param lookups:              Lookups shared by bulk of tunnels, see add_tunnel().
 
     :returns: None.
     """
     # vxlan.api.json: vxlan_add_del_tunnel (..., is_add, tunnel <type vl_api_vxlan_add_del_tunnel_t>, ...)
     ret_attr = 'sw_if_index'
-    src_addr_bytes = fwutils.ip_str_to_bytes(src)[0]
-    dst_addr_bytes = fwutils.ip_str_to_bytes(dst)[0]
+    src_addr_bytes = _lookup(lookups, fwutils.ip_str_to_bytes, src)[0]
+    dst_addr_bytes = _lookup(lookups, fwutils.ip_str_to_bytes, dst)[0]
     cmd_params = {
             'is_add'           : 1,
             'src_address'      : src_addr_bytes,
@@ -405,7 +440,7 @@ def _add_vxlan_tunnel(cmd_list, cache_key, bridge_id, src, dst):
     cmd['cmd']['descr']         = "create vxlan tunnel %s -> %s" % (src, dst)
     cmd['revert'] = {}
     cmd['revert']['name']       = 'vxlan_add_del_tunnel'
-    cmd['revert']['params']     = copy.deepcopy(cmd_params)
+    cmd['revert']['params']     = dict(cmd_params)
     cmd['revert']['params']['is_add'] = 0
     cmd['revert']['descr']      = "delete vxlan tunnel %s -> %s" % (src, dst)
     cmd_list.append(cmd)
@@ -419,12 +454,13 @@ def _add_vxlan_tunnel(cmd_list, cache_key, bridge_id, src, dst):
                               'admin_up_down':1 }
     cmd_list.append(cmd)
 
-def _add_ipsec_sa(cmd_list, local_sa, local_sa_id):
+def _add_ipsec_sa(cmd_list, local_sa, local_sa_id, lookups=None):
     """Add IPSEC sa command into the list.
 
     :param cmd_list:            List of commands.
     :param local_sa:            SA parameters.
     :param local_sa_id:         SA identifier.
+    :param lookups:             Lookups shared by bulk of tunnels, see add_tunnel().
 
     :returns: None.
     """
@@ -433,37 +469,8 @@ def _add_ipsec_sa(cmd_list, local_sa, local_sa_id):
     #    ipsec sa add 22 spi 2010 esp crypto-alg aes-cbc-128 crypto-key 2010aa794f574265564551694d653768 integr-alg sha1-96 integr-key 2010ff4b55523947594d6d3547666b45764e6a58
     # --------------------------------------------------------------------------
 
-    #vpp/src/vnet/ipsec/ipsec.h
-    crypto_algs = {
-        "aes-cbc-128":  1,
-        "aes-cbc-192":  2,
-        "aes-cbc-256":  3,
-        "aes-ctr-128":  4,
-        "aes-ctr-192":  5,
-        "aes-ctr-256":  6,
-        "aes-gcm-128":  7,
-        "aes-gcm-192":  8,
-        "aes-gcm-256":  9,
-        "des-cbc":      10,
-        "3des-cbc":     11
-    }
-    integr_algs = {
-        "md5-96":       1,
-        "sha1-96":      2,
-        "sha-256-96":   3,
-        "sha-256-128":  4,
-        "sha-384-192":  5,
-        "sha-512-256":  6
-    }
-
     # ipsec.api.json: ipsec_sad_entry_add_del (..., is_add, entry <type vl_api_ipsec_sad_entry_t>, ...)
-    if not local_sa['crypto-alg'] in crypto_algs:
-        raise Exception("fwtranslate_add_tunnel: crypto-alg %s is not supported" % local_sa['crypto-alg'])
-    if not local_sa['integr-alg'] in integr_algs:
-        raise Exception("fwtranslate_add_tunnel: crypto-alg %s is not supported" % local_sa['crypto-alg'])
-
-    crypto_alg  = crypto_algs[local_sa['crypto-alg']]
-    integr_alg  = integr_algs[local_sa['integr-alg']]
+    (crypto_alg, integr_alg) = _lookup(lookups, _get_sa_algs, local_sa['crypto-alg'], local_sa['integr-alg'])
     crypto_key  = fwutils.hex_str_to_bytes(str(local_sa['crypto-key']))  # str() is needed in Python 2
     integr_key  = fwutils.hex_str_to_bytes(str(local_sa['integr-key']))
 
@@ -486,26 +493,59 @@ def _add_ipsec_sa(cmd_list, local_sa, local_sa_id):
     cmd['cmd']['descr']   = "add SA rule no.%d (spi=%d, crypto=%s, integrity=%s)" % (local_sa_id, local_sa['spi'], local_sa['crypto-alg'] , local_sa['integr-alg'])
     cmd['revert'] = {}
     cmd['revert']['name']   = 'ipsec_sad_add_del_entry'
-    cmd['revert']['params'] = copy.deepcopy(cmd_params)
+    cmd['revert']['params'] = dict(cmd_params)              # Values are immutable, so no deep copy is needed
     cmd['revert']['params']['is_add'] = 0
     cmd['revert']['descr']  = "remove SA rule no.%d (spi=%d, crypto=%s, integrity=%s)" % (local_sa_id, local_sa['spi'], local_sa['crypto-alg'] , local_sa['integr-alg'])
     cmd_list.append(cmd)
 
+def _get_sa_algs(crypto_alg, integr_alg):
+    """Map names of SA algorithms into VPP identifiers.
+
+    :param crypto_alg:          Name of encryption algorithm.
+    :param integr_alg:          Name of integrity algorithm.
 
-def _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_tunnel_ips, bridge_id):
+    :returns: Tuple of VPP identifiers of algorithms.
+    """
+    if not crypto_alg in CRYPTO_ALGS:
+        raise Exception("fwtranslate_add_tunnel: crypto-alg %s is not supported" % crypto_alg)
+    if not integr_alg in INTEGR_ALGS:
+        raise Exception("fwtranslate_add_tunnel: integr-alg %s is not supported" % integr_alg)
+    return (CRYPTO_ALGS[crypto_alg], INTEGR_ALGS[integr_alg])
+
+def _lookup(lookups, func, *args):
+    """Call lookup function. If the cache of lookups is provided,
+    the result is taken out of it, if the function was called already
+    with the same arguments, e.g. for other tunnel of bulk.
+    The function should return immutable value, as it is shared.
+
+    :param lookups:             Cache of lookups or None.
+    :param func:                Lookup function.
+    :param args:                Arguments of function.
+
+    :returns: Result of function.
+    """
+    if lookups is None:
+        return func(*args)
+    key = (func.__name__,) + args
+    if not key in lookups:
+        lookups[key] = func(*args)
+    return lookups[key]
+
+def _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_tunnel_ips, bridge_id, lookups=None):
     """Add GRE tunnel, loopback and bridge commands into the list.
 
     :param cmd_list:            List of commands.
     :param params:              Parameters from flexiManage.
     :param l2gre_tunnel_ips:    GRE tunnel src and dst ip addresses.
     :param bridge_id:           Bridge identifier.
+    :param lookups:             Lookups shared by bulk of tunnels, see add_tunnel().
 
     :returns: None.
     """
     local_sa_id = generate_sa_id()
-    _add_ipsec_sa(cmd_list, params['ipsec']['local-sa'], local_sa_id)
+    _add_ipsec_sa(cmd_list, params['ipsec']['local-sa'], local_sa_id, lookups)
     remote_sa_id = generate_sa_id()
-    _add_ipsec_sa(cmd_list, params['ipsec']['remote-sa'], remote_sa_id)
+    _add_ipsec_sa(cmd_list, params['ipsec']['remote-sa'], remote_sa_id, lookups)
 
     _add_loopback(
                 cmd_list,
@@ -522,7 +562,8 @@ def _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_tunnel_ips, bridge_id)
                 l2gre_tunnel_ips['src'],
                 l2gre_tunnel_ips['dst'],
                 local_sa_id,
-                remote_sa_id)
+                remote_sa_id,
+                lookups)
     _add_interface_to_bridge(
                 cmd_list,
                 iface_description='loop0_' + params['loopback-iface']['addr'],
@@ -536,7 +577,7 @@ def _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_tunnel_ips, bridge_id)
                 bvi=0,
                 cache_key='gre_tunnel_sw_if_index')
 
-def _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, l2gre_tunnel_ips, bridge_id):
+def _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, l2gre_tunnel_ips, bridge_id, lookups=None):
     """Add VxLAN tunnel, loopback and bridge commands into the list.
 
     :param cmd_list:            List of commands.
@@ -545,6 +586,7 @@ def _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, l2gre
     :param loop1_mac:           Loopback MAC address.
     :param l2gre_tunnel_ips:    VxLAN tunnel src and dst ip addresses.
     :param bridge_id:           Bridge identifier.
+    :param lookups:             Lookups shared by bulk of tunnels, see add_tunnel().
 
     :returns: None.
     """
@@ -563,7 +605,8 @@ def _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, l2gre
                 'vxlan_tunnel_sw_if_index',
                 bridge_id,
                 l2gre_tunnel_ips['src'],
-                l2gre_tunnel_ips['dst'])
+                l2gre_tunnel_ips['dst'],
+                lookups)
     _add_interface_to_bridge(
                 cmd_list,
                 iface_description='loop1_' + loop1_cfg['ip'],
@@ -599,10 +642,17 @@ def _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, l2gre
     cmd_list.append(cmd)
 
 
-def add_tunnel(params):
+def add_tunnel(params, restart_frr=True, lookups=None):
     """Generate commands to add IPSEC-GRE and VxLAN tunnels into VPP.
 
     :param params:        Parameters from flexiManage.
+    :param restart_frr:   If False, the FRR restart command is not added,
+                          as the FRR is restarted once for bulk of tunnels,
+                          see get_restart_frr_cmd_list().
+    :param lookups:       Dictionary to share results of lookups, like conversion
+                          of tunnel endpoint addresses and of SA algorithms,
+                          between tunnels of bulk. The tunnels of bulk usually
+                          have the same source and SA algorithms.
 
     :returns: List of commands.
     """
@@ -611,25 +661,25 @@ def add_tunnel(params):
     loop0_ip  = IPNetwork(params['loopback-iface']['addr'])     # 10.100.0.4 / 10.100.0.5
     loop0_mac = EUI(params['loopback-iface']['mac'], dialect=mac_unix_expanded) # 02:00:27:fd:00:04 / 02:00:27:fd:00:05
 
-    loop1_ip         = copy.deepcopy(loop0_ip)
-    loop1_ip.value  += IPAddress('0.1.0.0').value               # 10.100.0.4 -> 10.101.0.4 / 10.100.0.5 -> 10.101.0.5
-    loop1_mac        = copy.deepcopy(loop0_mac)
-    loop1_mac.value += EUI('00:00:00:01:00:00').value           # 02:00:27:fd:00:04 -> 02:00:27:fe:00:04 / 02:00:27:fd:00:05 -> 02:00:27:fe:00:05
+    loop1_ip         = IPNetwork(loop0_ip)
+    loop1_ip.value  += LOOP1_IP_OFFSET                          # 10.100.0.4 -> 10.101.0.4 / 10.100.0.5 -> 10.101.0.5
+    loop1_mac        = EUI(loop0_mac)
+    loop1_mac.value += LOOP1_MAC_OFFSET                         # 02:00:27:fd:00:04 -> 02:00:27:fe:00:04 / 02:00:27:fd:00:05 -> 02:00:27:fe:00:05
 
-    remote_loop1_ip         = copy.deepcopy(loop1_ip)
-    remote_loop1_ip.value  ^= IPAddress('0.0.0.1').value        # 10.101.0.4 -> 10.101.0.5 / 10.101.0.5 -> 10.101.0.4
-    remote_loop1_mac        = copy.deepcopy(loop1_mac)
-    remote_loop1_mac.value ^= EUI('00:00:00:00:00:01').value    # 02:00:27:fe:00:04 -> 02:00:27:fe:00:05 / 02:00:27:fe:00:05 -> 02:00:27:fe:00:04
+    remote_loop1_ip         = IPNetwork(loop1_ip)
+    remote_loop1_ip.value  ^= REMOTE_IP_MASK                    # 10.101.0.4 -> 10.101.0.5 / 10.101.0.5 -> 10.101.0.4
+    remote_loop1_mac        = EUI(loop1_mac)
+    remote_loop1_mac.value ^= REMOTE_MAC_MASK                   # 02:00:27:fe:00:04 -> 02:00:27:fe:00:05 / 02:00:27:fe:00:05 -> 02:00:27:fe:00:04
 
     # Add loop0-bridge-l2gre_ipsec
     l2gre_ips = {'src':str(loop1_ip), 'dst':str(remote_loop1_ip)}
-    _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_ips, bridge_id=params['tunnel-id']*2)
+    _add_loop0_bridge_l2gre_ipsec(cmd_list, params, l2gre_ips, bridge_id=params['tunnel-id']*2, lookups=lookups)
 
     # Add loop1-bridge-vxlan
     vxlan_ips = {'src':params['src'], 'dst':params['dst']}
     loop1_cfg = {'ip':str(loop1_ip), 'mac':str(loop1_mac)}
     remote_loop1_cfg = {'ip':str(remote_loop1_ip), 'mac':str(remote_loop1_mac)}
-    _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, vxlan_ips, bridge_id=(params['tunnel-id']*2+1))
+    _add_loop1_bridge_vxlan(cmd_list, params, loop1_cfg, remote_loop1_cfg, vxlan_ips, bridge_id=(params['tunnel-id']*2+1), lookups=lookups)
 
     # --------------------------------------------------------------------------
     # Add following section to frr ospfd.conf
@@ -641,7 +691,7 @@ def add_tunnel(params):
     #           network <loopback ip> area 0.0.0.0
     # Restart frr
     # --------------------------------------------------------------------------
-    if 'routing' in params['loopback-iface'] and params['loopback-iface']['routing'] == 'ospf':
+    if _is_ospf(params):
         ospfd_file = fwglobals.g.FRR_OSPFD_FILE
         cmd = {}
         cmd['cmd'] = {}
@@ -680,15 +730,35 @@ def add_tunnel(params):
         cmd['revert']['filter']  = 'must'   # When 'remove-XXX' commands are generated out of the 'add-XXX' commands, run this command even if vpp doesn't run
         cmd_list.append(cmd)
 
-        cmd = {}
-        cmd['cmd'] = {}
-        cmd['cmd']['name']    = 'exec'
-        cmd['cmd']['params']  = [ 'sudo systemctl restart frr; if [ -z "$(pgrep frr)" ]; then exit 1; fi' ]
-        cmd['cmd']['descr']   = "restart frr"
-        cmd_list.append(cmd)
+        if restart_frr:
+            _add_restart_frr(cmd_list)
 
     return cmd_list
 
+def get_restart_frr_cmd_list(params_list):
+    """Generate command to restart FRR once for bulk of tunnels,
+    if any of them is routed by OSPF.
+
+    :param params_list:   List of add-tunnel parameters from flexiManage.
+
+    :returns: List of commands.
+    """
+    cmd_list = []
+    if [params for params in params_list if _is_ospf(params)]:
+        _add_restart_frr(cmd_list)
+    return cmd_list
+
+def _is_ospf(params):
+    return params['loopback-iface'].get('routing') == 'ospf'
+
+def _add_restart_frr(cmd_list):
+    cmd = {}
+    cmd['cmd'] = {}
+    cmd['cmd']['name']    = 'exec'
+    cmd['cmd']['params']  = [ 'sudo systemctl restart frr; if [ -z "$(pgrep frr)" ]; then exit 1; fi' ]
+    cmd['cmd']['descr']   = "restart frr"
+    cmd_list.append(cmd)
+
 def get_request_key(params):
     """Get add-tunnel command.
 
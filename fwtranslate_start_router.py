@@ -21,7 +21,6 @@
 ################################################################################
 
 import os
-import re
 
 import fwglobals
 import fwutils
@@ -112,32 +111,32 @@ def start_router(params=None):
     #   sudo ip link set dev enp0s8 down
     #   sudo ip addr flush dev enp0s8
     # The interfaces to be removed are stored within 'add-interface' requests
-    # in the configuration database.
+    # in the configuration database. The interfaces are independent of each
+    # other, so they are shut down concurrently.
     pci_list = []
-    for key in fwglobals.g.router_api.db_requests.db:
-        if re.match('add-interface', key):
-            (_, params) = fwglobals.g.router_api.db_requests.fetch_request(key)
-            iface_pci  = fwutils.pci_to_linux_iface(params['pci'])
-            if iface_pci:
-                cmd = {}
-                cmd['cmd'] = {}
-                cmd['cmd']['name']    = "exec"
-                cmd['cmd']['params']  = [ "sudo ip link set dev %s down && sudo ip addr flush dev %s" % (iface_pci ,iface_pci ) ]
-                cmd['cmd']['descr']   = "shutdown dev %s in Linux" % iface_pci
-                cmd['revert'] = {}
-                cmd['revert']['name']    = "exec"
-                cmd['revert']['params']  = [ "sudo netplan apply" ]
-                cmd['revert']['descr']  = "apply netplan configuration"
-                cmd_list.append(cmd)
-
-            # If device is not vmxnet3 device, add it to list of devices
-            # that will be add to the /etc/vpp/startup.conf.
-            # The vmxnet3 devices should not appear in startup.conf.
-            # Othervise vpp will capture them with vfio-pci driver,
-            # and 'create interface vmxnet3' will fail with 'device in use'.
-            device_driver = params.get('driver')
-            if device_driver is None or device_driver != 'vmxnet3':
-                pci_list.append(params['pci'])
+    for (_, params) in fwglobals.g.router_api.db_requests.fetch_requests('add-interface'):
+        iface_pci  = fwutils.pci_to_linux_iface(params['pci'])
+        if iface_pci:
+            cmd = {}
+            cmd['cmd'] = {}
+            cmd['cmd']['name']    = "exec"
+            cmd['cmd']['params']  = [ "sudo ip link set dev %s down && sudo ip addr flush dev %s" % (iface_pci ,iface_pci ) ]
+            cmd['cmd']['descr']   = "shutdown dev %s in Linux" % iface_pci
+            cmd['cmd']['depends_on'] = []
+            cmd['revert'] = {}
+            cmd['revert']['name']    = "exec"
+            cmd['revert']['params']  = [ "sudo netplan apply" ]
+            cmd['revert']['descr']  = "apply netplan configuration"
+            cmd_list.append(cmd)
+
+        # If device is not vmxnet3 device, add it to list of devices
+        # that will be add to the /etc/vpp/startup.conf.
+        # The vmxnet3 devices should not appear in startup.conf.
+        # Othervise vpp will capture them with vfio-pci driver,
+        # and 'create interface vmxnet3' will fail with 'device in use'.
+        device_driver = params.get('driver')
+        if device_driver is None or device_driver != 'vmxnet3':
+            pci_list.append(params['pci'])
 
     vpp_filename = fwglobals.g.VPP_CONFIG_FILE
 
@@ -149,6 +148,8 @@ def start_router(params=None):
         cmd['cmd'] = {}
         cmd['cmd']['name']    = "python"
         cmd['cmd']['descr']   = "add devices to %s" % vpp_filename
+        cmd['cmd']['id']      = 'vpp_startup_conf_devices'
+        cmd['cmd']['depends_on'] = []
         cmd['cmd']['params']  = {
             'module': 'fwutils',
             'func'  : 'vpp_startup_conf_add_devices',
@@ -169,6 +170,7 @@ def start_router(params=None):
     cmd['cmd'] = {}
     cmd['cmd']['name']    = "python"
     cmd['cmd']['descr']   = "add NAT to %s" % vpp_filename
+    cmd['cmd']['depends_on'] = [ 'vpp_startup_conf_devices' ] if len(pci_list) > 0 else []
     cmd['cmd']['params']  = {
         'module': 'fwutils',
         'func'  : 'vpp_startup_conf_add_nat',
@@ -193,6 +195,7 @@ def start_router(params=None):
     cmd['cmd']['name']    = "exec"
     cmd['cmd']['params']  = [ 'sudo modprobe vfio-pci  &&  (echo Y | sudo tee /sys/module/vfio/parameters/enable_unsafe_noiommu_mode)' ]
     cmd['cmd']['descr']   = "enable vfio-pci driver in Linux"
+    cmd['cmd']['depends_on'] = []
     cmd_list.append(cmd)
     cmd = {}
     cmd['cmd'] = {}
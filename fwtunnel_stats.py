@@ -25,11 +25,16 @@ import re
 import time
 from netaddr import *
 import shlex
+import threading
 from subprocess import Popen, PIPE, STDOUT
 
 import fwglobals
 
+# The registry of tunnels is updated by request handling threads one tunnel
+# at time, while the statistics are updated by the probing task, so it is
+# protected by lock. Note the lock is not held while tunnels are pinged.
 tunnel_stats_global = {}
+tunnel_stats_lock   = threading.Lock()
 
 TIMEOUT = 15
 WINDOW_SIZE = 30
@@ -46,30 +51,46 @@ def tunnel_stats_get_simple_cmd_output(cmd, stderr=STDOUT):
     args = shlex.split(cmd)
     return Popen(args, stdout=PIPE, stderr=stderr).communicate()[0]
  
-def tunnel_stats_get_ping_time(host):
-    """Use fping to get RTT.
+def tunnel_stats_get_ping_times(hosts):
+    """Use fping to get RTT of multiple hosts.
+    All hosts are probed by one fping invocation, that sends echo requests
+    to all of them concurrently and matches replies by itself.
+    The fping output looks like:
 
-    :param host:         IP address to ping.
+        10.100.0.5 : 0.47
+        10.100.0.7 : -
 
-    :returns: RTT value on success and 0 otherwise.
+    :param hosts:         List of IP addresses to ping.
+
+    :returns: Dictionary of RTT value by host. RTT of not responding host is 0.
     """
-    host = host.split(':')[0]
-    cmd = "fping {host} -C 1 -q".format(host=host)
-    res = [float(x) for x in tunnel_stats_get_simple_cmd_output(cmd).strip().split(':')[-1].split() if x != '-']
-    if len(res) > 0:
-        return sum(res) / len(res)
-    else:
-        return 0
+    hosts = list(set([host.split(':')[0] for host in hosts]))
+    rtts = dict([(host, 0) for host in hosts])
+    if not hosts:
+        return rtts
+    cmd = "fping -C 1 -q -i 1 {hosts}".format(hosts=' '.join(hosts))
+    for line in tunnel_stats_get_simple_cmd_output(cmd).splitlines():
+        if not ' : ' in line:       # Skip ICMP errors and other messages
+            continue
+        (host, times) = line.split(' : ', 1)
+        res = [float(x) for x in times.split() if x != '-']
+        if host.strip() in rtts and len(res) > 0:
+            rtts[host.strip()] = sum(res) / len(res)
+    return rtts
 
 def tunnel_stats_clear():
     """Clear previously collected statistics.
 
     :returns: None.
     """
-    tunnel_stats_global.clear()
+    with tunnel_stats_lock:
+        tunnel_stats_global.clear()
 
 def tunnel_stats_add(tunnel_id, loopback_addr):
     """Add tunnel statistics entry into a dictionary.
+    If the tunnel is registered already with the same loopback address,
+    e.g. when configuration is replayed on router start, its statistics
+    are preserved.
 
     :param tunnel_id:         Tunnel identifier.
     :param loopback_addr:     Loopback local end ip address.
@@ -77,39 +98,80 @@ def tunnel_stats_add(tunnel_id, loopback_addr):
     :returns: None.
     """
     ip_addr = IPNetwork(loopback_addr)
-    tunnel_stats_global[tunnel_id] = dict()
-    tunnel_stats_global[tunnel_id]['loopback_network'] = str(ip_addr)
-    tunnel_stats_global[tunnel_id]['sent'] = 0
-    tunnel_stats_global[tunnel_id]['received'] = 0
-    tunnel_stats_global[tunnel_id]['drop_rate'] = 0
-    tunnel_stats_global[tunnel_id]['rtt'] = 0
-    tunnel_stats_global[tunnel_id]['timestamp'] = 0
+    with tunnel_stats_lock:
+        entry = tunnel_stats_global.get(tunnel_id)
+        if entry and entry['loopback_network'] == str(ip_addr):
+            return
+    entry = dict()
+    entry['loopback_network'] = str(ip_addr)
+    entry['sent'] = 0
+    entry['received'] = 0
+    entry['drop_rate'] = 0
+    entry['rtt'] = 0
+    entry['timestamp'] = 0
 
     for ip in ip_addr:
         if (ip.value != ip_addr.value):
-            tunnel_stats_global[tunnel_id]['loopback_remote'] = str(ip)
+            entry['loopback_remote'] = str(ip)
         else:
-            tunnel_stats_global[tunnel_id]['loopback_local'] = str(ip)
+            entry['loopback_local'] = str(ip)
+
+    with tunnel_stats_lock:
+        tunnel_stats_global[tunnel_id] = entry
+
+def tunnel_stats_remove(tunnel_id):
+    """Remove tunnel statistics entry from a dictionary.
+
+    :param tunnel_id:         Tunnel identifier.
+
+    :returns: None.
+    """
+    with tunnel_stats_lock:
+        tunnel_stats_global.pop(tunnel_id, None)
+
+def tunnel_stats_sync(tunnels):
+    """Synchronize dictionary with the provided tunnels: add the missing
+    tunnels and remove the unknown ones. The statistics of the rest
+    are preserved.
+
+    :param tunnels:           Dictionary of loopback local end ip address by tunnel identifier.
+
+    :returns: None.
+    """
+    with tunnel_stats_lock:
+        for tunnel_id in tunnel_stats_global.keys():
+            if not tunnel_id in tunnels:
+                del tunnel_stats_global[tunnel_id]
+    for (tunnel_id, loopback_addr) in tunnels.items():
+        tunnel_stats_add(tunnel_id, loopback_addr)
 
 def tunnel_stats_test():
     """Update RTT, drop rate and other fields for all tunnels.
 
     :returns: None.
     """
-    for value in tunnel_stats_global.values():
-        value['sent'] += 1
+    with tunnel_stats_lock:
+        tunnels = tunnel_stats_global.items()
+    rtts = tunnel_stats_get_ping_times([value['loopback_remote'] for (_, value) in tunnels])
+
+    with tunnel_stats_lock:
+        for (tunnel_id, value) in tunnels:
+            if tunnel_stats_global.get(tunnel_id) is not value:
+                continue        # The tunnel was removed or replaced while it was pinged
 
-        rtt = tunnel_stats_get_ping_time(value['loopback_remote'])
-        if rtt > 0:
-            value['received'] += 1
-            value['timestamp'] = time.time()
+            value['sent'] += 1
 
-        value['rtt'] = value['rtt'] + (rtt - value['rtt']) / APPROX_FACTOR
-        value['drop_rate'] = 100 - value['received'] * 100 / value['sent']
+            rtt = rtts[value['loopback_remote'].split(':')[0]]
+            if rtt > 0:
+                value['received'] += 1
+                value['timestamp'] = time.time()
 
-        if (value['sent'] == WINDOW_SIZE):
-            value['sent'] = 0
-            value['received'] = 0
+            value['rtt'] = value['rtt'] + (rtt - value['rtt']) / APPROX_FACTOR
+            value['drop_rate'] = 100 - value['received'] * 100 / value['sent']
+
+            if (value['sent'] == WINDOW_SIZE):
+                value['sent'] = 0
+                value['received'] = 0
 
 def tunnel_stats_get():
     """Return a new tunnel status dictionary.
@@ -120,14 +182,15 @@ def tunnel_stats_get():
     tunnel_stats = {}
     cur_time = time.time()
 
-    for key, value in tunnel_stats_global.items():
-        tunnel_stats[key] = dict()
-        tunnel_stats[key]['rtt'] = value['rtt']
-        tunnel_stats[key]['drop_rate'] = value['drop_rate']
+    with tunnel_stats_lock:
+        for key, value in tunnel_stats_global.items():
+            tunnel_stats[key] = dict()
+            tunnel_stats[key]['rtt'] = value['rtt']
+            tunnel_stats[key]['drop_rate'] = value['drop_rate']
 
-        if ((value['timestamp'] == 0) or (cur_time - value['timestamp'] > TIMEOUT)):
-            tunnel_stats[key]['status'] = 'down'
-        else:
-            tunnel_stats[key]['status'] = 'up'
+            if ((value['timestamp'] == 0) or (cur_time - value['timestamp'] > TIMEOUT)):
+                tunnel_stats[key]['status'] = 'down'
+            else:
+                tunnel_stats[key]['status'] = 'up'
 
     return tunnel_stats
@@ -45,23 +45,99 @@ from fwdb_requests import FwDbRequests
 
 dpdk = __import__('dpdk-devbind')
 
-def get_device_logs(file, num_of_lines):
+# Severity levels of log messages, the most severe first
+LOG_LEVELS = ['excep', 'error', 'warning', 'info', 'debug']
+
+def get_device_logs(file, num_of_lines, level=None, since=None, until=None, substring=None, records=None):
     """Get device logs.
+    The latest lines are taken out of the in-memory log records if they have
+    enough matching lines, otherwise the file is read backwards from its end,
+    block by block, until enough matching lines are found.
 
     :param file:            File name.
     :param num_of_lines:    Number of lines.
+    :param level:           Return lines of this severity level or above, e.g. 'warning'.
+    :param since:           Return lines logged at this time (epoch seconds) or later.
+    :param until:           Return lines logged at this time (epoch seconds) or earlier.
+    :param substring:       Return lines that include this substring.
+    :param records:         Iterable of (time, level, line) in-memory records, the newest first.
 
     :returns: Return list.
     """
-    try:
-        cmd = "tail -{} {}".format(num_of_lines, file)
-        res = subprocess.check_output(cmd, shell=True).split('\n')
+    num_of_lines = int(num_of_lines)
+    max_level = LOG_LEVELS.index(level) if level else None
+    if level == 'info':
+        max_level += 1      # The syslog file does not distinguish info and debug messages
+
+    def _match(t, lvl, line):
+        if max_level is not None and LOG_LEVELS.index(lvl) > max_level:
+            return False
+        if substring and not substring in line:
+            return False
+        if until and t() > until:
+            return False
+        return True
+
+    for source in ([records] if records is not None else []) + [None]:
+        if source is None:
+            source = _read_log_records(file)
+        res = []
+        for (t, lvl, line) in source:
+            if len(res) >= num_of_lines:
+                break
+            t = t if callable(t) else (lambda t=t: t)
+            if since and t() < since:
+                break       # Lines are ordered by time, so the rest is older
+            if _match(t, lvl, line):
+                res.append(line)
+        if len(res) >= num_of_lines:
+            break
+    res.reverse()
+    return res
+
+def _read_log_records(file, block_size=65536):
+    """Read syslog file backwards without loading it into memory.
+    The lines are parsed into (time, level, line) records, where
+    time is function that parses timestamp of line on demand, as lines
+    of syslog file have 'Oct  7 12:01:02 host fwagent: message' format.
+
+    :param file:            File name.
+    :param block_size:      Size of block to read at once.
 
-        # On zero matching, res is a list with a single empty
-        # string which we do not want to return to the caller
-        return res if res != [''] else []
-    except (OSError, subprocess.CalledProcessError) as err:
-        raise err
+    :returns: Generator of records, the newest first.
+    """
+    now = time.localtime()
+    def _time(line):
+        try:
+            tm = time.strptime("%d %s" % (now.tm_year, line[:15]), "%Y %b %d %H:%M:%S")
+        except ValueError:
+            return 0
+        if tm > now:    # The year is not logged, so the line was logged last year
+            tm = time.strptime("%d %s" % (now.tm_year - 1, line[:15]), "%Y %b %d %H:%M:%S")
+        return time.mktime(tm)
+
+    def _level(line):
+        message = line[16:].split(': ', 1)[-1]
+        for (prefix, lvl) in [('excep: ', 'excep'), ('error: ', 'error'), ('*** warning: ', 'warning')]:
+            if message.startswith(prefix):
+                return lvl
+        return 'info'
+
+    with open(file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos  = f.tell()
+        tail = ''       # Incomplete line at the beginning of the previous block
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + tail).split('\n')
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield (lambda line=line: _time(line), _level(line), line)
+        if tail:
+            yield (lambda line=tail: _time(line), _level(tail), tail)
 
 def get_agent_version(fname):
     """Get agent version.
@@ -101,11 +177,7 @@ def vpp_pid():
 
     :returns:           process identifier.
     """
-    try:
-        pid = subprocess.check_output(['pidof', 'vpp'])
-    except:
-        pid = None
-    return pid
+    return fwglobals.g.vpp_monitor.pid()
 
 def vpp_does_run():
     """Check if VPP is running.
@@ -287,15 +359,8 @@ def pci_is_vmxnet3(pci):
 
 # 'pci_to_vpp_if_name' function maps interface referenced by pci, eg. '0000:00:08.00'
 # into name of interface in VPP, eg. 'GigabitEthernet0/8/0'.
-# To do that we dump all hardware interfaces, split the dump into list by empty line,
-# and search list for interface that includes the pci name.
-# The dumps brings following table:
-#              Name                Idx    Link  Hardware
-# GigabitEthernet0/8/0               1    down  GigabitEthernet0/8/0
-#   Link speed: unknown
-#   ...
-#   pci: device 8086:100e subsystem 8086:001e address 0000:00:08.00 numa 0
-#
+# The mapping is taken from the interface cache kept by VPP_API,
+# see FwIfCache for details.
 def pci_to_vpp_if_name(pci):
     """Convert PCI address into VPP interface name.
 
@@ -303,34 +368,10 @@ def pci_to_vpp_if_name(pci):
 
     :returns: VPP interface name.
     """
-    # vpp_api.cli() throw exception in vpp 19.01 (and work with vpp 19.04)
-    # hw = fwglobals.g.router_api.vpp_api.cli("show hardware")
-    hw = _vppctl_read('show hardware-interfaces')
-    if hw is None:
-        raise Exception("pci_to_vpp_if_name: failed to fetch hardware info from VPP")
-    for hw_if in re.split(r'\n\s*\n+', hw):
-        if re.search(pci, hw_if):
-            # In the interface description find line that has word at the beginning.
-            # This word is interface name. All the rest of lines start with spaces.
-            for line in hw_if.splitlines():
-                match = re.match(r'([^\s]+)', line)
-                if match:
-                    vpp_if_name = match.group(1)
-                    break
-            return vpp_if_name
-    fwglobals.log.debug("pci_to_vpp_if_name(%s): not found in 'sh hard'" % (pci))
-
-    # If no hardware interfaces were found, try vmxnet3 interfaces
-    pci_bytes = pci_str_to_bytes(pci)
-    hw_1 = fwglobals.g.router_api.vpp_api.vpp.api.vmxnet3_dump()
-    for hw_if in hw_1:
-        if hw_if.pci_addr == pci_bytes:
-            vpp_if_name = hw_if.if_name.rstrip(' \t\r\n\0')
-            return vpp_if_name
-
-    fwglobals.log.debug("pci_to_vpp_if_name(%s): sh hard: %s" % (pci, str(hw)))
-    fwglobals.log.debug("pci_to_vpp_if_name(%s): sh vmxnet3: %s" % (pci, str(hw_1)))
-    return None
+    vpp_if_name = fwglobals.g.router_api.vpp_api.if_cache.pci_to_vpp_if_name(pci)
+    if vpp_if_name is None:
+        fwglobals.log.debug("pci_to_vpp_if_name(%s): not found" % (pci))
+    return vpp_if_name
 
 
 # 'pci_str_to_bytes' converts "0000:0b:00.0" string to bytes to pack following struct:
@@ -359,9 +400,6 @@ def pci_str_to_bytes(pci_str):
 
 # 'pci_to_vpp_sw_if_index' function maps interface referenced by pci, e.g '0000:00:08.00'
 # into index of this interface in VPP, eg. 1.
-# To do that we convert firstly the pci into name of interface in VPP,
-# e.g. 'GigabitEthernet0/8/0', than we dump all VPP interfaces and search for interface
-# with this name. If found - return interface index.
 def pci_to_vpp_sw_if_index(pci):
     """Convert PCI address into VPP sw_if_index.
 
@@ -369,24 +407,16 @@ def pci_to_vpp_sw_if_index(pci):
 
     :returns: sw_if_index.
     """
-
-    vpp_if_name = pci_to_vpp_if_name(pci)
-    fwglobals.log.debug("pci_to_vpp_sw_if_index(%s): vpp_if_name: %s" % (pci, str(vpp_if_name)))
-    if vpp_if_name is None:
-        return None
-
-    sw_ifs = fwglobals.g.router_api.vpp_api.vpp.api.sw_interface_dump()
-    for sw_if in sw_ifs:
-        if re.match(vpp_if_name, sw_if.interface_name):    # Use regex, as sw_if.interface_name might include trailing whitespaces 
-            return  sw_if.sw_if_index
-    fwglobals.log.debug("pci_to_vpp_sw_if_index(%s): vpp_if_name: %s" % (pci, yaml.dump(sw_ifs, canonical=True)))
-    return None
+    sw_if_index = fwglobals.g.router_api.vpp_api.if_cache.pci_to_vpp_sw_if_index(pci)
+    if sw_if_index is None:
+        fwglobals.log.debug("pci_to_vpp_sw_if_index(%s): not found" % (pci))
+    return sw_if_index
 
 # 'pci_to_tap' function maps interface referenced by pci, e.g '0000:00:08.00'
 # into interface in Linux created by 'vppctl enable tap-inject' command, e.g. vpp1.
 # To do that we convert firstly the pci into name of interface in VPP,
-# e.g. 'GigabitEthernet0/8/0' and than we grep output of 'vppctl sh tap-inject'
-# command by this name:
+# e.g. 'GigabitEthernet0/8/0' and than we map it into tap by output of
+# 'vppctl sh tap-inject' command:
 #   root@ubuntu-server-1:/# vppctl sh tap-inject
 #       GigabitEthernet0/8/0 -> vpp0
 #       GigabitEthernet0/9/0 -> vpp1
@@ -405,7 +435,8 @@ def pci_to_tap(pci):
 
 # 'vpp_if_name_to_tap' function maps name of interface in VPP, e.g. loop0,
 # into name of correspondent tap interface in Linux.
-# To do that it greps output of 'vppctl sh tap-inject' by the interface name:
+# The mapping is taken from the interface cache kept by VPP_API,
+# that reads it out of 'vppctl sh tap-inject':
 #   root@ubuntu-server-1:/# vppctl sh tap-inject
 #       GigabitEthernet0/8/0 -> vpp0
 #       GigabitEthernet0/9/0 -> vpp1
@@ -413,31 +444,16 @@ def pci_to_tap(pci):
 def vpp_if_name_to_tap(vpp_if_name):
     """Convert VPP interface name into Linux TAP interface name.
 
-     :param vpp_if_name:      PCI address.
+     :param vpp_if_name:      VPP interface name.
 
      :returns: Linux TAP interface name.
      """
-    # vpp_api.cli() throw exception in vpp 19.01 (and works in vpp 19.04)
-    # taps = fwglobals.g.router_api.vpp_api.cli("show tap-inject")
-    taps = _vppctl_read("show tap-inject")
-    if taps is None:
-        raise Exception("vpp_if_name_to_tap: failed to fetch tap info from VPP")
-
-    pattern = '%s -> ([a-zA-Z0-9]+)' % vpp_if_name
-    match = re.search(pattern, taps)
-    if match is None:
-        return None
-    tap = match.group(1)
-    return tap
+    return fwglobals.g.router_api.vpp_api.if_cache.vpp_if_name_to_tap(vpp_if_name)
 
 # 'sw_if_index_to_tap' function maps sw_if_index assigned by VPP to some interface,
 # e.g '4' into interface in Linux created by 'vppctl enable tap-inject' command, e.g. vpp2.
-# To do that we dump all interfaces from VPP, find the one with the provided index,
-# take its name, e.g. loop0, and grep output of 'vppctl sh tap-inject' by this name:
-#   root@ubuntu-server-1:/# vppctl sh tap-inject
-#       GigabitEthernet0/8/0 -> vpp0
-#       GigabitEthernet0/9/0 -> vpp1
-#       loop0 -> vpp2
+# To do that we take name of interface with the provided index out of
+# the interface cache, e.g. loop0, and map it into tap.
 def vpp_sw_if_index_to_tap(sw_if_index):
     """Convert VPP sw_if_index into Linux TAP interface name.
 
@@ -445,10 +461,10 @@ def vpp_sw_if_index_to_tap(sw_if_index):
 
      :returns: Linux TAP interface name.
      """
-    for sw_if in fwglobals.g.router_api.vpp_api.vpp.api.sw_interface_dump():
-        if sw_if_index == sw_if.sw_if_index:
-            tap = vpp_if_name_to_tap(sw_if.interface_name.rstrip(' \t\r\n\0'))
-            return tap
+    vpp_if_name = fwglobals.g.router_api.vpp_api.if_cache.vpp_sw_if_index_to_name(sw_if_index)
+    if vpp_if_name is None:
+        return None
+    return vpp_if_name_to_tap(vpp_if_name)
 
 def save_file(txt, fname, dir='/tmp'):
     """Save txt to file under a dir (default = /tmp)
@@ -493,6 +509,8 @@ def _sub_file(fname, smap):
 
 def _vppctl_read(cmd, wait=True):
     """Read command from VPP.
+    The command is executed over the persistent VPP CLI session kept by the
+    router API. If the session can't be used, 'sudo vppctl' is spawned.
 
     :param cmd:       Command to execute (not including vppctl).
     :param wait:      Whether to wait until command succeeds.
@@ -511,8 +529,14 @@ def _vppctl_read(cmd, wait=True):
         time.sleep(retries_sleep)
     if not os.path.exists("/run/vpp/cli.sock"):
         return None
+    router_api = getattr(fwglobals.g, 'router_api', None)
+    vpp_cli = getattr(router_api, 'vpp_cli', None)
     # make sure command succeeded, try up to 200 iterations
     for _ in range(retries):
+        if vpp_cli:
+            data = vpp_cli.cli(cmd)
+            if data is not None:
+                return data
         try:
             _ = open(os.devnull, 'r+b', 0)
             handle = os.popen('sudo vppctl ' + cmd + ' 2>/dev/null')
@@ -666,14 +690,20 @@ def disconnect_from_router():
      :returns: None.
      """
     fwglobals.g.router_api.vpp_api.disconnect()
+    fwglobals.g.router_api.vpp_cli.disconnect()
+    fwglobals.g.router_api.vpp_stats_api.disconnect()
 
 def reset_router_config():
     """Reset router config by cleaning DB and removing config files.
 
      :returns: None.
      """
-    with FwDbRequests(fwglobals.g.SQLITE_DB_FILE) as db_requests:
-        db_requests.clean()
+    router_api = getattr(fwglobals.g, 'router_api', None)
+    if router_api:      # Go through the memory-resident mirror of DB, if we run within agent
+        router_api.db_requests.clean()
+    else:
+        with FwDbRequests(fwglobals.g.SQLITE_DB_FILE) as db_requests:
+            db_requests.clean()
     if os.path.exists(fwglobals.g.ROUTER_STATE_FILE):
         os.remove(fwglobals.g.ROUTER_STATE_FILE)
     if os.path.exists(fwglobals.g.FRR_OSPFD_FILE):
@@ -715,30 +745,24 @@ def get_router_config(full=False):
         else:
             return {'message': request, 'params': params}
 
-    with FwDbRequests(fwglobals.g.SQLITE_DB_FILE) as db_requests:
+    def _dump_config(db_requests, full):
         cfg = []
 
         # Dump start-router request
-        if full and 'start-router' in db_requests.db:
+        if full and db_requests.exists('start-router'):
             cfg.append(_dump_config_request(db_requests, 'start-router', full))
-        # Dump interfaces
-        for key in db_requests.db:
-            if re.match('add-interface', key):
-                cfg.append(_dump_config_request(db_requests, key, full))
-        # Dump routes
-        for key in db_requests.db:
-            if re.match('add-route', key):
-                cfg.append(_dump_config_request(db_requests, key, full))
-        # Dump tunnels
-        for key in db_requests.db:
-            if re.match('add-tunnel', key):
-                cfg.append(_dump_config_request(db_requests, key, full))
-        # Dump dhcp configuration
-        for key in db_requests.db:
-            if re.match('add-dhcp-config', key):
+        # Dump interfaces, routes, tunnels and dhcp configuration
+        for req in ['add-interface', 'add-route', 'add-tunnel', 'add-dhcp-config']:
+            for key in db_requests.fetch_keys(req):
                 cfg.append(_dump_config_request(db_requests, key, full))
         return cfg if len(cfg) > 0 else None
 
+    router_api = getattr(fwglobals.g, 'router_api', None)
+    if router_api:      # Go through the memory-resident mirror of DB, if we run within agent
+        return _dump_config(router_api.db_requests, full)
+    with FwDbRequests(fwglobals.g.SQLITE_DB_FILE) as db_requests:
+        return _dump_config(db_requests, full)
+
 def print_router_config(full=False):
     """Print router configuration.
 
@@ -756,40 +780,21 @@ def print_router_config(full=False):
         print("")
 
     with FwDbRequests(fwglobals.g.SQLITE_DB_FILE) as db_requests:
-        if 'start-router' in db_requests.db:
+        if db_requests.exists('start-router'):
             print("======== START COMMAND =======")
             _print_config_request(db_requests, 'start-router', full)
 
-        head_line_printed = False
-        for key in db_requests.db:
-            if re.match('add-interface', key):
-                if not head_line_printed:
-                    print("========= INTERFACES =========")
-                    head_line_printed = True
-                _print_config_request(db_requests, key, full)
-
-        head_line_printed = False
-        for key in db_requests.db:
-            if re.match('add-route', key):
-                if not head_line_printed:
-                    print("=========== ROUTES ===========")
-                    head_line_printed = True
-                _print_config_request(db_requests, key, full)
-
-        head_line_printed = False
-        for key in db_requests.db:
-            if re.match('add-tunnel', key):
-                if not head_line_printed:
-                    print("=========== TUNNELS ==========")
-                    head_line_printed = True
-                _print_config_request(db_requests, key, full)
-
-        head_line_printed = False
-        for key in db_requests.db:
-            if re.match('add-dhcp-config', key):
-                if not head_line_printed:
-                    print("=========== DHCP CONFIG ==========")
-                    head_line_printed = True
+        sections = [
+            ('add-interface',   "========= INTERFACES ========="),
+            ('add-route',       "=========== ROUTES ==========="),
+            ('add-tunnel',      "=========== TUNNELS =========="),
+            ('add-dhcp-config', "=========== DHCP CONFIG ==========")
+        ]
+        for (req, head_line) in sections:
+            keys = db_requests.fetch_keys(req)
+            if keys:
+                print(head_line)
+            for key in keys:
                 _print_config_request(db_requests, key, full)
 
 #
@@ -843,10 +848,18 @@ def _parse_add_if(s, res):
     res[if_name] = {'rx_pkts':long(rx_pkts), 'tx_pkts':long(tx_pkts), 'rx_bytes':long(rx_bytes), 'tx_bytes':long(tx_bytes)}
 
 def get_vpp_if_count():
-    """Get number of VPP interfaces.
+    """Get counters of VPP interfaces.
+    The counters are read out of the VPP statistics segment.
+    If it is not available, they are parsed out of 'sh int' output.
 
      :returns: Dictionary with results.
      """
+    router_api = getattr(fwglobals.g, 'router_api', None)
+    if router_api:
+        counters = router_api.vpp_stats_api.get_if_counters()
+        if counters is not None:
+            return {'message':counters, 'ok':1}
+
     shif = _vppctl_read('sh int', wait=False)
     if shif == None:  # Exit with an error
         return {'message':'Error reading interface info', 'ok':0}
@@ -1095,16 +1108,11 @@ def vpp_startup_conf_remove_nat(params):
 def _get_interface_address(pci):
     """ Get interface ip address from commands DB.
     """
-    for key, request in fwglobals.g.router_api.db_requests.db.items():
-
-        if not re.search('add-interface', key):
-            continue
-        if request['params']['pci'] != pci:
-            continue
-        addr = request['params']['addr']
-        return addr
-
-    return None
+    interfaces = fwglobals.g.router_api.db_requests.fetch_requests('add-interface', pci=pci)
+    if not interfaces:
+        return None
+    (_, params) = interfaces[0]
+    return params['addr']
 
 def reset_dhcpd():
     if os.path.exists(fwglobals.g.DHCPD_CONFIG_FILE_BACKUP):
@@ -0,0 +1,216 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import ctypes
+import os
+import select
+import threading
+import time
+
+import fwglobals
+
+SYS_PIDFD_OPEN = 434    # The same on all architectures, supported by Linux 5.3 and above
+
+class FwVppMonitor:
+    """This is VPP liveness monitor class representation.
+    It finds VPP process by scan of /proc once, and then checks that it is
+    alive by reading /proc/<pid>/stat, so the liveness check neither forks
+    'pidof' nor sends anything to VPP. The start time of process is checked
+    as well to detect reuse of pid by other process.
+    Once somebody subscribes for VPP state changes, the monitor thread is
+    started. It waits for VPP exit on pidfd, if kernel supports it, or polls
+    /proc/<pid> every POLL_PERIOD otherwise, and notifies subscribers
+    immediately. While VPP does not run, the thread looks for the new VPP
+    process every SCAN_PERIOD.
+
+    :param proc_root: Mount point of proc file system.
+    """
+    POLL_PERIOD = 0.1   # Seconds
+    SCAN_PERIOD = 1     # Seconds
+
+    def __init__(self, proc_root='/proc'):
+        """Constructor method
+        """
+        self.proc_root   = proc_root
+        self.vpp_pid     = None     # Pid of VPP as string
+        self.start_time  = None     # Start time of VPP process taken from /proc/<pid>/stat
+        self.subscribers = []
+        self.lock        = threading.Lock()
+        self.thread      = None
+        self.active      = False
+        self.pidfd_open  = None
+        try:
+            self.pidfd_open = ctypes.CDLL(None, use_errno=True).syscall
+        except Exception:
+            pass
+
+    def finalize(self):
+        """Destructor method
+        """
+        self.active = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def pid(self):
+        """Get pid of VPP process.
+
+        :returns: Pid of VPP as string or None if VPP does not run.
+        """
+        with self.lock:
+            old_pid = self.vpp_pid
+            if self.vpp_pid and self._get_start_time(self.vpp_pid) == self.start_time:
+                return self.vpp_pid
+            (self.vpp_pid, self.start_time) = self._find_vpp()
+            vpp_pid = self.vpp_pid
+        if vpp_pid != old_pid:
+            self._notify(vpp_pid)
+        return vpp_pid
+
+    def subscribe(self, callback):
+        """Subscribe for VPP state changes. The callback is called with pid
+        of the new VPP process or with None if VPP exited. It is called
+        on the monitor thread, so it should not block.
+
+        :param callback: Function that gets pid of VPP.
+
+        :returns: None.
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+            if not self.thread:
+                self.active = True
+                self.thread = threading.Thread(target=self._loop, name='VPP Monitor Thread')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def unsubscribe(self, callback):
+        """Unsubscribe from VPP state changes.
+
+        :param callback: Function that was passed to subscribe().
+
+        :returns: None.
+        """
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def _notify(self, vpp_pid):
+        fwglobals.log.debug("FwVppMonitor: vpp %s" % ("started (pid=%s)" % vpp_pid if vpp_pid else "exited"))
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(vpp_pid)
+            except Exception as e:
+                fwglobals.log.error("FwVppMonitor: subscriber failed: %s" % str(e))
+
+    def _loop(self):
+        """Monitor thread loop.
+        """
+        while self.active:
+            vpp_pid = self.pid()
+            if not vpp_pid:
+                time.sleep(self.SCAN_PERIOD)
+                continue
+            pidfd = self._open_pidfd(vpp_pid)
+            try:
+                while self.active:
+                    if pidfd is not None:
+                        (r, _, _) = select.select([pidfd], [], [], self.SCAN_PERIOD)
+                        if r:
+                            break       # Process exited
+                    else:
+                        time.sleep(self.POLL_PERIOD)
+                        if self._get_start_time(vpp_pid) != self.start_time:
+                            break
+            finally:
+                if pidfd is not None:
+                    os.close(pidfd)
+
+    def _open_pidfd(self, vpp_pid):
+        """Open file descriptor that becomes readable when process exits.
+
+        :returns: File descriptor or None if it is not supported.
+        """
+        if not self.pidfd_open:
+            return None
+        fd = self.pidfd_open(SYS_PIDFD_OPEN, int(vpp_pid), 0)
+        if fd < 0:
+            return None
+        return fd
+
+    def _get_start_time(self, pid):
+        """Get start time of process out of /proc/<pid>/stat.
+
+        :returns: Start time in clock ticks or None if there is no such process
+                  or it has exited already.
+        """
+        try:
+            with open(os.path.join(self.proc_root, pid, 'stat')) as f:
+                stat = f.read()
+        except (IOError, OSError):
+            return None
+        # The process name is in parentheses and might include spaces,
+        # the state is the 3rd field and the start time is the 22nd field.
+        fields = stat[stat.rfind(')') + 2:].split()
+        if fields[0] in ['Z', 'X']:
+            return None
+        return fields[19]
+
+    def _find_vpp(self):
+        """Find VPP process by scan of /proc.
+
+        :returns: Tuple of pid and start time, or (None, None) if VPP does not run.
+        """
+        for pid in os.listdir(self.proc_root):
+            if not pid.isdigit() or not self._is_vpp(pid):
+                continue
+            start_time = self._get_start_time(pid)
+            if start_time:
+                return (pid, start_time)
+        return (None, None)
+
+    def _is_vpp(self, pid):
+        """Check if process is VPP the way 'pidof' does: by name of executable,
+        by the first argument of command line or by process name.
+        Note the process name is the name of main thread, that VPP renames
+        to 'vpp_main', so it can't be relied on alone.
+
+        :returns: 'True' if process is VPP, 'False' otherwise.
+        """
+        proc_dir = os.path.join(self.proc_root, pid)
+        try:
+            exe = os.readlink(os.path.join(proc_dir, 'exe'))
+            if os.path.basename(exe).split(' (deleted)')[0] == 'vpp':
+                return True
+        except (IOError, OSError):
+            pass    # Executable is not accessible, e.g. for kernel threads
+        try:
+            with open(os.path.join(proc_dir, 'cmdline')) as f:
+                argv0 = f.read().split('\0')[0]
+            if os.path.basename(argv0) == 'vpp':
+                return True
+            with open(os.path.join(proc_dir, 'comm')) as f:
+                return f.read().strip() == 'vpp'
+        except (IOError, OSError):
+            return False
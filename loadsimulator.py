@@ -182,48 +182,7 @@ class LoadSimulator:
                      'message': {self.interface_wan: dict(self.simulate_stats),
                                  self.interface_lan: dict(self.simulate_stats)}}
 
-        if new_stats['ok'] == 1:
-            prev_stats = dict(fwstats.stats)  # copy of prev stats
-            fwstats.stats['time'] = time.time()
-            fwstats.stats['last'] = new_stats['message']
-            fwstats.stats['ok'] = 1
-            # Update info if previous stats valid
-            if prev_stats['ok'] == 1:
-                if_bytes = {}
-                for intf, counts in fwstats.stats['last'].items():
-                    prev_stats_if = prev_stats['last'].get(intf, None)
-                    if prev_stats_if != None:
-                        rx_bytes = 1.0 * (counts['rx_bytes'] - prev_stats_if['rx_bytes'])
-                        rx_pkts = 1.0 * (counts['rx_pkts'] - prev_stats_if['rx_pkts'])
-                        tx_bytes = 1.0 * (counts['tx_bytes'] - prev_stats_if['tx_bytes'])
-                        tx_pkts = 1.0 * (counts['tx_pkts'] - prev_stats_if['tx_pkts'])
-                        if_bytes[intf] = {
-                            'rx_bytes': rx_bytes,
-                            'rx_pkts': rx_pkts,
-                            'tx_bytes': tx_bytes,
-                            'tx_pkts': tx_pkts
-                        }
-
-                fwstats.stats['bytes'] = if_bytes
-                fwstats.stats['tunnel_stats'] = self.simulate_tunnel_stats
-                fwstats.stats['period'] = fwstats.stats['time'] - prev_stats['time']
-                fwstats.stats['running'] = True
-        else:
-            fwstats.stats['ok'] = 0
-
-        # Add the update to the list of updates. If the list is full,
-        # remove the oldest update before pushing the new one
-        if len(fwstats.updates_list) is fwstats.UPDATE_LIST_MAX_SIZE:
-            fwstats.updates_list.pop(0)
-
-        fwstats.updates_list.append({
-            'ok': fwstats.stats['ok'],
-            'running': fwstats.stats['running'],
-            'stats': fwstats.stats['bytes'],
-            'period': fwstats.stats['period'],
-            'tunnel_stats': fwstats.stats['tunnel_stats'],
-            'utc': time.time()
-        })
+        fwstats.add_stats(new_stats, self.simulate_tunnel_stats, running=True)
 
 def initialize():
     """Initialize a singleton.
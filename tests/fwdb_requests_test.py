@@ -0,0 +1,177 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+from fwdb_requests import FwDbRequests
+from sqlitedict import SqliteDict
+
+def _db_file():
+    (fd, db_file) = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    os.remove(db_file)
+    return db_file
+
+######################################################################
+# This Test checks that write of other thread is not rolled back
+# together with the transaction, but waits until it is finished.
+######################################################################
+def test_transaction_isolates_other_threads():
+    db_file = _db_file()
+    try:
+        with FwDbRequests(db_file, cache=True) as db:
+            events = []
+            def _write():
+                db.update('key2', 'add-route', {'via': '10.0.0.1'}, [], True)
+                events.append('written')
+
+            writer = threading.Thread(target=_write)
+            try:
+                with db.transaction():
+                    db.update('key1', 'add-route', {'via': '10.0.0.2'}, [], True)
+                    writer.start()
+                    time.sleep(0.2)
+                    assert events == []         # The other thread waits for the transaction
+                    raise Exception('rollback')
+            except Exception:
+                pass
+            writer.join()
+
+            assert events == ['written']
+            assert not db.exists('key1')
+            assert db.exists('key2')
+        with FwDbRequests(db_file) as db:       # Ensure it was committed to file
+            assert db.fetch_keys() == ['key2']
+    finally:
+        os.remove(db_file)
+
+######################################################################
+# This Test checks that nested transactions of the same thread are
+# committed once on exit of the outermost block.
+######################################################################
+def test_transaction_nested():
+    db_file = _db_file()
+    try:
+        with FwDbRequests(db_file, cache=True) as db:
+            with db.transaction():
+                db.update('key1', 'add-route', {}, [], True)
+                with db.transaction():
+                    db.update('key2', 'add-route', {}, [], True)
+            assert db.fetch_keys() == ['key1', 'key2']
+    finally:
+        os.remove(db_file)
+
+######################################################################
+# This Test checks that requests stored by previous versions of agent
+# in SqliteDict are moved into the indexed table in order of storing.
+######################################################################
+def test_migrate_sqlitedict():
+    db_file = _db_file()
+    try:
+        old_db = SqliteDict(db_file, autocommit=True)
+        old_db['add-interface:pci:0000:00:08.00'] = {
+            'request': 'add-interface', 'params': {'pci': '0000:00:08.00', 'addr': '10.0.0.4/24'},
+            'cmd_list': [{'cmd': {'name': 'exec'}}], 'executed': True }
+        old_db['add-route:10.1.0.0/16:10.0.0.1'] = {
+            'request': 'add-route', 'params': {'addr': '10.1.0.0/16', 'via': '10.0.0.1'},
+            'cmd_list': [], 'executed': False }
+        old_db.close()
+
+        with FwDbRequests(db_file) as db:
+            assert db.fetch_keys() == ['add-interface:pci:0000:00:08.00', 'add-route:10.1.0.0/16:10.0.0.1']
+            assert db.fetch_request('add-interface:pci:0000:00:08.00') == \
+                   ('add-interface', {'pci': '0000:00:08.00', 'addr': '10.0.0.4/24'})
+            assert db.fetch_cmd_list('add-route:10.1.0.0/16:10.0.0.1') == ([], False)
+            assert db.fetch_requests('add-route', via='10.0.0.1') == \
+                   [('add-route:10.1.0.0/16:10.0.0.1', {'addr': '10.1.0.0/16', 'via': '10.0.0.1'})]
+            assert db.fetch_requests('add-interface', pci='0000:00:08.00')[0][0] == 'add-interface:pci:0000:00:08.00'
+
+        with FwDbRequests(db_file) as db:       # The old table was dropped, so nothing is migrated twice
+            assert len(db.fetch_keys()) == 2
+    finally:
+        os.remove(db_file)
+
+######################################################################
+# This Test checks that filtered fetch out of memory-resident mirror
+# follows updates, removals and rollback of entries, and keeps order
+# the entries were stored in.
+######################################################################
+def test_fetch_requests_cached():
+    db_file = _db_file()
+    try:
+        with FwDbRequests(db_file, cache=True) as db:
+            db.add('add-tunnel:1', 'add-tunnel', {'src': '10.0.0.4', 'tunnel-id': 1}, [], True)
+            db.add('add-tunnel:2', 'add-tunnel', {'src': '10.0.0.5', 'tunnel-id': 2}, [], True)
+            db.add('add-tunnel:3', 'add-tunnel', {'src': '10.0.0.4', 'tunnel-id': 3}, [], True)
+            db.add('add-route:1',  'add-route',  {'addr': '10.1.0.0/16', 'via': '10.0.0.1'}, [], True)
+            db.add('add-route:2',  'add-route',  {'addr': '10.2.0.0/16', 'via': '10.0.0.1'}, [], True)
+            assert [key for (key, _) in db.fetch_requests('add-tunnel', src='10.0.0.4')] == ['add-tunnel:1', 'add-tunnel:3']
+            assert [key for (key, _) in db.fetch_requests('add-route', via='10.0.0.1')] == ['add-route:1', 'add-route:2']
+            assert db.fetch_requests('add-route', src='10.0.0.4') == []
+            assert db.fetch_requests('add-tunnel', src='10.0.0.4', via='10.0.0.1') == []
+
+            # Update re-stores entry at the end, so it moves in the order as well
+            db.update('add-tunnel:1', 'add-tunnel', {'src': '10.0.0.4', 'tunnel-id': 1}, [], True)
+            db.update('add-tunnel:2', 'add-tunnel', {'src': '10.0.0.4', 'tunnel-id': 2}, [], True)
+            assert [key for (key, _) in db.fetch_requests('add-tunnel', src='10.0.0.4')] == \
+                   ['add-tunnel:3', 'add-tunnel:1', 'add-tunnel:2']
+            assert db.fetch_requests('add-tunnel', src='10.0.0.5') == []
+
+            db.remove('add-route:1')
+            assert [key for (key, _) in db.fetch_requests('add-route', via='10.0.0.1')] == ['add-route:2']
+
+            try:
+                with db.transaction():
+                    db.remove('add-route:2')
+                    db.add('add-route:3', 'add-route', {'addr': '10.3.0.0/16', 'via': '10.0.0.2'}, [], True)
+                    raise Exception('rollback')
+            except Exception:
+                pass
+            assert db.fetch_requests('add-route', via='10.0.0.1') == \
+                   [('add-route:2', {'addr': '10.2.0.0/16', 'via': '10.0.0.1'})]
+            assert db.fetch_requests('add-route', via='10.0.0.2') == []
+
+            db.clean()
+            assert db.fetch_requests('add-tunnel', src='10.0.0.4') == []
+
+        with FwDbRequests(db_file) as db:
+            db.add('add-tunnel:4', 'add-tunnel', {'src': '10.0.0.6', 'tunnel-id': 4}, [], True)
+        with FwDbRequests(db_file, cache=True) as db:
+            assert [key for (key, _) in db.fetch_requests('add-tunnel', src='10.0.0.6')] == ['add-tunnel:4']
+            db.db.execute("DELETE FROM requests")       # Emulate modification by other process
+            db.reload()
+            assert db.fetch_requests('add-tunnel', src='10.0.0.6') == []
+    finally:
+        os.remove(db_file)
+
+if __name__ == '__main__':
+    test_transaction_isolates_other_threads()
+    test_transaction_nested()
+    test_migrate_sqlitedict()
+    test_fetch_requests_cached()
@@ -0,0 +1,133 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import sys
+import threading
+import time
+import Queue
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+import fwlog
+
+class SyslogMock:
+    """Collects messages written to syslog. If 'block' event is provided,
+    the first message blocks writer until the event is set.
+    """
+    def __init__(self, block=None):
+        self.messages = []
+        self.block    = block
+        self.blocked  = threading.Event()
+
+    def __call__(self, message):
+        self.messages.append(message)
+        if self.block and not self.blocked.is_set():
+            self.blocked.set()
+            self.block.wait(5)
+
+def _create_log(syslog_mock):
+    log = fwlog.Fwlog(fwlog.Fwlog.FWLOG_LEVEL_DEBUG)
+    log.set_target(to_syslog=True, to_terminal=False)
+    fwlog.syslog.syslog = syslog_mock
+    return log
+
+def _restore_syslog(syslog_func):
+    fwlog.syslog.syslog = syslog_func
+
+######################################################################
+# This Test checks that consecutive identical messages are written
+# once, followed by number of repetitions.
+######################################################################
+def test_coalescing():
+    syslog_func = fwlog.syslog.syslog
+    syslog_mock = SyslogMock()
+    try:
+        log = _create_log(syslog_mock)
+        for _ in range(3):
+            log.info("vpp is not running")
+        log.error("failed to %s", "connect")
+        log.flush()
+        assert syslog_mock.messages == \
+               ["vpp is not running", "last message repeated 2 times", "error: failed to connect"]
+    finally:
+        _restore_syslog(syslog_func)
+
+######################################################################
+# This Test checks that messages are dropped if the queue is full,
+# and that the number of dropped messages is logged.
+######################################################################
+def test_drop_accounting():
+    syslog_func = fwlog.syslog.syslog
+    release     = threading.Event()
+    syslog_mock = SyslogMock(block=release)
+    try:
+        log = _create_log(syslog_mock)
+        log.queue = Queue.Queue(2)
+        log.info("message 1")
+        assert syslog_mock.blocked.wait(5)          # Writer is blocked in the first message
+        for i in range(2, 6):
+            log.info("message %d", i)
+        assert log.dropped == 2
+        release.set()
+        log.flush()
+        assert syslog_mock.messages == \
+               ["message 1", "*** warning: 2 messages were dropped ***", "message 2", "message 3"]
+        assert log.dropped == 0
+    finally:
+        _restore_syslog(syslog_func)
+
+######################################################################
+# This Test checks that identical messages are rate limited, while
+# messages of the same format with different arguments are not.
+######################################################################
+def test_rate_limit():
+    syslog_func = fwlog.syslog.syslog
+    syslog_mock = SyslogMock()
+    try:
+        log = _create_log(syslog_mock)
+        log.RATE_LIMIT_PERIOD = 0.5
+        for i in range(log.RATE_LIMIT + 5):
+            log.debug("FWROUTER_API:_execute: %s(%s)", "exec", i)
+        for _ in range(log.RATE_LIMIT + 5):
+            log.error("tunnel %d is down", 3)
+        log.flush()
+        assert len([m for m in syslog_mock.messages if m.startswith("FWROUTER_API")]) == log.RATE_LIMIT + 5
+        assert syslog_mock.messages[-2:] == \
+               ["error: tunnel 3 is down", "last message repeated %d times" % (log.RATE_LIMIT - 1)]
+
+        time.sleep(0.6)
+        log.error("tunnel %d is down", 3)
+        log.flush()
+        assert syslog_mock.messages[-2:] == \
+               ["*** warning: 5 messages were suppressed, like: error: tunnel 3 is down ***", "error: tunnel 3 is down"]
+        records = list(log.get_records())
+        assert len(records) == 2 * log.RATE_LIMIT + 6
+        assert records[0][1] == 'error'
+    finally:
+        _restore_syslog(syslog_func)
+
+if __name__ == '__main__':
+    test_coalescing()
+    test_drop_accounting()
+    test_rate_limit()
@@ -0,0 +1,90 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import subprocess
+import sys
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+import fwmetrics
+
+######################################################################
+# This Test checks that percentiles are estimated by upper bound
+# of bucket, but do not exceed the maximal sample.
+######################################################################
+def test_histogram_percentiles():
+    hist = fwmetrics.FwHistogram()
+    for ms in [3] * 90 + [40] * 9 + [2500]:
+        hist.add(ms)
+    dump = hist.dump()
+    assert dump['count'] == 100
+    assert dump['avg_ms'] == round((3 * 90 + 40 * 9 + 2500) / 100.0, 3)
+    assert dump['max_ms'] == 2500
+    assert (dump['p50_ms'], dump['p90_ms'], dump['p99_ms']) == (5, 5, 50)
+    assert hist.percentile(100) == 2500
+    assert dump['buckets'] == {'le_5': 90, 'le_50': 9, 'le_5000': 1}
+
+    hist = fwmetrics.FwHistogram()
+    hist.add(0.5)
+    hist.add(70000)
+    assert hist.percentile(50) == 1
+    assert hist.percentile(99) == 70000         # The last bucket is unbounded
+    assert hist.dump()['buckets'] == {'le_1': 1, 'inf': 1}
+    assert fwmetrics.FwHistogram().dump()['p99_ms'] == 0
+
+######################################################################
+# This Test checks that nested requests are measured, and that spawned
+# processes are attributed to the outermost request.
+######################################################################
+def test_requests_and_spawns():
+    fwmetrics.reset()
+    fwmetrics.install_spawn_hooks()
+    with fwmetrics.request('start-router'):
+        with fwmetrics.request('add-interface'):
+            assert fwmetrics.get_request() == 'start-router'
+            subprocess.check_output(['true'])
+        os.system('true')
+        with fwmetrics.timer('commands', 'exec'):
+            pass
+    assert fwmetrics.get_request() is None
+    os.popen('true').read()
+
+    metrics = fwmetrics.get_metrics()
+    assert sorted(metrics['requests'].keys()) == ['add-interface', 'start-router']
+    assert metrics['requests']['start-router']['spawns'] == 2
+    assert metrics['requests']['add-interface']['spawns'] == 0
+    assert metrics['commands']['exec']['count'] == 1
+    assert metrics['spawns'] == 3
+
+    (hists, spawns) = fwmetrics.get_histograms()
+    assert [name for (name, _, _, _) in hists['commands']] == ['exec']
+    assert spawns['start-router'] == 2
+
+    fwmetrics.reset()
+    assert fwmetrics.get_metrics()['requests'] == {}
+    assert fwmetrics.get_metrics()['spawns'] == 0
+
+if __name__ == '__main__':
+    test_histogram_percentiles()
+    test_requests_and_spawns()
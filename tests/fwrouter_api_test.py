@@ -0,0 +1,201 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import types
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+fwglobals.initialize()
+import fwrouter_api
+import fwtranslate_add_tunnel
+import fwutils
+from fwdb_requests import FwDbRequests
+from fwthreadpool import FwThreadPool
+
+TUNNEL = {
+    "src": "8.8.1.1", "dst": "8.8.1.2", "tunnel-id": 1,
+    "ipsec": {
+        "local-sa":  {"spi": 1020, "crypto-alg": "aes-cbc-128", "crypto-key": "1020aa794f574265564551694d653768",
+                      "integr-alg": "sha1-96", "integr-key": "1020ff4b55523947594d6d3547666b45764e6a58"},
+        "remote-sa": {"spi": 2010, "crypto-alg": "aes-cbc-128", "crypto-key": "2010aa794f574265564551694d653768",
+                      "integr-alg": "sha1-96", "integr-key": "2010ff4b55523947594d6d3547666b45764e6a58"}
+    },
+    "loopback-iface": {"addr": "10.100.0.1/31", "mac": "08:00:27:fd:00:02", "mtu": 1420, "routing": "ospf"}
+}
+
+class VppMock:
+    """Emulates VPP API and counts round trips to VPP:
+    every single call and every batch is one round trip.
+    """
+    def __init__(self, fail=None):
+        self.round_trips  = 0
+        self.calls        = []      # Names of VPP API commands in order of execution
+        self.executed     = []      # Names of all commands in order of execution
+        self.params       = []      # (name, params) of VPP API commands in order of execution
+        self.fail         = fail    # Name of VPP API command to fail
+        self.sw_if_index  = 10
+
+    def _call(self, api, params, result):
+        self.calls.append(api)
+        self.params.append((api, copy.deepcopy(params)))
+        self.executed.append(api)
+        if api == self.fail:
+            return {'ok': 0, 'message': api + ' failed'}
+        if result:
+            self.sw_if_index += 1
+            result['cache'][result['key']] = self.sw_if_index
+        return {'ok': 1}
+
+    def call_batch(self, calls):
+        self.round_trips += 1
+        return [self._call(api, params, result) for (api, params, result) in calls]
+
+    def handle_request(self, req, params=None, result=None):
+        if fwglobals.request_handlers.get(req) == '_call_vpp_api':
+            self.round_trips += 1
+            return self._call(req, params, result)
+        self.executed.append((req, params))
+        return {'ok': 1}
+
+def _create_router_api(vpp):
+    router_api = types.InstanceType(fwrouter_api.FWROUTER_API)
+    router_api.vpp_api  = vpp
+    router_api.cmd_pool = FwThreadPool(4, 'test-cmd')
+    return router_api
+
+def _run(vpp, cmd_list, router_api=None):
+    router_api = router_api or _create_router_api(vpp)
+    handle_request = fwglobals.g.handle_request
+    sw_if_index_to_tap = fwutils.vpp_sw_if_index_to_tap
+    fwglobals.g.handle_request = vpp.handle_request
+    fwutils.vpp_sw_if_index_to_tap = lambda sw_if_index: 'tap_%d' % sw_if_index
+    try:
+        if cmd_list is None:
+            router_api._apply_db_tunnels(router_api.db_requests.fetch_keys('add-tunnel'))
+        else:
+            router_api._execute('add-tunnel', 'add-tunnel:1', cmd_list)
+    finally:
+        fwglobals.g.handle_request = handle_request
+        fwutils.vpp_sw_if_index_to_tap = sw_if_index_to_tap
+        router_api.cmd_pool.finalize()
+
+######################################################################
+# This Test checks that VPP API commands of add-tunnel, that declares
+# dependencies between its commands, are sent to VPP in batches.
+######################################################################
+def test_add_tunnel_batches():
+    cmd_list = fwtranslate_add_tunnel.add_tunnel(copy.deepcopy(TUNNEL))
+    assert [t for t in cmd_list if 'depends_on' in t['cmd']]      # Executed concurrently
+    vpp_cmds = [t['cmd']['name'] for t in cmd_list if fwglobals.request_handlers.get(t['cmd']['name']) == '_call_vpp_api']
+
+    vpp = VppMock()
+    _run(vpp, cmd_list)
+    assert sorted(vpp.calls) == sorted(vpp_cmds)
+    assert vpp.round_trips <= len(vpp_cmds) / 3
+    # The tap name was substituted by value returned by create_loopback_instance out of batch
+    execs = [json.dumps(e[1]) for e in vpp.executed if type(e) == tuple and e[0] == 'exec']
+    assert not [e for e in execs if 'DEV-STUB' in e]
+    assert [e for e in execs if 'tap_11' in e]
+
+######################################################################
+# This Test checks that on failure of command in batch the executed
+# commands, including those of batch, are reverted.
+######################################################################
+def test_add_tunnel_batch_failure():
+    for fail in ['sw_interface_set_mtu', 'sw_interface_set_l2_bridge']:
+        cmd_list = fwtranslate_add_tunnel.add_tunnel(copy.deepcopy(TUNNEL))
+        vpp = VppMock(fail=fail)
+        try:
+            _run(vpp, cmd_list)
+            assert False, "failure was not reported"
+        except Exception as e:
+            assert 'failed to' in str(e)
+        executed = vpp.executed[:vpp.executed.index(fail)]
+        reverted = vpp.executed[vpp.executed.index(fail) + 1:]
+        assert 'create_loopback_instance' in executed
+        assert 'delete_loopback' in reverted
+        assert reverted.count('ipsec_sad_add_del_entry') == 2
+        # Revert commands got values returned by commands of batch
+        reverted = vpp.params[[api for (api, _) in vpp.params].index(fail) + 1:]
+        assert not [params for (_, params) in reverted if params and 'substs' in params]
+        deleted = [params for (api, params) in reverted if api == 'delete_loopback']
+        assert len(deleted) == vpp.calls.count('create_loopback_instance')
+        assert not [params for params in deleted if type(params['sw_if_index']) != int]
+
+######################################################################
+# This Test checks that tunnels restored out of DB share lookups and
+# restart FRR once.
+######################################################################
+def test_restore_tunnels():
+    (fd, db_file) = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    os.remove(db_file)
+    try:
+        vpp = VppMock()
+        router_api = _create_router_api(vpp)
+        router_api.db_requests = FwDbRequests(db_file, cache=True)
+        for tunnel_id in range(1, 4):
+            params = copy.deepcopy(TUNNEL)
+            params['tunnel-id'] = tunnel_id
+            params['loopback-iface']['addr'] = '10.100.0.%d/31' % (tunnel_id * 2)
+            router_api.db_requests.add('add-tunnel:%d' % tunnel_id, 'add-tunnel', params, [], False)
+
+        _run(vpp, None, router_api)
+        execs = [e[1][-1] for e in vpp.executed if type(e) == tuple and e[0] == 'exec']
+        assert len([e for e in execs if e.startswith('sudo systemctl restart frr')]) == 1
+        assert execs[-1].startswith('sudo systemctl restart frr')
+        assert vpp.calls.count('vxlan_add_del_tunnel') == 3
+        for tunnel_id in range(1, 4):
+            (_, executed) = router_api.db_requests.fetch_cmd_list('add-tunnel:%d' % tunnel_id)
+            assert executed
+        router_api.db_requests.finalize()
+    finally:
+        os.remove(db_file)
+
+######################################################################
+# This Test checks that lookups are shared by translations of tunnels.
+######################################################################
+def test_shared_lookups():
+    lookups = {}
+    cmd_list_1 = fwtranslate_add_tunnel.add_tunnel(copy.deepcopy(TUNNEL), lookups=lookups)
+    assert ('ip_str_to_bytes', '8.8.1.1') in lookups
+    assert ('_get_sa_algs', 'aes-cbc-128', 'sha1-96') in lookups
+    size = len(lookups)
+    params = copy.deepcopy(TUNNEL)
+    params['tunnel-id'] = 2
+    params['loopback-iface']['addr'] = '10.100.0.4/31'
+    cmd_list_2 = fwtranslate_add_tunnel.add_tunnel(params, lookups=lookups)
+    assert len(lookups) == size + 2     # Only addresses of GRE tunnel endpoints are new
+    vxlan = [t['cmd']['params'] for t in cmd_list_2 if t['cmd']['name'] == 'vxlan_add_del_tunnel'][0]
+    assert fwutils.ip_str_to_bytes('8.8.1.1')[0] == vxlan['src_address']
+
+if __name__ == '__main__':
+    test_add_tunnel_batches()
+    test_add_tunnel_batch_failure()
+    test_restore_tunnels()
+    test_shared_lookups()
@@ -0,0 +1,91 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import sys
+import threading
+import time
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+from fwscheduler import FwScheduler
+
+######################################################################
+# This Test checks that task is run immediately by run_task_now(),
+# and that the next run is scheduled by period from now.
+######################################################################
+def test_run_task_now():
+    scheduler = FwScheduler('test')
+    runs = []
+    ran  = threading.Event()
+    def _task():
+        runs.append(time.time())
+        ran.set()
+    try:
+        scheduler.start()
+        task_id = scheduler.add_task('task', _task, 3600)
+        time.sleep(0.1)
+        assert runs == []
+
+        start = time.time()
+        scheduler.run_task_now(task_id)
+        assert ran.wait(2)
+        assert len(runs) == 1 and runs[0] - start < 1
+        deadline = scheduler.tasks[task_id]['deadline']
+        assert start + 3600 <= deadline < start + 3601
+
+        ran.clear()
+        time.sleep(0.1)
+        assert len(runs) == 1           # Stale heap entry of the original deadline is skipped
+
+        scheduler.remove_task(task_id)
+        scheduler.run_task_now(task_id) # Removed task is ignored
+        assert not ran.wait(0.2)
+    finally:
+        scheduler.finalize()
+
+######################################################################
+# This Test checks that offloaded task, that still runs, is not run
+# again by run_task_now().
+######################################################################
+def test_run_task_now_running():
+    scheduler = FwScheduler('test')
+    release = threading.Event()
+    runs    = []
+    def _task():
+        runs.append(time.time())
+        release.wait(5)
+    try:
+        scheduler.start()
+        task_id = scheduler.add_task('task', _task, 3600, delay=0, offload=True)
+        time.sleep(0.2)
+        scheduler.run_task_now(task_id)
+        time.sleep(0.2)
+        assert len(runs) == 1
+        release.set()
+    finally:
+        scheduler.finalize()
+
+if __name__ == '__main__':
+    test_run_task_now()
+    test_run_task_now_running()
@@ -0,0 +1,142 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import shutil
+import sys
+import tempfile
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+from fwstats_history import FwStatsHistory
+
+def _update(utc, interfaces=[], tunnels=[]):
+    return {
+        'ok': 1, 'running': True, 'period': 30.0, 'utc': utc,
+        'stats':        dict([(i, {'rx_bytes': utc, 'rx_pkts': 1, 'tx_bytes': 2, 'tx_pkts': 3}) for i in interfaces]),
+        'tunnel_stats': dict([(t, {'status': 'up', 'rtt': 10.5, 'drop_rate': 0}) for t in tunnels])
+    }
+
+######################################################################
+# This Test checks that the oldest updates are evicted out of ring
+# and that updates are fetched by sequence number.
+######################################################################
+def test_ring():
+    history = FwStatsHistory(3)
+    for utc in range(1, 6):
+        assert history.append(_update(utc, ['GigabitEthernet0/8/0'], [1])) == utc
+    assert history.last_seq() == 5
+    assert history.get(2) is None                   # Evicted
+    update = history.get(4)
+    assert update['seq'] == 4 and update['utc'] == 4
+    assert update['stats'] == {'GigabitEthernet0/8/0': {'rx_bytes': 4, 'rx_pkts': 1, 'tx_bytes': 2, 'tx_pkts': 3}}
+    assert update['tunnel_stats'] == {1: {'status': 'up', 'rtt': 10.5, 'drop_rate': 0}}
+
+    assert [u['seq'] for u in history.snapshot()] == [3, 4, 5]
+    assert [u['seq'] for u in history.snapshot(4)] == [5]
+    assert [u['seq'] for u in history.snapshot(5)] == []
+    assert [u['seq'] for u in history.snapshot(100)] == [3, 4, 5]    # Cursor ahead of history
+
+    snapshot = history.snapshot(3)
+    history.append(_update(6))
+    history.append(_update(7))
+    assert [u['seq'] for u in snapshot] == [5]      # Updates evicted since snapshot are skipped
+
+######################################################################
+# This Test checks that samples of interfaces and tunnels that are
+# absent in update are not returned and that their arrays are released
+# once they are absent in all updates in ring.
+######################################################################
+def test_absent_names():
+    history = FwStatsHistory(2)
+    history.append(_update(1, tunnels=[1, 2]))
+    history.append(_update(2, tunnels=[1]))
+    assert history.get(2)['tunnel_stats'].keys() == [1]
+    assert sorted(history.sections['tunnel_stats'].keys()) == [1, 2]
+    history.append(_update(3, tunnels=[1]))
+    assert history.sections['tunnel_stats'].keys() == [1]
+    history.append(_update(4, tunnels=[1, 2]))
+    assert sorted(history.get(4)['tunnel_stats'].keys()) == [1, 2]
+
+######################################################################
+# This Test checks that history and state are restored out of file,
+# and that the file is recreated if capacity was changed.
+######################################################################
+def test_file_reattach():
+    tmp_dir  = tempfile.mkdtemp()
+    filename = os.path.join(tmp_dir, 'stats.history')
+    try:
+        history = FwStatsHistory(3, filename)
+        for utc in range(1, 5):
+            history.append(_update(utc, ['GigabitEthernet0/8/0'], [utc]))
+        history.save_state({'vpp_pid': '1234', 'fetched_seq': 2})
+        expected = list(history.snapshot())
+        history.finalize()
+
+        history = FwStatsHistory(3, filename)
+        assert history.last_seq() == 4
+        assert list(history.snapshot()) == expected
+        assert history.load_state() == {'vpp_pid': '1234', 'fetched_seq': 2}
+        assert history.append(_update(5, tunnels=[4])) == 5
+        history.finalize()
+
+        history = FwStatsHistory(4, filename)
+        assert history.last_seq() == 0
+        assert list(history.snapshot()) == []
+        assert history.load_state() is None
+        history.finalize()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+######################################################################
+# This Test checks that the file grows when names or state do not fit,
+# and that slots of released names are reused.
+######################################################################
+def test_file_growth():
+    tmp_dir  = tempfile.mkdtemp()
+    filename = os.path.join(tmp_dir, 'stats.history')
+    try:
+        history = FwStatsHistory(2, filename, max_names=2, state_size=16)
+        history.append(_update(1, tunnels=[1, 2, 3]))
+        history.save_state({'names': ['x' * 20] * 10})
+        assert history.max_names == 4
+        assert history.state_size >= 200
+        history.append(_update(2, tunnels=[1]))
+        history.append(_update(3, tunnels=[1, 4]))     # Tunnels 2 and 3 left the ring
+        assert len(history.slots) == 2
+        assert history.max_names == 4
+        history.finalize()
+
+        history = FwStatsHistory(2, filename, max_names=2, state_size=16)
+        assert history.max_names == 4
+        assert history.load_state() == {'names': ['x' * 20] * 10}
+        assert sorted(history.get(3)['tunnel_stats'].keys()) == [1, 4]
+        history.finalize()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    test_ring()
+    test_absent_names()
+    test_file_reattach()
+    test_file_growth()
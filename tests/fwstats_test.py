@@ -0,0 +1,98 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import sys
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+fwglobals.initialize()
+import fwstats
+import loadsimulator
+loadsimulator.initialize()      # Load simulation is not enabled
+from fwstats_history import FwStatsHistory
+
+def _reset_history(updates):
+    fwstats.history     = FwStatsHistory(10)
+    fwstats.fetched_seq = 0
+    fwstats.names_gen   = 1
+    del fwstats.names_list[:]
+    fwstats.names_index.clear()
+    for update in updates:
+        fwstats.add_update(update)
+
+UPDATES = [
+    {'ok': 1, 'running': True, 'period': 30.0, 'utc': 1000.0,
+     'stats':        {'GigabitEthernet0/8/0': {'rx_bytes': 1500, 'rx_pkts': 10, 'tx_bytes': 3000, 'tx_pkts': 20}},
+     'tunnel_stats': {3: {'status': 'up', 'rtt': 12.5, 'drop_rate': 0}}},
+    {'ok': 1, 'running': True, 'period': 30.0, 'utc': 1030.0,
+     'stats':        {'GigabitEthernet0/8/0': {'rx_bytes': 1500, 'rx_pkts': 10, 'tx_bytes': 2000, 'tx_pkts': 20}},
+     'tunnel_stats': {3: {'status': 'down', 'rtt': 0, 'drop_rate': 100}}}
+]
+
+######################################################################
+# This Test checks that updates are returned once without cursor,
+# and that 'since' cursor returns the unseen updates only.
+######################################################################
+def test_since():
+    _reset_history(UPDATES)
+    assert [u['utc'] for u in fwstats.get_stats()['message']] == [1000.0, 1030.0]
+    dummy = fwstats.get_stats()['message']          # Nothing new, dummy update is returned
+    assert len(dummy) == 1 and dummy[0]['stats'] == {} and dummy[0]['period'] == 0
+
+    assert [u['seq'] for u in fwstats.get_stats({'since': 0})['message']] == [1, 2]
+    assert [u['seq'] for u in fwstats.get_stats({'since': 1})['message']] == [2]
+    assert [u['seq'] for u in fwstats.get_stats({'since': 100})['message']] == [1, 2]
+
+######################################################################
+# This Test checks the compact encoding: interned names, deltas
+# from the previous update and the offset of names known to server.
+######################################################################
+def test_compact():
+    _reset_history(UPDATES)
+    message = fwstats.get_stats({'since': 0, 'encoding': 'compact'})['message']
+    assert message['encoding'] == 'compact'
+    assert message['seq'] == 2
+    assert message['names'] == {'gen': 1, 'offset': 0, 'list': ['GigabitEthernet0/8/0', '3']}
+    assert message['fields'] == {'stats': ['rx_bytes', 'rx_pkts', 'tx_bytes', 'tx_pkts'],
+                                 'tunnel_stats': ['status', 'rtt', 'drop_rate']}
+    (first, second) = message['updates']
+    assert first['utc'] == 1000.0
+    assert first['stats'] == [[0, 1500, 10, 3000, 20]]
+    assert first['tunnel_stats'] == [[1, 1, 12.5, 0]]
+    assert second['utc'] == 30.0
+    assert second['stats'] == [[0, 0, 0, -1000, 0]]
+    assert second['tunnel_stats'] == [[1, -1, -12.5, 100]]
+
+    # Server knows the names table, so names are not sent again
+    message = fwstats.get_stats({'since': 1, 'encoding': 'compact', 'names_gen': 1, 'names_count': 2})['message']
+    assert message['names'] == {'gen': 1, 'offset': 2, 'list': []}
+    assert message['updates'][0]['stats'] == [[0, 1500, 10, 2000, 20]]     # First in reply is absolute
+
+    # Server has names table of other generation, so the whole table is sent
+    message = fwstats.get_stats({'since': 1, 'encoding': 'compact', 'names_gen': 0, 'names_count': 2})['message']
+    assert message['names']['offset'] == 0 and len(message['names']['list']) == 2
+
+if __name__ == '__main__':
+    test_since()
+    test_compact()
@@ -0,0 +1,109 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import sys
+import tempfile
+import time
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+import fwutils
+
+NOW = int(time.time()) - 60
+
+MESSAGES = [    # (seconds ago, message), the oldest first
+    (500, 'excep: vpp crashed'),
+    (400, 'router started'),
+    (300, '*** warning: tunnel 3 is down'),
+    (200, 'error: failed to add route'),
+    (100, 'tunnel 3 is up'),
+]
+
+def _line(ago, message):
+    return '%s host fwagent: %s' % (time.strftime('%b %d %H:%M:%S', time.localtime(NOW - ago)), message)
+
+def _log_file():
+    (fd, log_file) = tempfile.mkstemp(suffix='.log')
+    with os.fdopen(fd, 'w') as f:
+        for (ago, message) in MESSAGES:
+            f.write(_line(ago, message) + '\n')
+    return log_file
+
+######################################################################
+# This Test checks that the log file is read backwards correctly,
+# including lines that cross boundaries of blocks.
+######################################################################
+def test_read_log_records():
+    log_file = _log_file()
+    try:
+        expected = [_line(ago, message) for (ago, message) in reversed(MESSAGES)]
+        for block_size in [7, 64, 65536]:
+            records = list(fwutils._read_log_records(log_file, block_size))
+            assert [line for (_, _, line) in records] == expected
+        assert [lvl for (_, lvl, _) in records] == ['info', 'error', 'warning', 'info', 'excep']
+        assert records[0][0]() == NOW - 100
+    finally:
+        os.remove(log_file)
+
+######################################################################
+# This Test checks filters of get_device_logs, the result is ordered
+# the oldest first.
+######################################################################
+def test_get_device_logs_filters():
+    log_file = _log_file()
+    try:
+        lines = fwutils.get_device_logs(log_file, 2)
+        assert lines == [_line(200, 'error: failed to add route'), _line(100, 'tunnel 3 is up')]
+
+        lines = fwutils.get_device_logs(log_file, 10, level='warning')
+        assert [l.split(': ', 1)[1] for l in lines] == \
+               ['excep: vpp crashed', '*** warning: tunnel 3 is down', 'error: failed to add route']
+
+        lines = fwutils.get_device_logs(log_file, 10, substring='tunnel 3')
+        assert len(lines) == 2
+
+        lines = fwutils.get_device_logs(log_file, 10, since=NOW - 350, until=NOW - 150)
+        assert [l.split(': ', 1)[1] for l in lines] == ['*** warning: tunnel 3 is down', 'error: failed to add route']
+    finally:
+        os.remove(log_file)
+
+######################################################################
+# This Test checks that in-memory records are used if they have enough
+# matching lines, and the file is read otherwise.
+######################################################################
+def test_get_device_logs_records():
+    log_file = _log_file()
+    try:
+        records = [(NOW, 'debug', 'in memory debug'), (NOW - 1, 'error', 'in memory error')]
+        assert fwutils.get_device_logs(log_file, 2, records=records) == ['in memory error', 'in memory debug']
+        assert fwutils.get_device_logs(log_file, 1, level='error', records=records) == ['in memory error']
+        lines = fwutils.get_device_logs(log_file, 3, records=records)
+        assert lines == [_line(ago, message) for (ago, message) in MESSAGES[-3:]]
+    finally:
+        os.remove(log_file)
+
+if __name__ == '__main__':
+    test_read_log_records()
+    test_get_device_logs_filters()
+    test_get_device_logs_records()
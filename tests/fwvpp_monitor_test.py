@@ -0,0 +1,102 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import os
+import shutil
+import sys
+import tempfile
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+from fwvpp_monitor import FwVppMonitor
+
+def _add_process(proc_root, pid, comm, argv, exe=None, state='S', start_time=1000):
+    """Create /proc/<pid> entries that are used by FwVppMonitor.
+    """
+    proc_dir = os.path.join(proc_root, str(pid))
+    if not os.path.exists(proc_dir):
+        os.mkdir(proc_dir)
+    with open(os.path.join(proc_dir, 'comm'), 'w') as f:
+        f.write(comm + '\n')
+    with open(os.path.join(proc_dir, 'cmdline'), 'w') as f:
+        f.write('\0'.join(argv) + '\0' if argv else '')
+    with open(os.path.join(proc_dir, 'stat'), 'w') as f:
+        # The start time is the 22nd field
+        f.write('%d (%s) %s %s %d 0 0\n' % (pid, comm, state, ' '.join(['1'] * 18), start_time))
+    if exe:
+        os.symlink(exe, os.path.join(proc_dir, 'exe'))
+
+######################################################################
+# This Test checks that VPP is found even if its main thread is
+# renamed to 'vpp_main', and that its exit and restart are detected.
+######################################################################
+def test_find_vpp():
+    proc_root = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(proc_root, 'self'))
+        _add_process(proc_root, 10, 'bash', ['/bin/bash'], exe='/bin/bash')
+        _add_process(proc_root, 20, 'kworker/0:1', [])
+        _add_process(proc_root, 30, 'vpp_main', ['/usr/bin/vpp', '-c', '/etc/vpp/startup.conf'])
+
+        monitor = FwVppMonitor(proc_root)
+        states  = []
+        monitor.subscribers.append(states.append)
+        assert monitor.pid() == '30'
+        assert monitor.pid() == '30'
+        assert states == ['30']
+
+        _add_process(proc_root, 30, 'vpp_main', ['/usr/bin/vpp'], state='Z')
+        assert monitor.pid() is None
+        assert states == ['30', None]
+
+        # Pid was reused by other process, VPP is restarted with new pid
+        _add_process(proc_root, 30, 'bash', ['bash'], start_time=2000)
+        _add_process(proc_root, 40, 'vpp_main', ['vpp', '-c', '/etc/vpp/startup.conf'], exe='/usr/bin/vpp (deleted)')
+        assert monitor.pid() == '40'
+        assert states == ['30', None, '40']
+    finally:
+        shutil.rmtree(proc_root)
+
+######################################################################
+# This Test checks that VPP is found by executable or by process name,
+# if command line does not point to VPP.
+######################################################################
+def test_find_vpp_by_exe_and_comm():
+    proc_root = tempfile.mkdtemp()
+    try:
+        _add_process(proc_root, 50, 'vpp_main', ['/bin/sh', '-c', 'vpp'], exe='/usr/bin/vpp')
+        assert FwVppMonitor(proc_root).pid() == '50'
+
+        shutil.rmtree(os.path.join(proc_root, '50'))
+        _add_process(proc_root, 60, 'vpp', [])
+        assert FwVppMonitor(proc_root).pid() == '60'
+
+        shutil.rmtree(os.path.join(proc_root, '60'))
+        _add_process(proc_root, 70, 'vpp_main', ['/usr/bin/vppctl'])
+        assert FwVppMonitor(proc_root).pid() is None
+    finally:
+        shutil.rmtree(proc_root)
+
+if __name__ == '__main__':
+    test_find_vpp()
+    test_find_vpp_by_exe_and_comm()
@@ -0,0 +1,83 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+import fwutils
+import vpp_api
+
+class VppMock:
+    """Emulates vpp_papi.VPP and counts connects."""
+    def __init__(self, jsonfiles):
+        self.connects = 0
+    def connect(self, name):
+        self.connects += 1
+    def disconnect(self):
+        pass
+
+def _connect(vpp_runs, ready_paths, timeout):
+    api_dir = tempfile.mkdtemp()
+    open(os.path.join(api_dir, 'vpe.api.json'), 'w').close()
+    saved = (vpp_api.VPP, vpp_api.vppWrapper, vpp_api.VPP_API_READY_PATHS, fwutils.vpp_does_run)
+    vpp_api.VPP                 = VppMock
+    vpp_api.vppWrapper          = False
+    vpp_api.VPP_API_READY_PATHS = ready_paths
+    fwutils.vpp_does_run        = lambda: vpp_runs
+    api = vpp_api.VPP_API()
+    try:
+        return (api, api.connect(vpp_json_dir=api_dir, timeout=timeout))
+    finally:
+        (vpp_api.VPP, vpp_api.vppWrapper, vpp_api.VPP_API_READY_PATHS, fwutils.vpp_does_run) = saved
+        shutil.rmtree(api_dir)
+
+######################################################################
+# This Test checks that connect reports timeout clearly and doesn't
+# try to connect, if VPP API was not ready until timeout expired.
+######################################################################
+def test_connect_api_not_ready():
+    for vpp_runs in [False, True]:
+        try:
+            _connect(vpp_runs, ['/nonexistent/vpe-api'], 0.3)
+            assert False, "timeout was not reported"
+        except Exception as e:
+            assert 'VPP API is not ready' in str(e)
+
+######################################################################
+# This Test checks that connect succeeds once VPP API is ready.
+######################################################################
+def test_connect_api_ready():
+    (fd, ready_path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        (api, connected) = _connect(True, [ready_path], 0.3)
+        assert connected and api.is_connected()
+        assert api.vpp.connects == 1
+    finally:
+        os.remove(ready_path)
+
+if __name__ == '__main__':
+    test_connect_api_not_ready()
+    test_connect_api_ready()
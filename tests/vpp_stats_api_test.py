@@ -0,0 +1,92 @@
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import glob
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+code_root = os.path.realpath(__file__).replace('\\','/').split('/tests/')[0]
+sys.path.append(code_root)
+import fwglobals
+fwglobals.initialize()
+import vpp_stats_dummy
+from vpp_stats_api import VPP_STATS_API
+
+COUNTERS = {
+    "/if/names":    [ "local0", "GigabitEthernet0/8/0", "loop0" ],
+    "/if/rx":       [ [ {"packets": 0, "bytes": 0}, {"packets": 10, "bytes": 1000}, {"packets": 1, "bytes": 100} ],
+                      [ {"packets": 0, "bytes": 0}, {"packets": 5,  "bytes": 500},  {"packets": 0, "bytes": 0} ] ],
+    "/if/tx":       [ [ {"packets": 0, "bytes": 0}, {"packets": 7,  "bytes": 700},  {"packets": 2, "bytes": 200} ] ],
+    "/if/drops":    [ [ 0, 3, 0 ], [ 0, 1, 0 ] ],
+    "/if/rx-error": [ [ 0, 0, 0 ] ],
+    "/if/tx-error": [ [ 0, 2, 0 ] ]
+}
+
+def _create_segment(counters):
+    tmp_dir   = tempfile.mkdtemp()
+    sock_path = os.path.join(tmp_dir, 'stats.sock')
+    open(sock_path, 'w').close()
+    if counters is not None:
+        with open(sock_path + '.json', 'w') as f:
+            json.dump(counters, f)
+    return (tmp_dir, sock_path)
+
+######################################################################
+# This Test checks that counters of all interfaces are fetched
+# and summed over threads.
+######################################################################
+def test_get_if_counters():
+    (tmp_dir, sock_path) = _create_segment(COUNTERS)
+    try:
+        stats_api = VPP_STATS_API(sock_path)
+        res = stats_api.get_if_counters()
+        assert sorted(res.keys()) == ['GigabitEthernet0/8/0', 'local0', 'loop0']
+        assert res['GigabitEthernet0/8/0'] == {'rx_pkts': 15, 'rx_bytes': 1500, 'tx_pkts': 7, 'tx_bytes': 700,
+                                                'drops': 4, 'rx_errors': 0, 'tx_errors': 2}
+        assert res['loop0']['tx_bytes'] == 200
+        stats_api.finalize()
+        assert stats_api.stats is None
+    finally:
+        shutil.rmtree(tmp_dir)
+
+######################################################################
+# This Test checks that the segment is unmapped if connect fails.
+######################################################################
+def test_connect_failure_disconnects():
+    (tmp_dir, sock_path) = _create_segment(None)    # No segment data, so connect() fails
+    disconnected = []
+    disconnect = vpp_stats_dummy.VPPStats.disconnect
+    vpp_stats_dummy.VPPStats.disconnect = lambda self: disconnected.append(self)
+    try:
+        stats_api = VPP_STATS_API(sock_path)
+        assert stats_api.get_if_counters() is None
+        assert stats_api.stats is None
+        assert len(disconnected) == 1
+    finally:
+        vpp_stats_dummy.VPPStats.disconnect = disconnect
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    test_get_if_counters()
+    test_connect_failure_disconnects()
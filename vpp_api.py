@@ -22,10 +22,13 @@
 
 import os
 import fnmatch
+import threading
 import fwglobals
 import fwutils
 import time
 
+from fwif_cache import FwIfCache
+
 try:
     from vpp_papi import VPP
     vppWrapper = False
@@ -34,6 +37,13 @@ except:
     from vpp_papi_dummy import VPP
     vppWrapper = True
 
+# Shared memory segment and socket, any of which VPP creates when its API is ready
+VPP_API_READY_PATHS = ['/dev/shm/vpe-api', '/run/vpp/api.sock']
+
+# Maximal number of requests sent by call_batch() to VPP without waiting for
+# replies. It should not exceed the length of the reply queue of client.
+BATCH_WINDOW = 16
+
 class VPP_API:
     """This is VPP API class representation.
     """
@@ -41,6 +51,11 @@ class VPP_API:
         """Constructor method
         """
         self.connected = False
+        self.lock      = threading.RLock()  # vpp_papi is not thread safe
+        self.vpp       = None
+        self.vpp_fingerprint = None         # Fingerprint of API files self.vpp was created from
+        self.msg_ids   = None               # API name -> message id, valid for current connection
+        self.if_cache  = FwIfCache(self)
         if fwutils.vpp_does_run():
             if self.connect():
                 self.connected = True
@@ -53,15 +68,21 @@ class VPP_API:
         if self.connected:
             self.disconnect()
 
-    def connect(self, vpp_json_dir='/usr/share/vpp/api/'):
+    def connect(self, vpp_json_dir='/usr/share/vpp/api/', timeout=30):
         """Connect to VPP.
+        The API description files are parsed only if they were changed since
+        the previous connect, otherwise the parsed API is reused, so reconnect
+        after VPP restart is cheap. The connect is retried as soon as VPP API
+        is ready to accept connections, until the timeout expires.
 
         :param vpp_json_dir:         Path to json files with API description.
+        :param timeout:              Time to wait for VPP API to be ready in seconds.
 
         :returns: 'True' if connected and 'False' otherwise.
         """
         if self.connected:
             return True
+        self.if_cache.clear()
         fwglobals.log.debug("VPP_API.connect: loading VPP API files")
         self.jsonfiles = []
         for root, _, filenames in os.walk(vpp_json_dir):
@@ -69,20 +90,29 @@ class VPP_API:
                 self.jsonfiles.append(os.path.join(root, filename))
         if not self.jsonfiles and not vppWrapper:
             fwglobals.log.error("VPP_API.connect: no vpp api files were found")
-            return False 
+            return False
+        fingerprint = self._get_api_fingerprint(self.jsonfiles)
+        if self.vpp is None or fingerprint != self.vpp_fingerprint:
+            self.vpp = VPP(self.jsonfiles)
+            self.vpp_fingerprint = fingerprint
+        else:
+            fwglobals.log.debug("VPP_API.connect: API files were not changed, reuse parsed API")
+
         fwglobals.log.debug("VPP_API.connect: connecting to VPP")
-        self.vpp = VPP(self.jsonfiles)
-        num_retries = 3
-        for i in range(num_retries):
+        deadline = time.time() + timeout
+        delay    = 0.1
+        while True:
+            if not self._wait_for_vpp_api(deadline):
+                raise Exception("VPP_API.connect: VPP API is not ready in %d seconds" % timeout)
             try:
-                fwglobals.log.debug("Trying to connect vpp, num " + str(i))
                 self.vpp.connect('fwagent')
                 break
             except Exception as e:
-                if i == num_retries-1:
+                if time.time() >= deadline:
                     raise e
-                else:
-                    time.sleep(10)
+                fwglobals.log.debug("VPP_API.connect: failed to connect (%s), retry in %.1f seconds" % (str(e), delay))
+                time.sleep(delay)
+                delay = min(delay * 2, 2)
         self.connected = True
         fwglobals.log.debug("VPP_API.connect: connected to VPP")
 
@@ -99,6 +129,37 @@ class VPP_API:
 
         return True
 
+    def _get_api_fingerprint(self, jsonfiles):
+        """Get fingerprint of API description files, that changes
+        if any file is added, removed or modified.
+
+        :param jsonfiles:   List of API description files.
+
+        :returns: Sorted list of (path, modification time, size) tuples.
+        """
+        fingerprint = []
+        for path in jsonfiles:
+            st = os.stat(path)
+            fingerprint.append((path, st.st_mtime, st.st_size))
+        return sorted(fingerprint)
+
+    def _wait_for_vpp_api(self, deadline):
+        """Wait until VPP API is ready to accept connections, i.e. until VPP
+        runs and created its API shared memory segment or socket.
+
+        :param deadline:    Time to stop waiting at.
+
+        :returns: 'True' if API is ready, 'False' on timeout.
+        """
+        if vppWrapper:
+            return True
+        while True:
+            if fwutils.vpp_does_run() and [p for p in VPP_API_READY_PATHS if os.path.exists(p)]:
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+
     def disconnect(self):
         """Disconnect from VPP.
 
@@ -107,6 +168,8 @@ class VPP_API:
         if self.connected: 
             self.vpp.disconnect()
             self.connected = False
+            self.msg_ids   = None
+            self.if_cache.clear()
             fwglobals.log.debug("VPP_API.disconnect: disconnected from VPP")
         else:
             fwglobals.log.debug("VPP_API.disconnect: not connected")
@@ -143,14 +206,105 @@ class VPP_API:
         api_func = getattr(self.vpp.api, api)
         assert api_func, 'vpp_api: api=%s not found' % (api)
 
-        rv = api_func(**params) if params else api_func()
+        with self.lock:
+            rv = api_func(**params) if params else api_func()
+        return self._handle_reply(api, params, result, rv)
+
+    def call_batch(self, calls):
+        """Call VPP commands in pipeline.
+        Up to BATCH_WINDOW requests are sent to VPP back to back, each with its
+        own context, and the replies are matched to requests by context, so
+        the batch does not wait for round trip per request. All commands of
+        batch are sent, even if some of them fail, so the caller should
+        check every reply. If the vpp_papi does not support asynchronous
+        calls, the commands are called one by one.
+
+        :param calls:          List of (api, params, result) tuples,
+                               see call_simple() for details.
+
+        :returns: List of replies in order of calls.
+        """
+        if not self.connected:
+            return [{'message':"vpp doesn't run", 'ok':0} for _ in calls]
+
+        with self.lock:
+            if self._is_pipeline_supported():
+                rvs = self._call_pipelined(calls)
+            else:
+                rvs = []
+                for (api, params, _) in calls:
+                    api_func = getattr(self.vpp.api, api)
+                    rvs.append(api_func(**params) if params else api_func())
+        return [self._handle_reply(api, params, result, rv) for ((api, params, result), rv) in zip(calls, rvs)]
+
+    def _is_pipeline_supported(self):
+        if vppWrapper:
+            return False
+        for attr in ['_call_vpp_async', 'get_context', 'decode_incoming_msg', 'id_names', 'messages', 'transport']:
+            if not hasattr(self.vpp, attr):
+                return False
+        return True
+
+    def _call_pipelined(self, calls):
+        """Send requests to VPP asynchronously and collect replies.
+        The reader thread of vpp_papi is suspended meanwhile, so replies
+        are read by this thread. Messages that are not replies to the
+        batch, e.g. events, are queued for vpp_papi as it does itself.
+
+        :param calls:          List of (api, params, result) tuples.
+
+        :returns: List of reply objects in order of calls.
+        """
+        vpp = self.vpp
+        if self.msg_ids is None:
+            self.msg_ids = dict([(name, i) for (i, name) in enumerate(vpp.id_names) if name])
+
+        rvs      = [None] * len(calls)
+        pending  = {}       # Context -> index of call
+        next_idx = 0
+        vpp.transport.suspend()
+        try:
+            while next_idx < len(calls) or pending:
+                while next_idx < len(calls) and len(pending) < BATCH_WINDOW:
+                    (api, params, _) = calls[next_idx]
+                    context = vpp.get_context()
+                    kwargs  = dict(params) if params else {}
+                    kwargs['context'] = context
+                    vpp._call_vpp_async(self.msg_ids[api], vpp.messages[api], **kwargs)
+                    pending[context] = next_idx
+                    next_idx += 1
+                msg = vpp.transport.read()
+                if not msg:
+                    raise Exception("VPP_API.call_batch: read failed")
+                r = vpp.decode_incoming_msg(msg)
+                idx = pending.pop(getattr(r, 'context', None), None)
+                if idx is None:
+                    vpp.message_queue.put_nowait(r)
+                    continue
+                rvs[idx] = r
+        finally:
+            vpp.transport.resume()
+        return rvs
+
+    def _handle_reply(self, api, params, result, rv):
+        """Convert object returned by VPP into reply and store the requested
+        attribute of it in cache.
+
+        :param api:            API name.
+        :param params:         Parameters.
+        :param result:         Cache to store results.
+        :param rv:             Object returned by VPP.
+
+        :returns: Reply message.
+        """
         if rv and rv.retval == 0:
             if result:      # If asked to store some attribute of the returned object in cache
                 res = getattr(rv, result['result_attr'])
                 result['cache'][result['key']] = res
+            self.if_cache.update(api, params, rv)
             reply = {'ok':1}
         else:
-            fwglobals.log.error('vpp_api: rv=%s: %s(%s)' % (rv.retval, api, format(params)))
+            fwglobals.log.error('vpp_api: rv=%s: %s(%s)' % (rv.retval if rv else None, api, format(params)))
             reply = {'message':api + ' failed', 'ok':0}
         return reply
 
@@ -164,7 +318,8 @@ class VPP_API:
         if not self.connected: 
             fwglobals.log.excep("VPP_API.cli: not connected to VPP")
             return None
-        res = self.vpp.api.cli_inband(cmd=cmd)
+        with self.lock:
+            res = self.vpp.api.cli_inband(cmd=cmd)
         if res is None:
             return None
         return res.reply
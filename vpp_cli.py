@@ -0,0 +1,247 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import socket
+import sys
+import threading
+
+import fwglobals
+
+# Telnet protocol bytes used by the VPP CLI server, see RFC 854.
+TELNET_IAC   = 255
+TELNET_DONT  = 254
+TELNET_DO    = 253
+TELNET_WONT  = 252
+TELNET_WILL  = 251
+TELNET_SB    = 250
+TELNET_SE    = 240
+
+TELOPT_ECHO  = 1
+TELOPT_SGA   = 3
+TELOPT_TTYPE = 24
+TELOPT_NAWS  = 31
+
+TTYPE_IS     = 0
+TTYPE_SEND   = 1
+
+class VPP_CLI:
+    """This is VPP CLI class representation.
+    It keeps one session to the VPP CLI socket open and runs CLI commands
+    over it, so reading VPP CLI output does not spawn 'sudo vppctl' process
+    per command. The session is reopened on failure, e.g. when VPP restarts.
+    Concurrent callers are serialized, as the session can run one command at a time.
+
+    :param sock_path: Path to VPP CLI socket.
+    :param prompt:    VPP CLI prompt that terminates output of command.
+    :param timeout:   Timeout in seconds to wait for output of command.
+    """
+    def __init__(self, sock_path='/run/vpp/cli.sock', prompt='vpp# ', timeout=10):
+        """Constructor method
+        """
+        self.sock_path = sock_path
+        self.prompt    = prompt.encode()
+        self.timeout   = timeout
+        self.sock      = None
+        self.lock      = threading.Lock()
+
+    def finalize(self):
+        """Destructor method
+        """
+        self.disconnect()
+
+    def connect(self):
+        """Open session to VPP CLI socket.
+        Reads and drops the VPP banner up to the first prompt.
+
+        :returns: 'True' if connected and 'False' otherwise.
+        """
+        if self.sock:
+            return True
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.sock_path)
+            self.leftover = bytearray()
+            self._read_until_prompt()
+        except Exception as e:
+            fwglobals.log.debug("VPP_CLI.connect: failed to connect to %s: %s" % (self.sock_path, str(e)))
+            self._close()
+            return False
+        fwglobals.log.debug("VPP_CLI.connect: connected to %s" % self.sock_path)
+        return self.sock is not None
+
+    def disconnect(self):
+        """Close session to VPP CLI socket.
+
+        :returns: None.
+        """
+        with self.lock:
+            self._close()
+
+    def is_connected(self):
+        """Check if session to VPP CLI is open.
+
+        :returns: 'True' if connected and 'False' otherwise.
+        """
+        return self.sock is not None
+
+    def cli(self, cmd):
+        """Execute command in VPP CLI.
+        If the session is broken, e.g. VPP was restarted, the session is reopened
+        and the command is executed once again.
+
+        :param cmd:            VPP CLI command.
+
+        :returns: Output of the command or None on failure.
+        """
+        with self.lock:
+            for _ in range(2):
+                if not self.connect():
+                    return None
+                try:
+                    self.sock.sendall(cmd.encode() + b'\n')
+                    return self._strip_echo(cmd, self._read_until_prompt())
+                except Exception as e:
+                    fwglobals.log.debug("VPP_CLI.cli(%s): %s, reconnecting" % (cmd, str(e)))
+                    self._close()
+            return None
+
+    def _close(self):
+        """Close socket without lock.
+        """
+        if self.sock:
+            try:
+                self.sock.close()
+            except:
+                pass
+            self.sock = None
+
+    def _read_until_prompt(self):
+        """Read output from VPP CLI until prompt is received.
+        If VPP closes the session after command, e.g. VPP treats session
+        as non-interactive, the output received so far is returned
+        and the session is closed, so it will be reopened on next command.
+
+        :returns: Output without the trailing prompt.
+        """
+        output = bytearray()
+        while not output.endswith(self.prompt):
+            data = self.sock.recv(4096)
+            if not data:
+                if not output:
+                    raise Exception("connection closed by VPP")
+                self._close()
+                break
+            output += self._parse_telnet(bytearray(data))
+        if output.endswith(self.prompt):
+            output = output[:-len(self.prompt)]
+        return self._to_str(output)
+
+    def _parse_telnet(self, data):
+        """Strip telnet commands out of data received from VPP and reply to
+        option negotiation. The session asks for terminal without ANSI
+        escape sequences and for window high enough to disable VPP pager.
+
+        :param data:   Bytes received from socket.
+
+        :returns: Data without telnet commands.
+        """
+        data = self.leftover + data
+        self.leftover = bytearray()
+        output = bytearray()
+        reply  = bytearray()
+        i = 0
+        while i < len(data):
+            if data[i] != TELNET_IAC:
+                output.append(data[i])
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                break
+            cmd = data[i+1]
+            if cmd == TELNET_IAC:               # Escaped 255
+                output.append(TELNET_IAC)
+                i += 2
+            elif cmd in (TELNET_DO, TELNET_DONT, TELNET_WILL, TELNET_WONT):
+                if i + 2 >= len(data):
+                    break
+                reply += self._negotiate(cmd, data[i+2])
+                i += 3
+            elif cmd == TELNET_SB:
+                end = data.find(bytearray([TELNET_IAC, TELNET_SE]), i)
+                if end < 0:
+                    break
+                if data[i+2:i+4] == bytearray([TELOPT_TTYPE, TTYPE_SEND]):
+                    reply += bytearray([TELNET_IAC, TELNET_SB, TELOPT_TTYPE, TTYPE_IS]) + \
+                             bytearray(b'dumb') + bytearray([TELNET_IAC, TELNET_SE])
+                i = end + 2
+            else:
+                i += 2
+        self.leftover = data[i:]
+        if reply:
+            self.sock.sendall(bytes(reply))
+        return output
+
+    def _negotiate(self, cmd, option):
+        """Build reply on telnet option negotiation.
+
+        :param cmd:     Telnet DO/DONT/WILL/WONT command.
+        :param option:  Telnet option.
+
+        :returns: Reply bytes.
+        """
+        if cmd == TELNET_DO:
+            if option == TELOPT_TTYPE:
+                return bytearray([TELNET_IAC, TELNET_WILL, option])
+            if option == TELOPT_NAWS:   # width=1000, height=30000
+                return bytearray([TELNET_IAC, TELNET_WILL, option,
+                                  TELNET_IAC, TELNET_SB, option, 0x03, 0xe8, 0x75, 0x30,
+                                  TELNET_IAC, TELNET_SE])
+            return bytearray([TELNET_IAC, TELNET_WONT, option])
+        if cmd == TELNET_WILL:
+            if option in (TELOPT_ECHO, TELOPT_SGA):
+                return bytearray([TELNET_IAC, TELNET_DO, option])
+            return bytearray([TELNET_IAC, TELNET_DONT, option])
+        return bytearray()
+
+    def _strip_echo(self, cmd, output):
+        """Remove echo of command that VPP sends back in interactive session.
+
+        :param cmd:     VPP CLI command.
+        :param output:  Output of command.
+
+        :returns: Output without echo.
+        """
+        if output.startswith(cmd):
+            output = output[len(cmd):]
+            if output.startswith('\r\n'):
+                output = output[2:]
+            elif output.startswith('\n'):
+                output = output[1:]
+        return output
+
+    def _to_str(self, data):
+        """Convert received bytes into string of current python version.
+        """
+        if sys.version_info[0] < 3:
+            return str(data)
+        return bytes(data).decode('utf-8', 'replace')
@@ -0,0 +1,173 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import os
+import threading
+
+import fwglobals
+import fwutils
+
+try:
+    from vpp_papi.vpp_stats import VPPStats
+except:
+    fwglobals.log.warning("vpp_papi stats library not found, using VPP stats dummy wrapper. Only for testing!!!")
+    from vpp_stats_dummy import VPPStats
+
+# Counters of the statistics segment to be fetched per interface:
+#   <segment counter> : <field of result>, <counter field>
+IF_COUNTERS = {
+    '/if/rx':       [('rx_pkts', 'packets'), ('rx_bytes', 'bytes')],
+    '/if/tx':       [('tx_pkts', 'packets'), ('tx_bytes', 'bytes')],
+    '/if/drops':    [('drops', None)],
+    '/if/rx-error': [('rx_errors', None)],
+    '/if/tx-error': [('tx_errors', None)],
+}
+
+class VPP_STATS_API:
+    """This is VPP statistics segment API class representation.
+    VPP exposes its counters in shared memory segment, that can be mapped
+    by other processes using the stats socket. The class maps the segment
+    read-only and fetches counters of all interfaces in one pass over
+    the segment, so it neither disturbs VPP nor spawns 'vppctl' processes.
+    The segment is mapped again on VPP restart.
+
+    :param sock_path: Path to VPP stats socket.
+    """
+    def __init__(self, sock_path='/run/vpp/stats.sock'):
+        """Constructor method
+        """
+        self.sock_path = sock_path
+        self.stats     = None
+        self.vpp_pid   = None
+        self.lock      = threading.Lock()
+
+    def finalize(self):
+        """Destructor method
+        """
+        self.disconnect()
+
+    def connect(self):
+        """Map VPP statistics segment.
+
+        :returns: 'True' if connected and 'False' otherwise.
+        """
+        if self.stats:
+            return True
+        if not os.path.exists(self.sock_path):
+            return False
+        stats = None
+        try:
+            pid = fwutils.vpp_pid()
+            self.vpp_pid = pid.split()[0] if pid else None
+            # vpp_papi 19.x maps the segment in constructor, newer versions - on connect()
+            stats = VPPStats(socketname=self.sock_path)
+            if hasattr(stats, 'connect'):
+                stats.connect()
+            self.stats = stats
+        except Exception as e:
+            fwglobals.log.debug("VPP_STATS_API.connect: failed to connect to %s: %s" % (self.sock_path, str(e)))
+            if stats:
+                try:
+                    stats.disconnect()      # Unmap segment mapped by constructor
+                except:
+                    pass
+            self.stats = None
+            return False
+        fwglobals.log.debug("VPP_STATS_API.connect: connected to %s" % self.sock_path)
+        return True
+
+    def disconnect(self):
+        """Unmap VPP statistics segment.
+
+        :returns: None.
+        """
+        with self.lock:
+            self._close()
+
+    def get_if_counters(self):
+        """Get counters of VPP interfaces.
+
+        :returns: Dictionary of counters by VPP interface name, e.g.
+                  { 'GigabitEthernet0/8/0': { 'rx_pkts':.., 'tx_pkts':.., 'rx_bytes':.., 'tx_bytes':..,
+                                              'drops':.., 'rx_errors':.., 'tx_errors':.. } }
+                  or None on failure.
+        """
+        with self.lock:
+            # If VPP was restarted, the mapped segment is not updated anymore
+            if self.vpp_pid and not os.path.exists('/proc/%s' % self.vpp_pid):
+                self._close()
+            for _ in range(2):
+                if not self.connect():
+                    return None
+                try:
+                    return self._dump_if_counters()
+                except Exception as e:
+                    fwglobals.log.debug("VPP_STATS_API.get_if_counters: %s, reconnecting" % str(e))
+                    self._close()
+            return None
+
+    def _close(self):
+        """Unmap segment without lock.
+        """
+        if self.stats:
+            try:
+                self.stats.disconnect()
+            except:
+                pass
+            self.stats   = None
+            self.vpp_pid = None
+
+    def _dump_if_counters(self):
+        """Fetch interface counters out of the statistics segment.
+        The counters are kept by VPP per worker thread, so they are summed.
+        """
+        counters = self.stats.dump(self.stats.ls(['^/if/']))
+
+        names = counters.get('/if/names')
+        if names is None:   # Older VPP-s do not export names of interfaces
+            if_cache = fwglobals.g.router_api.vpp_api.if_cache
+            num_ifs  = max([0] + [len(per_thread) for c in IF_COUNTERS for per_thread in counters.get(c, [])])
+            names    = [if_cache.vpp_sw_if_index_to_name(i) for i in range(num_ifs)]
+
+        res = {}
+        for (sw_if_index, name) in enumerate(names):
+            if name:
+                res[name.rstrip(' \t\r\n\0')] = dict([(f, 0L) for c in IF_COUNTERS for (f, _) in IF_COUNTERS[c]])
+        for (c, fields) in IF_COUNTERS.items():
+            for per_thread in counters.get(c, []):
+                for (sw_if_index, val) in enumerate(per_thread):
+                    if sw_if_index >= len(names) or not names[sw_if_index]:
+                        continue
+                    if_res = res[names[sw_if_index].rstrip(' \t\r\n\0')]
+                    for (f, attr) in fields:
+                        if_res[f] += long(self._get_value(val, attr))
+        return res
+
+    def _get_value(self, val, attr):
+        """Get value of counter. The simple counter is a number,
+        the combined counter has packets and bytes.
+        """
+        if attr is None:
+            return val
+        if type(val) == dict:
+            return val[attr]
+        return getattr(val, attr)
@@ -0,0 +1,81 @@
+#! /usr/bin/python
+
+################################################################################
+# flexiWAN SD-WAN software - flexiEdge, flexiManage.
+# For more information go to https://flexiwan.com
+#
+# Copyright (C) 2019  flexiWAN Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+################################################################################
+
+import json
+import mmap
+import os
+import re
+
+import fwglobals
+
+class VPPStats:
+    """This is Dummy VPP statistics segment class representation.
+    The statistics are read out of JSON file that is mapped read-only,
+    like the VPP statistics segment is. The file name is the name of stats
+    socket with '.json' suffix. The file content looks like:
+
+        {
+            "/if/names": [ "local0", "GigabitEthernet0/8/0" ],
+            "/if/rx":    [ [ {"packets": 0, "bytes": 0}, {"packets": 10, "bytes": 1000} ] ],
+            "/if/drops": [ [ 0, 1 ] ]
+        }
+
+    where every counter is list of per thread lists of per interface values.
+    The file might be rewritten by test to simulate traffic.
+    """
+    def __init__(self, socketname='/run/vpp/stats.sock', timeout=10):
+        """Constructor method
+        """
+        self.filename = socketname + '.json'
+        fwglobals.log.debug("VPPStats Init: " + self.filename)
+
+    def connect(self):
+        """Connect to dummy statistics segment.
+        """
+        if not os.path.exists(self.filename):
+            raise Exception("%s not found" % self.filename)
+        fwglobals.log.debug("VPPStats Connect: " + self.filename)
+
+    def disconnect(self):
+        """Disconnect from dummy statistics segment.
+        """
+        fwglobals.log.debug("VPPStats Disconnect")
+
+    def ls(self, patterns):
+        """Get names of counters that match any of patterns.
+        """
+        regexes = [re.compile(p) for p in patterns]
+        return [name for name in self._load() if [r for r in regexes if r.match(name)]]
+
+    def dump(self, counters):
+        """Get values of counters.
+        """
+        data = self._load()
+        return dict([(name, data[name]) for name in counters if name in data])
+
+    def _load(self):
+        with open(self.filename, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return json.loads(m[:])
+            finally:
+                m.close()